@@ -0,0 +1,62 @@
+"""
+Benchmark do índice BM25: tempo de construção e latência da busca (p50/p99) em um corpus sintético,
+com frequências de palavras seguindo uma distribuição de Zipf (como em texto real).
+
+Uso:
+    python -m benchmarks.bm25_search --chunks 1000000 --words-per-chunk 60 --queries 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.bm25_index import BM25Index
+
+
+def make_corpus(n_chunks, words_per_chunk, vocabulary_size, seed):
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f"termo{i}" for i in range(vocabulary_size)])
+    word_ids = np.minimum(rng.zipf(1.2, size=(n_chunks, words_per_chunk)) - 1, vocabulary_size - 1)
+    return vocabulary, [" ".join(vocabulary[row]) for row in word_ids]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000000)
+    parser.add_argument("--words-per-chunk", type=int, default=60)
+    parser.add_argument("--vocabulary", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--query-words", type=int, default=4)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    vocabulary, texts = make_corpus(args.chunks, args.words_per_chunk, args.vocabulary, args.seed)
+    print(f"Corpus sintético: {args.chunks} chunks em {time.perf_counter() - start:.1f}s")
+
+    index = BM25Index()
+    start = time.perf_counter()
+    index.add([str(i) for i in range(len(texts))], texts)
+    add_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index.build()
+    print(f"Indexação: add {add_s:.1f}s, build {time.perf_counter() - start:.1f}s")
+
+    # Consultas misturam termos raros e comuns, amostrados uniformemente do vocabulário
+    rng = np.random.default_rng(args.seed + 1)
+    queries = [" ".join(vocabulary[rng.integers(0, args.vocabulary, size=args.query_words)])
+               for _ in range(args.queries)]
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, top_k=args.top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"Busca ({args.query_words} termos, top_k={args.top_k}): p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark do Chunker em um texto grande (100 MB por padrão): vazão (MB/s), número de chunks e pico de memória
+de cada método, lendo o arquivo em fluxo (linha a linha) com Chunker.iter_chunks. Os métodos 'sentences' e
+'paragraphs' também são medidos com a implementação anterior (texto inteiro em memória e concatenação com +=).
+
+Cada medição roda em um processo novo, para que o pico de memória seja medido de forma independente.
+
+Uso:
+    python -m benchmarks.chunker_throughput --size-mb 100 --chunk-size 500 --overlap 100
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+WORDS = ("o relevo brasileiro apresenta planaltos planícies e depressões formados por processos de erosão "
+         "sedimentação e movimentos tectônicos ao longo de milhões de anos em diferentes regiões do país").split()
+
+
+def make_text_file(path, size_mb, seed=0):
+    """
+    Escreve um texto sintético de size_mb megabytes, com sentenças e parágrafos de tamanhos variados.
+    """
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        while written < target:
+            sentences = []
+            for _ in range(rng.randint(2, 8)):
+                words = rng.choices(WORDS, k=rng.randint(6, 30))
+                sentences.append(" ".join(words).capitalize() + ".")
+            paragraph = " ".join(sentences) + "\n\n"
+            file.write(paragraph)
+            written += len(paragraph.encode('utf-8'))
+
+
+def legacy_chunks(text, method, chunk_size):
+    """
+    Reprodução do Chunker anterior para 'sentences' e 'paragraphs'.
+    """
+    if method == 'sentences':
+        from nltk.tokenize import sent_tokenize
+        from src.chunker import ensure_punkt
+        ensure_punkt()
+        units, separator = sent_tokenize(text), " "
+    else:
+        units, separator = text.split("\n\n"), "\n\n"
+    chunks = []
+    current_chunk = ""
+    for unit in units:
+        if len(current_chunk) + len(unit) <= chunk_size:
+            current_chunk += unit + separator
+        else:
+            chunks.append(current_chunk.strip())
+            current_chunk = unit + separator
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def run(path, method, chunk_size, overlap, legacy):
+    from src.chunker import Chunker
+
+    start = time.perf_counter()
+    if legacy:
+        with open(path, 'r', encoding='utf-8') as file:
+            n_chunks = len(legacy_chunks(file.read(), method, chunk_size))
+    else:
+        chunker = Chunker(method=method, chunk_size=chunk_size, overlap=overlap)
+        with open(path, 'r', encoding='utf-8') as file:
+            n_chunks = sum(1 for _ in chunker.iter_chunks(file))
+    elapsed = time.perf_counter() - start
+    return {
+        'seconds': elapsed,
+        'mb_per_s': os.path.getsize(path) / (1024 * 1024) / elapsed,
+        'chunks': n_chunks,
+        # ru_maxrss é dado em KiB no Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--methods", nargs="+", default=['sentences', 'paragraphs', 'tokens'],
+                        choices=['sentences', 'paragraphs', 'tokens'])
+    parser.add_argument("--no-legacy", action="store_true", help="Não mede a implementação anterior.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "texto.txt")
+        make_text_file(path, args.size_mb)
+
+        runs = []
+        for method in args.methods:
+            if not args.no_legacy and method != 'tokens':
+                runs.append((f"{method} (anterior)", method, 0, True))
+            runs.append((method, method, 0, False))
+            if args.overlap:
+                runs.append((f"{method} + overlap", method, args.overlap, False))
+
+        print(f"Texto de {args.size_mb} MB, chunk_size={args.chunk_size}")
+        print(f"{'método':<24} {'tempo (s)':>10} {'MB/s':>8} {'chunks':>10} {'pico RSS (MB)':>14}")
+        context = multiprocessing.get_context('spawn')
+        for name, method, overlap, legacy in runs:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                try:
+                    result = executor.submit(run, path, method, args.chunk_size, overlap, legacy).result()
+                except Exception as error:
+                    print(f"{name:<24} falhou: {error}")
+                    continue
+            print(f"{name:<24} {result['seconds']:>10.1f} {result['mb_per_s']:>8.2f} {result['chunks']:>10} "
+                  f"{result['peak_rss_mb']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
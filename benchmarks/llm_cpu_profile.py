@@ -0,0 +1,94 @@
+"""
+Benchmark do LLM local na CPU: tokens/s, latência e pico de memória de cada perfil de inferência
+(float16 fixo, como antes; tipo automático; reaproveitamento do KV cache do prefixo; quantização int8).
+
+Cada perfil roda em um processo novo, para que o carregamento do modelo e o pico de memória sejam medidos
+de forma independente.
+
+Uso:
+    python -m benchmarks.llm_cpu_profile --model EleutherAI/gpt-neo-125m --prompts 8 --max-new-tokens 32
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+PROFILES = {
+    'float16 (anterior)': {'torch_dtype': 'float16', 'quantize': False, 'prefix': False},
+    'auto': {'torch_dtype': 'auto', 'quantize': False, 'prefix': False},
+    'auto + prefixo': {'torch_dtype': 'auto', 'quantize': False, 'prefix': True},
+    'int8 + prefixo': {'torch_dtype': 'auto', 'quantize': True, 'prefix': True},
+}
+
+
+def make_prompts(n_prompts, context_sentences):
+    from src.rag_system import RAGSystem
+
+    prompts = []
+    for i in range(n_prompts):
+        chunks = [f"O trecho {i}.{j} descreve planaltos, planícies e depressões do relevo brasileiro."
+                  for j in range(context_sentences)]
+        prompts.append(RAGSystem._build_prompt(f"Qual é a característica {i} do relevo brasileiro?", chunks))
+    return prompts
+
+
+def run_profile(model_name, profile, prompts, max_new_tokens):
+    import torch
+
+    from src.llm import LLM
+    from src.rag_system import PROMPT_PREFIX
+
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    llm = LLM(method='local', local_model_name=model_name, torch_dtype=profile['torch_dtype'],
+              quantize=profile['quantize'], prompt_prefix=PROMPT_PREFIX if profile['prefix'] else None)
+    load_s = time.perf_counter() - start
+    tokenizer = llm.generator.tokenizer
+
+    # Aquecimento (alocações e kernels iniciais não entram na medição)
+    llm.generate_response(prompts[0], max_new_tokens=4)
+
+    new_tokens = 0
+    latencies = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        answer = llm.generate_response(prompt, max_new_tokens=max_new_tokens)
+        latencies.append(time.perf_counter() - start)
+        new_tokens += len(tokenizer(answer, add_special_tokens=False).input_ids)
+
+    return {
+        'dtype': str(llm.torch_dtype).replace('torch.', ''),
+        'load_s': load_s,
+        'tokens_per_s': new_tokens / sum(latencies),
+        'latency_ms': 1000 * sum(latencies) / len(latencies),
+        # ru_maxrss é dado em KiB no Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="EleutherAI/gpt-neo-125m")
+    parser.add_argument("--prompts", type=int, default=8)
+    parser.add_argument("--context-sentences", type=int, default=5)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    prompts = make_prompts(args.prompts, args.context_sentences)
+    print(f"{'perfil':<20} {'dtype':>9} {'carga (s)':>10} {'tokens/s':>10} {'latência (ms)':>14} {'pico RSS (MB)':>14}")
+    for name in args.profiles:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                result = executor.submit(run_profile, args.model, PROFILES[name], prompts, args.max_new_tokens).result()
+            except Exception as error:
+                print(f"{name:<20} falhou: {error}")
+                continue
+        print(f"{name:<20} {result['dtype']:>9} {result['load_s']:>10.1f} {result['tokens_per_s']:>10.1f} "
+              f"{result['latency_ms']:>14.0f} {result['peak_rss_mb']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
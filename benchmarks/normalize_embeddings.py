@@ -0,0 +1,76 @@
+"""
+Micro-benchmark da normalização de embeddings: o caminho antigo (uma chamada de validação por linha e
+arredondamento elemento a elemento em Python) contra normalize_embeddings (operações sobre a matriz inteira).
+
+Uso:
+    python -m benchmarks.normalize_embeddings --n 100000 --dim 384
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.embedder import normalize_embeddings
+
+
+def normalize_per_row(embeddings):
+    """
+    Reprodução do caminho anterior: valida e normaliza cada linha separadamente e devolve uma lista de vetores.
+    """
+    normalized = []
+    for embedding in embeddings:
+        embedding = np.nan_to_num(embedding, nan=0.0, posinf=0.0, neginf=0.0)
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            embedding = embedding / norm
+        embedding = np.clip(embedding, 0.001, 1.0)
+        normalized.append(embedding.astype(np.float32))
+    return normalized
+
+
+def round_per_element(embedding):
+    """
+    Reprodução do arredondamento elemento a elemento feito antes em RAGSystem.query.
+    """
+    return [round(float(x), 9) for x in embedding]
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da normalização de embeddings.")
+    parser.add_argument("--n", type=int, default=100000, help="Número de embeddings.")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensão dos embeddings.")
+    parser.add_argument("--repeat", type=int, default=3, help="Número de repetições (vale o melhor tempo).")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((args.n, args.dim), dtype=np.float32)
+    embeddings[::1000, 0] = np.nan
+
+    per_row = best_of(lambda: normalize_per_row(embeddings), args.repeat)
+    vectorized = best_of(lambda: normalize_embeddings(embeddings), args.repeat)
+    np.testing.assert_allclose(np.stack(normalize_per_row(embeddings[:1000])), normalize_embeddings(embeddings[:1000]),
+                               rtol=1e-5, atol=1e-6)
+
+    query = embeddings[0]
+    rounding = best_of(lambda: round_per_element(query), args.repeat)
+    tolist = best_of(lambda: np.asarray(query, dtype=np.float32).tolist(), args.repeat)
+
+    print(f"Normalização de {args.n} x {args.dim}:")
+    print(f"  por linha:   {per_row * 1000:10.2f} ms")
+    print(f"  vetorizada:  {vectorized * 1000:10.2f} ms  ({per_row / vectorized:.1f}x mais rápida)")
+    print(f"Conversão do embedding da consulta ({args.dim} valores):")
+    print(f"  round por elemento: {rounding * 1e6:8.1f} us")
+    print(f"  ndarray.tolist():   {tolist * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Suíte de benchmarks de todas as etapas do pipeline, em um corpus sintético e reprodutível (mesma semente, mesmos
+dados): extração de texto dos PDFs (PDFExtractor.extract_text), chunking com cada método do Chunker, embeddings
+(Embedder.generate_embeddings), upsert e busca no armazenamento de embeddings (índice local ou um Pinecone falso,
+em memória, com latência de rede simulada) e geração com um LLM local pequeno.
+
+Para cada etapa são medidos a vazão, a latência por operação (p50/p95/p99) e o pico de memória (RSS). Cada etapa
+roda em um processo novo, para que o pico de memória de uma não se misture ao das outras. Os resultados são salvos
+em JSON; com --compare, são comparados a um resultado anterior (baseline) e as regressões acima de --threshold são
+apontadas (o código de saída é 1 se houver alguma).
+
+Uso:
+    python -m benchmarks.run --pages 200 --output baseline.json
+    python -m benchmarks.run --pages 200 --output atual.json --compare baseline.json --threshold 0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+WORDS = ("o relevo brasileiro apresenta planaltos planícies e depressões formados por processos de erosão "
+         "sedimentação e movimentos tectônicos ao longo de milhões de anos em diferentes regiões do país").split()
+
+STAGES = ('extract', 'chunk', 'embed', 'store', 'llm')
+
+
+def make_page_text(rng, paragraphs=4):
+    """
+    Gera o texto de uma página: parágrafos com sentenças de tamanhos variados.
+    """
+    text = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            sentences.append(" ".join(rng.choices(WORDS, k=rng.randint(6, 24))).capitalize() + ".")
+        text.append(" ".join(sentences))
+    return "\n\n".join(text)
+
+
+def make_pages(n_pages, seed):
+    rng = random.Random(seed)
+    return [make_page_text(rng) for _ in range(n_pages)]
+
+
+def make_corpus(directory, n_pages, pages_per_pdf, seed):
+    """
+    Escreve o corpus sintético em PDFs de pages_per_pdf páginas (com o PyMuPDF) e retorna seus caminhos.
+    """
+    import fitz
+
+    pages = make_pages(n_pages, seed)
+    paths = []
+    for start in range(0, n_pages, pages_per_pdf):
+        document = fitz.open()
+        for text in pages[start:start + pages_per_pdf]:
+            page = document.new_page()
+            page.insert_textbox(fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36), text, fontsize=8)
+        path = os.path.join(directory, f"corpus-{start // pages_per_pdf:04d}.pdf")
+        document.save(path)
+        document.close()
+        paths.append(path)
+    return paths
+
+
+def summarize(latencies_s, items, elapsed_s, unit):
+    """
+    Resume as latências de uma etapa (em segundos) em p50/p95/p99 (em ms) e calcula a vazão (itens por segundo).
+    """
+    p50, p95, p99 = np.percentile(np.asarray(latencies_s) * 1000, [50, 95, 99]) if latencies_s else (0.0,) * 3
+    return {
+        'throughput': items / elapsed_s if elapsed_s > 0 else 0.0,
+        'unit': f"{unit}/s",
+        'items': items,
+        'seconds': elapsed_s,
+        'latency_ms': {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+    }
+
+
+def timed(calls):
+    """
+    Executa as chamadas em sequência, medindo a latência de cada uma.
+
+    Retorna:
+    - Uma tupla (resultados, latências em segundos, tempo total em segundos).
+    """
+    results, latencies = [], []
+    start = time.perf_counter()
+    for call in calls:
+        call_start = time.perf_counter()
+        results.append(call())
+        latencies.append(time.perf_counter() - call_start)
+    return results, latencies, time.perf_counter() - start
+
+
+class FakePineconeIndex:
+    """
+    Índice do Pinecone falso, em memória, com a interface usada pelo EmbeddingStore (upsert e query). Cada
+    requisição espera latency_ms, simulando a rede, e a busca é exata (LocalEmbeddingStore).
+    """
+
+    def __init__(self, dimension, latency_ms=0.0):
+        from src.local_embedding_store import LocalEmbeddingStore
+
+        self.latency_ms = latency_ms
+        self._store = LocalEmbeddingStore(dimension=dimension)
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors):
+        time.sleep(self.latency_ms / 1000)
+        ids = [vector['id'] if isinstance(vector, dict) else vector[0] for vector in vectors]
+        values = [vector['values'] if isinstance(vector, dict) else vector[1] for vector in vectors]
+        with self._lock:
+            self._store.store_embeddings(np.asarray(values, dtype=np.float32), ids=ids)
+
+    def query(self, vector, top_k=5, namespace=None, include_values=False, include_metadata=True):
+        time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            return {'matches': self._store.search(np.asarray(vector, dtype=np.float32), top_k=top_k)}
+
+
+def bench_extract(args, corpus):
+    from src.extractor import PDFExtractor
+
+    texts, latencies, elapsed = timed([lambda path=path: PDFExtractor(path).extract_text() for path in corpus])
+    result = summarize(latencies, args.pages, elapsed, 'páginas')
+    result['characters'] = sum(len(text) for text in texts)
+    return {'extract': result}
+
+
+def bench_chunk(args, corpus):
+    from src.chunker import Chunker
+
+    pages = make_pages(args.pages, args.seed)
+    megabytes = sum(len(page.encode('utf-8')) for page in pages) / (1024 * 1024)
+    results = {}
+    for method in args.chunk_methods:
+        chunker = Chunker(method=method, chunk_size=args.chunk_size, overlap=args.chunk_overlap)
+        chunker.chunk_text(pages[0])  # Carrega o spaCy/punkt fora da medição
+        chunks, latencies, elapsed = timed([lambda page=page: chunker.chunk_text(page) for page in pages])
+        result = summarize(latencies, args.pages, elapsed, 'páginas')
+        result['chunks'] = sum(len(page_chunks) for page_chunks in chunks)
+        result['mb_per_s'] = megabytes / elapsed if elapsed > 0 else 0.0
+        results[f'chunk:{method}'] = result
+    return results
+
+
+def make_chunks(args):
+    """
+    Chunks sintéticos para as etapas de embeddings, com o mesmo tamanho aproximado dos chunks do pipeline.
+    """
+    rng = random.Random(args.seed + 1)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(10, 40))) for _ in range(args.chunks)]
+
+
+def bench_embed(args, corpus):
+    from src.embedder import Embedder
+
+    embedder = Embedder(method='sbert')
+    embedder.warmup()
+    chunks = make_chunks(args)
+    batches = [chunks[i:i + args.embed_batch_size] for i in range(0, len(chunks), args.embed_batch_size)]
+    _, latencies, elapsed = timed([lambda batch=batch: embedder.generate_embeddings(batch) for batch in batches])
+    result = summarize(latencies, len(chunks), elapsed, 'chunks')
+    result['batch_size'] = args.embed_batch_size
+    return {'embed': result}
+
+
+def make_vectors(n, dimension, seed):
+    vectors = np.random.default_rng(seed).standard_normal((n, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_store(args, corpus):
+    from src.embedding_store import EmbeddingStore
+    from src.local_embedding_store import LocalEmbeddingStore
+
+    vectors = make_vectors(args.vectors, args.dimension, args.seed + 2)
+    queries = make_vectors(args.queries, args.dimension, args.seed + 3)
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    batch = args.upsert_batch_size
+
+    results = {}
+    for backend in args.stores:
+        if backend == 'local':
+            store = LocalEmbeddingStore(dimension=args.dimension)
+        else:
+            store = EmbeddingStore(pinecone_api_key=None, pinecone_environment=None, dimension=args.dimension,
+                                   batch_size=batch)
+            store._index = FakePineconeIndex(args.dimension, latency_ms=args.fake_latency_ms)
+
+        # Upsert em lotes do tamanho usado pelo prepare_data
+        upserts = [lambda start=start: store.store_embeddings(vectors[start:start + batch],
+                                                              ids=ids[start:start + batch])
+                   for start in range(0, len(vectors), batch)]
+        _, latencies, elapsed = timed(upserts)
+        results[f'store:{backend}:upsert'] = summarize(latencies, len(vectors), elapsed, 'vetores')
+
+        _, latencies, elapsed = timed([lambda query=query: store.search(query, top_k=args.top_k) for query in queries])
+        results[f'store:{backend}:search'] = summarize(latencies, len(queries), elapsed, 'consultas')
+    return results
+
+
+def bench_llm(args, corpus):
+    from src.llm import LLM
+
+    llm = LLM(method='local', local_model_name=args.llm_model)
+    llm.warmup()
+    rng = random.Random(args.seed + 4)
+    prompts = [" ".join(rng.choices(WORDS, k=60)) + "\n\nPergunta: como é o relevo?" for _ in range(args.prompts)]
+    _, latencies, elapsed = timed([lambda prompt=prompt: llm.generate_response(prompt,
+                                                                               max_new_tokens=args.max_new_tokens)
+                                   for prompt in prompts])
+    result = summarize(latencies, len(prompts), elapsed, 'respostas')
+    result['tokens_per_s'] = len(prompts) * args.max_new_tokens / elapsed if elapsed > 0 else 0.0
+    return {'llm': result}
+
+
+BENCHMARKS = {'extract': bench_extract, 'chunk': bench_chunk, 'embed': bench_embed, 'store': bench_store,
+              'llm': bench_llm}
+
+
+def run_stage(stage, args, corpus):
+    """
+    Executa uma etapa em um processo novo. As mensagens dos componentes não são exibidas (nem medidas).
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = BENCHMARKS[stage](args, corpus)
+    # ru_maxrss é dado em KiB no Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for result in results.values():
+        result['peak_rss_mb'] = peak_rss_mb
+    return results
+
+
+def compare(current, baseline, threshold):
+    """
+    Compara os resultados com um baseline: há regressão quando a vazão cai, ou a latência p95 ou o pico de
+    memória sobem, mais que threshold (fração; ex: 0.1 para 10%).
+
+    Retorna:
+    - Uma lista de tuplas (etapa, medida, valor do baseline, valor atual, variação relativa) das regressões.
+    """
+    regressions = []
+    for name, result in current['stages'].items():
+        reference = baseline.get('stages', {}).get(name)
+        if reference is None:
+            continue
+        checks = [('throughput', reference['throughput'], result['throughput'], -1),
+                  ('latency_p95_ms', reference['latency_ms']['p95'], result['latency_ms']['p95'], 1),
+                  ('peak_rss_mb', reference['peak_rss_mb'], result['peak_rss_mb'], 1)]
+        for measure, before, after, direction in checks:
+            if before <= 0:
+                continue
+            change = (after - before) / before
+            if change * direction > threshold:
+                regressions.append((name, measure, before, after, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pages", type=int, default=200, help="Páginas do corpus sintético.")
+    parser.add_argument("--pages-per-pdf", type=int, default=50)
+    parser.add_argument("--chunk-methods", nargs="+", default=['sentences', 'paragraphs', 'tokens'],
+                        choices=['sentences', 'paragraphs', 'tokens'])
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=0)
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks embedados na etapa 'embed'.")
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--stores", nargs="+", default=['local', 'fake-pinecone'], choices=['local', 'fake-pinecone'])
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--upsert-batch-size", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--fake-latency-ms", type=float, default=0.0,
+                        help="Latência de rede simulada de cada requisição ao Pinecone falso.")
+    parser.add_argument("--llm-model", default="sshleifer/tiny-gpt2")
+    parser.add_argument("--prompts", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--output", help="Arquivo JSON onde os resultados são salvos (por padrão, a saída padrão).")
+    parser.add_argument("--compare", help="Arquivo JSON de um resultado anterior (baseline) para comparação.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Variação relativa acima da qual uma medida é considerada uma regressão.")
+    args = parser.parse_args()
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'args': vars(args)
+        },
+        'stages': {}
+    }
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = make_corpus(directory, args.pages, args.pages_per_pdf, args.seed) if 'extract' in args.stages else []
+        for stage in args.stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                try:
+                    stage_results = executor.submit(run_stage, stage, args, corpus).result()
+                except Exception as error:
+                    print(f"Etapa {stage} falhou: {error}", file=sys.stderr)
+                    continue
+            results['stages'].update(stage_results)
+            for name, result in stage_results.items():
+                latency = result['latency_ms']
+                print(f"{name:<28} {result['throughput']:>10.1f} {result['unit']:<12} p50 {latency['p50']:.2f} ms, "
+                      f"p95 {latency['p95']:.2f} ms, p99 {latency['p99']:.2f} ms, pico RSS "
+                      f"{result['peak_rss_mb']:.0f} MB", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    else:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for name, measure, before, after, change in regressions:
+            print(f"REGRESSÃO {name} {measure}: {before:.2f} -> {after:.2f} ({change:+.1%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"Nenhuma regressão acima de {args.threshold:.0%} em relação a {args.compare}.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark de inicialização: tempo de import de src.rag_system, de construção do RAGSystem, de warmup (opcional)
+e da primeira consulta, além dos módulos pesados já importados após o import e do pico de memória, para cada
+configuração (modo de recuperação e método do LLM).
+
+Um pequeno índice local é criado uma vez em um diretório temporário, e cada configuração roda em um processo
+novo (cold start real: nenhum módulo ou modelo já carregado).
+
+Uso:
+    python -m benchmarks.startup --llm-model EleutherAI/gpt-neo-125m --configs sparse dense hybrid --warmup
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HEAVY_MODULES = ('torch', 'transformers', 'sentence_transformers', 'spacy', 'nltk', 'openai', 'pinecone',
+                 'rouge_score', 'PyPDF2', 'fitz')
+
+CONFIGS = {
+    'sparse': {'retrieval_mode': 'sparse'},
+    'dense': {'retrieval_mode': 'dense'},
+    'hybrid': {'retrieval_mode': 'hybrid'},
+}
+
+TEXTS = [f"O trecho {i} descreve planaltos, planícies e depressões do relevo brasileiro na região {i % 7}."
+         for i in range(200)]
+
+
+def make_rag_system(index_path, llm_model, retrieval_mode='dense'):
+    from src.rag_system import RAGSystem
+
+    return RAGSystem(
+        pdf_path=os.path.join(index_path, "sem-pdf.pdf"),
+        store_method='local',
+        index_path=index_path,
+        llm_method='local',
+        local_llm_model_name=llm_model,
+        retrieval_mode=retrieval_mode
+    )
+
+
+def build_index(index_path, llm_model):
+    """
+    Cria o índice local (chunks, embeddings e BM25) usado por todas as configurações.
+    """
+    rag_system = make_rag_system(index_path, llm_model)
+    ids = [f"chunk-{i}" for i in range(len(TEXTS))]
+    rag_system.chunk_store.add(ids, TEXTS)
+    rag_system.chunk_store.save()
+    rag_system.embedding_store.store_embeddings(rag_system.embedder.generate_embeddings(TEXTS), ids=ids)
+    rag_system.embedding_store.save()
+    rag_system.bm25_index.add(ids, TEXTS)
+    rag_system.bm25_index.save()
+
+
+def run(index_path, llm_model, config, warmup):
+    timings = {}
+    start = time.perf_counter()
+    import src.rag_system
+    timings['import_s'] = time.perf_counter() - start
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    start = time.perf_counter()
+    rag_system = make_rag_system(index_path, llm_model, **config)
+    timings['init_s'] = time.perf_counter() - start
+
+    timings['warmup_s'] = None
+    if warmup:
+        start = time.perf_counter()
+        rag_system.warmup()
+        timings['warmup_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rag_system.query("Como é o relevo brasileiro na região 3?", top_k=3)
+    timings['first_query_s'] = time.perf_counter() - start
+
+    # ru_maxrss é dado em KiB no Linux
+    timings['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    timings['heavy_after_import'] = heavy
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-model", default="EleutherAI/gpt-neo-125m")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--warmup", action="store_true", help="Chama warmup() antes da primeira consulta.")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as index_path:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            executor.submit(build_index, index_path, args.llm_model).result()
+
+        print(f"{'configuração':<14} {'import (s)':>10} {'init (s)':>9} {'warmup (s)':>11} {'1ª consulta (s)':>16} "
+              f"{'pico RSS (MB)':>14}  módulos pesados após o import")
+        for name in args.configs:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                try:
+                    result = executor.submit(run, index_path, args.llm_model, CONFIGS[name], args.warmup).result()
+                except Exception as error:
+                    print(f"{name:<14} falhou: {error}")
+                    continue
+            warmup = f"{result['warmup_s']:.2f}" if result['warmup_s'] is not None else "-"
+            print(f"{name:<14} {result['import_s']:>10.2f} {result['init_s']:>9.2f} {warmup:>11} "
+                  f"{result['first_query_s']:>16.2f} {result['peak_rss_mb']:>14.0f}  "
+                  f"{', '.join(result['heavy_after_import']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+from src.rag_system import RAGSystem
+from src.evaluation import EvaluationHarness, load_qa_dataset
+from dotenv import load_dotenv
+import argparse
+import json
+import os
+
+# Carregar as variáveis de ambiente do .env
+load_dotenv()
+
+# Carregar as chaves de API das variáveis de ambiente
+var_pinecone_api_key = os.getenv("PINECONE_API_KEY")
+var_pinecone_environment = os.getenv("PINECONE_ENVIRONMENT")
+var_openai_api_key = os.getenv("OPENAI_API_KEY")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avaliação offline do sistema RAG em um conjunto de perguntas.")
+    parser.add_argument("--dataset", required=True,
+                        help="Arquivo JSON/JSONL com 'question' e, opcionalmente, 'answer' e 'gold_ids'.")
+    parser.add_argument("--pdf-path", default="data/pdfs/relevo-brasileiro.pdf")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--retrieval-mode", choices=RAGSystem.RETRIEVAL_MODES, default=None)
+    parser.add_argument("--k-values", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--workers", type=int, default=None, help="Processos que calculam BLEU/ROUGE.")
+    parser.add_argument("--retrieval-only", action="store_true", help="Avalia apenas a recuperação (sem o LLM).")
+    parser.add_argument("--prepare", action="store_true", help="Executa prepare_data antes da avaliação.")
+    parser.add_argument("--output", help="Arquivo JSON onde os resultados por pergunta são salvos.")
+    args = parser.parse_args()
+
+    rag_system = RAGSystem(
+        pdf_path=args.pdf_path,
+        chunk_method="sentences",
+        chunk_size=100,
+        embedder_method="sbert",
+        openai_api_key=var_openai_api_key,
+        pinecone_api_key=var_pinecone_api_key,
+        pinecone_environment=var_pinecone_environment,
+        embedding_dimension=384,
+        index_name="my-vector-index",
+        llm_method="local",
+        inline_evaluation=False
+    )
+    if args.prepare:
+        print("Preparando os dados...")
+        rag_system.prepare_data()
+
+    dataset = load_qa_dataset(args.dataset)
+    harness = EvaluationHarness(rag_system, k_values=args.k_values, max_workers=args.workers)
+    results = harness.run(dataset, top_k=args.top_k, retrieval_mode=args.retrieval_mode,
+                          generate=not args.retrieval_only)
+
+    summary = results['summary']
+    print(f"\n{summary['questions']} perguntas avaliadas")
+    for name, value in sorted(summary['metrics'].items()):
+        print(f"{name:<12} {value:.4f}")
+    print(f"\n{'etapa':<10} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+    for stage, latency in summary['latency_ms'].items():
+        print(f"{stage:<10} {latency['p50']:>10.1f} {latency['p95']:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        print(f"\nResultados salvos em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
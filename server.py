@@ -0,0 +1,214 @@
+from src.rag_system import RAGSystem
+from src.micro_batcher import MicroBatcher
+from src.model_registry import get_model_registry
+from src.instrumentation import JSONLogSink, PrometheusSink, Tracer, set_tracer
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+import argparse
+import json
+import os
+import signal
+
+# Carregar as variáveis de ambiente do .env
+load_dotenv()
+
+# Carregar as chaves de API das variáveis de ambiente
+var_pinecone_api_key = os.getenv("PINECONE_API_KEY")
+var_pinecone_environment = os.getenv("PINECONE_ENVIRONMENT")
+var_openai_api_key = os.getenv("OPENAI_API_KEY")
+
+
+def make_batch_handler(rag_system):
+    """
+    Cria a função que responde um micro-lote de consultas com RAGSystem.query_batch (um lote por valor de top_k).
+    """
+    def handle(items):
+        results = [None] * len(items)
+        groups = {}
+        for i, (_, top_k) in enumerate(items):
+            groups.setdefault(top_k, []).append(i)
+        for top_k, indices in groups.items():
+            answers = rag_system.query_batch([items[i][0] for i in indices], top_k=top_k,
+                                             batch_size=len(indices))
+            for i, result in zip(indices, answers):
+                results[i] = result
+        return results
+    return handle
+
+
+def format_metrics(batcher, metrics_sink=None):
+    """
+    Formata as métricas do micro-batching (e, com metrics_sink, as da instrumentação do pipeline) no formato de
+    texto do Prometheus. As métricas são as do processo que atende a requisição: com --workers, cada worker mantém
+    as suas, e cada GET /metrics mostra as de um único worker (não a soma de todos).
+    """
+    metrics = batcher.metrics()
+    lines = [
+        "# HELP rag_queue_depth Consultas aguardando um micro-lote.",
+        "# TYPE rag_queue_depth gauge",
+        f"rag_queue_depth {metrics['queue_depth']}",
+        "# HELP rag_failed_batches_total Micro-lotes que terminaram com erro.",
+        "# TYPE rag_failed_batches_total counter",
+        f"rag_failed_batches_total {metrics['failed_batches']}"
+    ]
+    histograms = (
+        ('rag_batch_size', 'batch_size', "Número de consultas por micro-lote."),
+        ('rag_batch_queue_depth', 'queue_depth', "Consultas que ficaram na fila ao formar cada micro-lote.")
+    )
+    for metric, key, description in histograms:
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+        for limit, count in metrics[f'{key}_histogram'].items():
+            lines.append(f'{metric}_bucket{{le="{limit}"}} {count}')
+        lines.append(f"{metric}_sum {metrics[f'{key}_sum']}")
+        lines.append(f"{metric}_count {metrics['batches']}")
+    text = "\n".join(lines) + "\n"
+    if metrics_sink is not None:
+        text += metrics_sink.render()
+    return text
+
+
+def make_request_handler(batcher, request_timeout, metrics_sink=None):
+    class RAGRequestHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body, content_type="application/json"):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_json(self, status, payload):
+            self._send(status, json.dumps(payload, ensure_ascii=False))
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send(200, format_metrics(batcher, metrics_sink), content_type="text/plain; version=0.0.4")
+            elif self.path == "/health":
+                self._send_json(200, {'status': 'ok'})
+            else:
+                self._send_json(404, {'error': "Rota não encontrada."})
+
+        def do_POST(self):
+            if self.path != "/query":
+                self._send_json(404, {'error': "Rota não encontrada."})
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                user_query = payload['query']
+                top_k = int(payload.get('top_k', 5))
+            except (ValueError, KeyError, TypeError):
+                self._send_json(400, {'error': "Corpo inválido: esperado JSON com 'query' (e 'top_k' opcional)."})
+                return
+
+            future = batcher.submit((user_query, top_k))
+            try:
+                answer, relevant_chunks = future.result(timeout=request_timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                self._send_json(504, {'error': "Tempo limite excedido."})
+                return
+            except Exception as error:
+                self._send_json(500, {'error': str(error)})
+                return
+            self._send_json(200, {'answer': answer, 'relevant_chunks': relevant_chunks})
+
+    return RAGRequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP do sistema RAG com micro-batching das consultas.")
+    parser.add_argument("--pdf-path", default="data/pdfs/relevo-brasileiro.pdf")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=16,
+                        help="Número máximo de consultas por micro-lote.")
+    parser.add_argument("--max-wait-ms", type=float, default=10,
+                        help="Tempo máximo que uma consulta espera por outras para formar um lote.")
+    parser.add_argument("--request-timeout", type=float, default=120,
+                        help="Tempo máximo (em segundos) de espera pela resposta de uma consulta.")
+    parser.add_argument("--prepare", action="store_true",
+                        help="Executa prepare_data antes de começar a atender consultas.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Número de processos atendendo consultas na mesma porta. Os modelos são carregados uma "
+                             "vez no processo principal e compartilhados (copy-on-write) com os demais. Cada processo "
+                             "mantém suas próprias métricas em GET /metrics.")
+    parser.add_argument("--trace-log", help="Arquivo onde as medições de cada etapa são gravadas (uma linha JSON "
+                                            "por evento), além de expostas em GET /metrics.")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers deve ser pelo menos 1.")
+
+    # Duração de cada etapa e contadores do pipeline, expostos em GET /metrics
+    metrics_sink = PrometheusSink()
+    sinks = [metrics_sink]
+    if args.trace_log:
+        sinks.append(JSONLogSink(path=args.trace_log))
+    set_tracer(Tracer(*sinks))
+
+    # Os modelos são carregados uma única vez, na inicialização do servidor
+    rag_system = RAGSystem(
+        pdf_path=args.pdf_path,
+        chunk_method="sentences",
+        chunk_size=100,
+        embedder_method="sbert",
+        openai_api_key=var_openai_api_key,
+        pinecone_api_key=var_pinecone_api_key,
+        pinecone_environment=var_pinecone_environment,
+        embedding_dimension=384,
+        index_name="my-vector-index",
+        llm_method="local",
+        inline_evaluation=False
+    )
+    if args.prepare:
+        print("Preparando os dados...")
+        rag_system.prepare_data()
+
+    # Carregar os modelos antes de aceitar conexões, para que a primeira consulta não pague esse custo. Com vários
+    # workers, o processo principal apenas carrega os pesos: as inferências de teste (que iniciam as threads do
+    # PyTorch) e as conexões ficam para cada worker, depois do fork
+    print("Carregando os modelos...")
+    rag_system.warmup(run_inference=args.workers == 1)
+
+    server = ThreadingHTTPServer((args.host, args.port), None)
+    children = []
+    if args.workers > 1:
+        # Os objetos já criados (incluindo os modelos) não são mais tocados pelo coletor de lixo, para que as
+        # páginas dos pesos continuem compartilhadas entre os processos
+        get_model_registry().freeze()
+        for _ in range(args.workers - 1):
+            pid = os.fork()
+            if pid == 0:
+                children = None
+                break
+            children.append(pid)
+        rag_system.warmup()
+
+    # O micro-batcher (e sua thread) é criado em cada processo, depois do fork
+    batcher = MicroBatcher(make_batch_handler(rag_system), max_batch_size=args.max_batch_size,
+                           max_wait_ms=args.max_wait_ms)
+    server.RequestHandlerClass = make_request_handler(batcher, args.request_timeout, metrics_sink)
+    if children is not None:
+        print(f"Servidor ouvindo em http://{args.host}:{args.port} com {args.workers} processo(s) "
+              f"(POST /query, GET /metrics, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        for pid in children or []:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        if children is None:
+            os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+class AnswerCache:
+    def __init__(self, max_entries=1024, ttl_seconds=3600, similarity_threshold=None):
+        """
+        Inicializa um cache de respostas para o RAGSystem.query.
+
+        Uma consulta é encontrada no cache quando seu texto normalizado (minúsculas, sem espaços repetidos) é
+        idêntico ao de uma consulta anterior ou, opcionalmente, quando a similaridade de cosseno entre seu
+        embedding e o de uma consulta anterior é de pelo menos similarity_threshold. Em ambos os casos, os parâmetros
+        da recuperação (top_k e retrieval_mode) devem ser os mesmos da consulta armazenada.
+
+        Parâmetros:
+        - max_entries: Número máximo de respostas armazenadas; as usadas há mais tempo são removidas primeiro (LRU).
+        - ttl_seconds: Tempo de vida de cada resposta, em segundos (None para não expirar).
+        - similarity_threshold: Similaridade de cosseno mínima para reaproveitar a resposta de uma consulta parecida
+                                (ex: 0.95). Se None, apenas consultas idênticas são reaproveitadas.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Matriz com os embeddings normalizados das entradas, uma linha por entrada. Novas entradas ocupam uma
+        # linha livre ou são acrescentadas ao final (a capacidade dobra quando acaba), sem reconstruir a matriz
+        self._matrix = None
+        self._matrix_keys = []
+        self._free_rows = []
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_query(query):
+        """
+        Normaliza o texto da consulta: forma Unicode NFKC, minúsculas e espaços colapsados.
+        """
+        return " ".join(unicodedata.normalize('NFKC', query).casefold().split())
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry['created'] > self.ttl_seconds
+
+    @classmethod
+    def _key(cls, query, top_k, retrieval_mode):
+        return cls.normalize_query(query), top_k, retrieval_mode
+
+    def get(self, query, top_k=None, retrieval_mode=None):
+        """
+        Busca a resposta de uma consulta idêntica (após normalização), recuperada com os mesmos top_k e
+        retrieval_mode.
+
+        Retorna:
+        - A tupla (answer, relevant_chunks) armazenada, ou None. Um None não é contado como miss, pois a consulta
+          ainda pode ser encontrada por get_similar.
+        """
+        key = self._key(query, top_k, retrieval_mode)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, now):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry['answer'], list(entry['chunks'])
+
+    def get_similar(self, query_embedding, top_k=None, retrieval_mode=None):
+        """
+        Busca a resposta da consulta armazenada mais parecida, se a similaridade de cosseno atingir o limiar.
+        Deve ser chamada depois de get, quando ele retorna None; um resultado None é contado como miss.
+
+        Parâmetros:
+        - query_embedding: Embedding da consulta (ou None, quando a consulta não foi embedada; conta como miss).
+        - top_k, retrieval_mode: Parâmetros da recuperação; só são consideradas as consultas armazenadas com os
+                                 mesmos valores.
+
+        Retorna:
+        - A tupla (answer, relevant_chunks) armazenada, ou None.
+        """
+        with self._lock:
+            if self.similarity_threshold is None or query_embedding is None or not self._entries:
+                self.misses += 1
+                return None
+
+            if len(self._matrix_keys) == len(self._free_rows):
+                self.misses += 1
+                return None
+
+            similarities = self._matrix[:len(self._matrix_keys)] @ self._unit(query_embedding)
+            now = time.monotonic()
+            # Percorre os candidatos do mais para o menos parecido, ignorando linhas livres, entradas expiradas e
+            # entradas recuperadas com outros parâmetros
+            for row in np.argsort(-similarities):
+                if similarities[row] < self.similarity_threshold:
+                    break
+                key = self._matrix_keys[row]
+                if key is None or key[1:] != (top_k, retrieval_mode):
+                    continue
+                entry = self._entries[key]
+                if self._expired(entry, now):
+                    continue
+                self._entries.move_to_end(key)
+                self.near_hits += 1
+                return entry['answer'], list(entry['chunks'])
+
+            self.misses += 1
+            return None
+
+    def put(self, query, answer, relevant_chunks, query_embedding=None, top_k=None, retrieval_mode=None):
+        """
+        Armazena a resposta de uma consulta.
+
+        Parâmetros:
+        - query: Texto da consulta.
+        - answer: Resposta gerada.
+        - relevant_chunks: Chunks usados para gerar a resposta.
+        - query_embedding: Embedding da consulta, necessário para que ela seja encontrada por get_similar.
+        - top_k, retrieval_mode: Parâmetros da recuperação que produziu relevant_chunks.
+        """
+        key = self._key(query, top_k, retrieval_mode)
+        embedding = self._unit(query_embedding) if query_embedding is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            row = self._add_row(key, embedding) if embedding is not None else None
+            self._entries[key] = {'answer': answer, 'chunks': list(relevant_chunks), 'row': row,
+                                  'created': time.monotonic()}
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _add_row(self, key, embedding):
+        if self._free_rows:
+            row = self._free_rows.pop()
+            self._matrix_keys[row] = key
+        else:
+            row = len(self._matrix_keys)
+            if self._matrix is None:
+                self._matrix = np.empty((16, embedding.shape[0]), dtype=np.float32)
+            elif row == self._matrix.shape[0]:
+                grown = np.empty((2 * row, self._matrix.shape[1]), dtype=np.float32)
+                grown[:row] = self._matrix
+                self._matrix = grown
+            self._matrix_keys.append(key)
+        self._matrix[row] = embedding
+        return row
+
+    @staticmethod
+    def _unit(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def _remove(self, key):
+        row = self._entries.pop(key)['row']
+        if row is not None:
+            self._matrix_keys[row] = None
+            self._free_rows.append(row)
+
+    def clear(self):
+        """
+        Remove todas as respostas (usado quando o índice muda e as respostas armazenadas podem estar desatualizadas).
+        """
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_keys = []
+            self._free_rows = []
+
+    def stats(self):
+        """
+        Retorna os contadores do cache: hits exatos, hits por similaridade, misses, taxa de acerto e tamanho.
+        """
+        with self._lock:
+            total = self.hits + self.near_hits + self.misses
+            return {
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.near_hits) / total if total else 0.0,
+                'size': len(self._entries)
+            }
@@ -0,0 +1,24 @@
+import asyncio
+
+
+async def close_stale_client(client, client_loop):
+    """
+    Fecha um cliente HTTP assíncrono (httpx.AsyncClient ou AsyncOpenAI) criado em outro event loop, antes de ele
+    ser substituído por um cliente do loop atual (ex: a cada asyncio.run), para que seu pool de conexões não fique
+    aberto.
+
+    Parâmetros:
+    - client: Cliente a ser fechado.
+    - client_loop: Event loop em que o cliente foi criado.
+    """
+    close = getattr(client, 'aclose', None) or client.close
+    if client_loop is not None and client_loop.is_running():
+        # O loop do cliente ainda está rodando (em outra thread): o fechamento é feito nele
+        asyncio.run_coroutine_threadsafe(close(), client_loop)
+        return
+    try:
+        await close()
+    except Exception:
+        # O loop do cliente já foi fechado e o transporte não pode ser encerrado por ele; as conexões restantes
+        # são liberadas quando o cliente é coletado
+        pass
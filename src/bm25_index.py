@@ -0,0 +1,272 @@
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Divide um texto em termos para o índice BM25: minúsculas, sem acentos e apenas sequências alfanuméricas
+    (nomes próprios e códigos como 'BR-101' viram os termos 'br' e '101').
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _TOKEN_RE.findall(text)
+
+
+def reciprocal_rank_fusion(rankings, top_k=5, k=60):
+    """
+    Combina várias listas de resultados com Reciprocal Rank Fusion: cada ID recebe a soma de 1 / (k + posição)
+    sobre as listas em que aparece. Só a posição importa, então scores de escalas diferentes (ex: distância
+    euclidiana e BM25) podem ser combinados sem normalização.
+
+    Parâmetros:
+    - rankings: Listas de matches ({'id': ..., 'score': ...}), cada uma do mais para o menos relevante.
+    - top_k: Número de resultados a serem retornados.
+    - k: Constante de suavização do RRF (60 é o valor usual).
+
+    Retorna:
+    - Uma lista de matches no formato {'id': ..., 'score': ...}, com o score de RRF, do mais para o menos relevante.
+    """
+    scores = {}
+    for ranking in rankings:
+        for position, match in enumerate(ranking, start=1):
+            scores[match['id']] = scores.get(match['id'], 0.0) + 1.0 / (k + position)
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [{'id': chunk_id, 'score': score} for chunk_id, score in best]
+
+
+class BM25Index:
+    VOCAB_FILE = "bm25_vocab.json"
+    IDS_FILE = "bm25_ids.json"
+    PARAMS_FILE = "bm25_params.json"
+    # Índice direto (termos de cada chunk) e listas invertidas, ambos em formato CSR
+    ARRAYS = ('doc_terms', 'doc_tfs', 'doc_offsets', 'post_docs', 'post_scores', 'post_offsets')
+
+    def __init__(self, path=None, k1=1.2, b=0.75, max_postings_per_term=4096, mmap=True):
+        """
+        Inicializa um índice invertido BM25 em memória, para busca por palavras-chave.
+
+        As listas invertidas ficam em arrays contíguos (formato CSR): para cada termo, os chunks em que ele aparece
+        e a contribuição BM25 já calculada de cada ocorrência, ordenados da maior para a menor contribuição.
+        Assim, a busca apenas soma fatias de arrays, e lê no máximo max_postings_per_term ocorrências por termo:
+        termos muito comuns (que quase não contribuem para o score) não tornam a busca mais lenta, mantendo-a abaixo
+        de 1 ms mesmo com milhões de chunks.
+
+        As listas invertidas dependem de estatísticas globais (número de chunks, tamanho médio, frequência dos
+        termos), por isso são reconstruídas a partir do índice direto quando o índice muda (no save ou na primeira
+        busca após add/delete).
+
+        Parâmetros:
+        - path: Diretório onde o índice é salvo. Se já houver um índice salvo nele, ele é reaberto automaticamente.
+        - k1, b: Parâmetros do BM25 (saturação da frequência do termo e normalização pelo tamanho do chunk).
+        - max_postings_per_term: Número máximo de ocorrências lidas por termo em cada busca.
+        - mmap: Se True, os arrays salvos são abertos com memory-map.
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_postings_per_term = max_postings_per_term
+        self.mmap = mmap
+
+        self._vocab = {}
+        self._terms = []
+        self._ids = []
+        self._id_to_row = {}
+
+        # Índice direto já consolidado; chunks adicionados depois ficam em listas até a próxima reconstrução
+        self._doc_terms = np.empty(0, dtype=np.int32)
+        self._doc_tfs = np.empty(0, dtype=np.int32)
+        self._doc_offsets = np.zeros(1, dtype=np.int64)
+        self._pending_terms = []
+        self._pending_tfs = []
+
+        self._post_docs = np.empty(0, dtype=np.int32)
+        self._post_scores = np.empty(0, dtype=np.float32)
+        self._post_offsets = np.zeros(1, dtype=np.int64)
+        self._dirty = False
+
+        if path and os.path.exists(os.path.join(path, self.IDS_FILE)):
+            self.load()
+
+    def __len__(self):
+        return len(self._id_to_row)
+
+    def __contains__(self, chunk_id):
+        return str(chunk_id) in self._id_to_row
+
+    def add(self, ids, texts):
+        """
+        Indexa chunks. IDs já indexados são ignorados (o texto de um ID nunca muda, pois o ID deriva do conteúdo).
+
+        Parâmetros:
+        - ids: Lista de IDs dos chunks.
+        - texts: Lista com o texto de cada chunk.
+        """
+        for chunk_id, text in zip(ids, texts):
+            chunk_id = str(chunk_id)
+            if chunk_id in self._id_to_row:
+                continue
+            counts = Counter(self._term_id(term) for term in tokenize(text))
+            self._id_to_row[chunk_id] = len(self._ids)
+            self._ids.append(chunk_id)
+            self._pending_terms.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+            self._pending_tfs.append(np.fromiter(counts.values(), dtype=np.int32, count=len(counts)))
+            self._dirty = True
+
+    def _term_id(self, term):
+        term_id = self._vocab.get(term)
+        if term_id is None:
+            term_id = self._vocab[term] = len(self._terms)
+            self._terms.append(term)
+        return term_id
+
+    def delete(self, ids):
+        """
+        Remove chunks do índice (IDs inexistentes são ignorados).
+        """
+        for chunk_id in ids:
+            row = self._id_to_row.pop(str(chunk_id), None)
+            if row is not None:
+                self._ids[row] = None
+                self._dirty = True
+
+    def build(self):
+        """
+        Consolida o índice direto (incluindo adições e remoções pendentes) e reconstrói as listas invertidas,
+        com as contribuições BM25 de cada ocorrência. Não faz nada se o índice não mudou.
+        """
+        if not self._dirty:
+            return
+
+        terms = np.concatenate([self._doc_terms] + self._pending_terms).astype(np.int32, copy=False)
+        tfs = np.concatenate([self._doc_tfs] + self._pending_tfs).astype(np.int32, copy=False)
+        lengths = np.concatenate([np.diff(self._doc_offsets),
+                                  np.array([len(t) for t in self._pending_terms], dtype=np.int64)])
+
+        # Descartar as linhas removidas, renumerando os chunks restantes
+        keep = np.array([chunk_id is not None for chunk_id in self._ids], dtype=bool)
+        if not keep.all():
+            mask = np.repeat(keep, lengths)
+            terms, tfs, lengths = terms[mask], tfs[mask], lengths[keep]
+            self._ids = [chunk_id for chunk_id in self._ids if chunk_id is not None]
+            self._id_to_row = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+
+        self._doc_terms, self._doc_tfs = terms, tfs
+        self._doc_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        self._pending_terms, self._pending_tfs = [], []
+
+        n_docs = len(self._ids)
+        n_terms = len(self._vocab)
+        rows = np.repeat(np.arange(n_docs, dtype=np.int32), lengths)
+        doc_lengths = np.bincount(rows, weights=tfs, minlength=n_docs)
+        avgdl = float(doc_lengths.mean()) if n_docs else 0.0
+
+        df = np.bincount(terms, minlength=n_terms)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * doc_lengths[rows] / avgdl) if avgdl > 0 else self.k1
+        impacts = (idf[terms] * tfs * (self.k1 + 1.0) / (tfs + norm)).astype(np.float32)
+
+        # Ordenar as ocorrências por termo e, dentro de cada termo, da maior para a menor contribuição
+        order = np.lexsort((-impacts, terms))
+        self._post_docs = rows[order]
+        self._post_scores = impacts[order]
+        self._post_offsets = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        self._dirty = False
+
+    def search(self, query, top_k=5):
+        """
+        Busca os chunks com maior score BM25 para a consulta.
+
+        Parâmetros:
+        - query: Texto da consulta.
+        - top_k: Número de resultados a serem retornados.
+
+        Retorna:
+        - Uma lista de matches no formato {'id': ..., 'score': ...}, do mais para o menos relevante.
+        """
+        self.build()
+        term_ids = {self._vocab[term] for term in tokenize(query) if term in self._vocab}
+        slices = []
+        for term_id in term_ids:
+            start = self._post_offsets[term_id]
+            end = min(self._post_offsets[term_id + 1], start + self.max_postings_per_term)
+            if end > start:
+                slices.append((start, end))
+        if not slices:
+            return []
+
+        if len(slices) == 1:
+            # Uma única lista já está ordenada pela contribuição, que é o próprio score
+            start, end = slices[0]
+            end = min(end, start + top_k)
+            return [{'id': self._ids[row], 'score': float(score)}
+                    for row, score in zip(self._post_docs[start:end], self._post_scores[start:end])]
+
+        docs = np.concatenate([self._post_docs[start:end] for start, end in slices])
+        scores = np.concatenate([self._post_scores[start:end] for start, end in slices])
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+
+        k = min(top_k, totals.shape[0])
+        best = np.argpartition(-totals, k - 1)[:k] if k < totals.shape[0] else np.arange(totals.shape[0])
+        best = best[np.argsort(-totals[best], kind='stable')]
+        return [{'id': self._ids[unique_docs[i]], 'score': float(totals[i])} for i in best]
+
+    def save(self):
+        """
+        Reconstrói o índice, se necessário, e o salva em path (escrita atômica de cada arquivo).
+        Sem path, nada é salvo.
+        """
+        if not self.path:
+            return
+        self.build()
+        os.makedirs(self.path, exist_ok=True)
+
+        for name in self.ARRAYS:
+            self._write_npy(f"bm25_{name}.npy", getattr(self, '_' + name))
+        self._write_json(self.VOCAB_FILE, self._terms)
+        self._write_json(self.PARAMS_FILE, {'k1': self.k1, 'b': self.b})
+        # Os IDs são escritos por último: sua presença indica um índice completo
+        self._write_json(self.IDS_FILE, self._ids)
+
+    def load(self):
+        """
+        Reabre um índice salvo em path. Com mmap=True, os arrays são mapeados em memória (somente leitura).
+        """
+        with open(os.path.join(self.path, self.PARAMS_FILE), 'r', encoding='utf-8') as file:
+            params = json.load(file)
+        if not (math.isclose(params['k1'], self.k1) and math.isclose(params['b'], self.b)):
+            # As contribuições salvas foram calculadas com outros parâmetros; reconstruí-las na próxima busca
+            self._dirty = True
+
+        with open(os.path.join(self.path, self.VOCAB_FILE), 'r', encoding='utf-8') as file:
+            self._terms = json.load(file)
+        self._vocab = {term: term_id for term_id, term in enumerate(self._terms)}
+        with open(os.path.join(self.path, self.IDS_FILE), 'r', encoding='utf-8') as file:
+            self._ids = json.load(file)
+        self._id_to_row = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+
+        mmap_mode = 'r' if self.mmap else None
+        for name in self.ARRAYS:
+            setattr(self, '_' + name, np.load(os.path.join(self.path, f"bm25_{name}.npy"), mmap_mode=mmap_mode))
+
+    def _write_npy(self, file_name, array):
+        path = os.path.join(self.path, file_name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            np.save(file, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+
+    def _write_json(self, file_name, data):
+        path = os.path.join(self.path, file_name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
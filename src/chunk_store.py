@@ -0,0 +1,279 @@
+import json
+import mmap
+import os
+
+import numpy as np
+
+
+class ChunkStore:
+    TEXTS_FILE = "chunks.bin"
+    OFFSETS_FILE = "chunk_offsets.bin"
+    IDS_FILE = "chunk_ids.txt"
+    METADATA_FILE = "chunk_metadata.jsonl"
+
+    def __init__(self, path=None):
+        """
+        Inicializa o armazenamento de chunks, que mapeia o ID de cada embedding de volta para o texto do chunk.
+
+        Os textos ficam concatenados em um único arquivo binário UTF-8 (aberto com memory-map) e um arquivo de
+        offsets int64 indica onde cada chunk termina, de forma que a busca por ID é O(1) e não exige carregar
+        todos os textos na memória. Cada chunk também guarda metadados (arquivo de origem, página e offset
+        do chunk dentro da página). Todos os arquivos são append-only: salvar novos chunks não reescreve os
+        anteriores.
+
+        Parâmetros:
+        - path: Diretório onde os chunks são salvos. Se já houver chunks salvos nele, eles são reabertos
+                automaticamente, permitindo consultar o sistema sem chamar prepare_data. Se None, os chunks
+                vivem apenas em memória.
+        """
+        self.path = path
+
+        self._ids = []
+        self._id_to_row = {}
+        self._metadata = []
+
+        # Chunks já persistidos: textos mapeados em memória e offset final de cada chunk
+        self._blob = b""
+        self._blob_file = None
+        self._ends = np.empty(0, dtype=np.int64)
+
+        # Chunks adicionados desde o último save
+        self._pending_texts = []
+        # Número de chunks removidos desde o último save (linhas com ID None em self._ids)
+        self._deleted_count = 0
+
+        if path and os.path.exists(os.path.join(path, self.IDS_FILE)):
+            self.load()
+
+    def __len__(self):
+        return len(self._id_to_row)
+
+    def __contains__(self, chunk_id):
+        return str(chunk_id) in self._id_to_row
+
+    def add(self, ids, texts, metadatas=None):
+        """
+        Adiciona chunks ao armazenamento.
+
+        Parâmetros:
+        - ids: Lista de IDs dos chunks (os mesmos usados no índice de embeddings).
+        - texts: Lista com o texto de cada chunk.
+        - metadatas: Lista opcional de dicionários com os metadados de cada chunk (ex.: source, page, offset).
+        """
+        if metadatas is None:
+            metadatas = [{} for _ in ids]
+        if not (len(ids) == len(texts) == len(metadatas)):
+            raise ValueError("ids, texts e metadatas devem ter o mesmo tamanho.")
+
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            chunk_id = str(chunk_id)
+            if chunk_id in self._id_to_row:
+                raise ValueError(f"Chunk com ID {chunk_id} já existe no armazenamento.")
+            self._id_to_row[chunk_id] = len(self._ids)
+            self._ids.append(chunk_id)
+            self._metadata.append(metadata)
+            self._pending_texts.append(text.encode('utf-8'))
+
+    def _row(self, chunk_id):
+        try:
+            return self._id_to_row[str(chunk_id)]
+        except KeyError:
+            raise KeyError(f"Chunk com ID {chunk_id} não encontrado.") from None
+
+    def _text_bytes(self, row):
+        persisted = self._ends.shape[0]
+        if row >= persisted:
+            return self._pending_texts[row - persisted]
+
+        start = int(self._ends[row - 1]) if row > 0 else 0
+        end = int(self._ends[row])
+        return self._blob[start:end]
+
+    def get(self, chunk_id):
+        """
+        Retorna o texto do chunk com o ID informado. Lança KeyError se o ID não existir.
+        """
+        return self._text_bytes(self._row(chunk_id)).decode('utf-8')
+
+    def get_many(self, chunk_ids):
+        """
+        Retorna os textos dos chunks com os IDs informados, na mesma ordem.
+        """
+        return [self.get(chunk_id) for chunk_id in chunk_ids]
+
+    def get_metadata(self, chunk_id):
+        """
+        Retorna o dicionário de metadados do chunk com o ID informado.
+        """
+        return self._metadata[self._row(chunk_id)]
+
+    def ids(self):
+        """
+        Retorna a lista de IDs armazenados, na ordem de inserção.
+        """
+        return [chunk_id for chunk_id in self._ids if chunk_id is not None]
+
+    def delete(self, chunk_ids):
+        """
+        Remove os chunks com os IDs informados (IDs inexistentes são ignorados). Os arquivos em path são
+        compactados no próximo save.
+        """
+        for chunk_id in chunk_ids:
+            row = self._id_to_row.pop(str(chunk_id), None)
+            if row is None:
+                continue
+            self._ids[row] = None
+            self._metadata[row] = None
+            self._deleted_count += 1
+
+    def save(self):
+        """
+        Acrescenta os chunks pendentes aos arquivos em path e reabre o arquivo de textos com memory-map.
+        Sem path, os chunks vivem apenas em memória e nada é salvo.
+        """
+        if not self.path:
+            return
+        if self._deleted_count:
+            self._compact()
+            return
+        if not self._pending_texts:
+            return
+        os.makedirs(self.path, exist_ok=True)
+
+        persisted = self._ends.shape[0]
+        base = int(self._ends[-1]) if persisted else 0
+        ends = base + np.cumsum([len(text) for text in self._pending_texts], dtype=np.int64)
+
+        # A ordem de escrita garante que, se o processo cair no meio, os IDs (lidos por último no load)
+        # nunca apontem para textos ou offsets que não foram gravados
+        with open(os.path.join(self.path, self.TEXTS_FILE), 'ab') as file:
+            file.write(b"".join(self._pending_texts))
+        with open(os.path.join(self.path, self.OFFSETS_FILE), 'ab') as file:
+            file.write(ends.tobytes())
+        with open(os.path.join(self.path, self.METADATA_FILE), 'a', encoding='utf-8') as file:
+            for metadata in self._metadata[persisted:]:
+                file.write(json.dumps(metadata, ensure_ascii=False) + "\n")
+        with open(os.path.join(self.path, self.IDS_FILE), 'a', encoding='utf-8') as file:
+            for chunk_id in self._ids[persisted:]:
+                file.write(chunk_id + "\n")
+
+        self._pending_texts = []
+        self._open_files()
+
+    def _compact(self):
+        """
+        Reescreve os arquivos em path apenas com os chunks não removidos. Os novos arquivos são gravados em
+        arquivos temporários e renomeados no final.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        live_rows = [row for row, chunk_id in enumerate(self._ids) if chunk_id is not None]
+
+        tmp_paths = {name: os.path.join(self.path, name + ".tmp")
+                     for name in (self.TEXTS_FILE, self.OFFSETS_FILE, self.METADATA_FILE, self.IDS_FILE)}
+        ends = np.empty(len(live_rows), dtype=np.int64)
+        position = 0
+        with open(tmp_paths[self.TEXTS_FILE], 'wb') as file:
+            for i, row in enumerate(live_rows):
+                text = self._text_bytes(row)
+                file.write(text)
+                position += len(text)
+                ends[i] = position
+        with open(tmp_paths[self.OFFSETS_FILE], 'wb') as file:
+            file.write(ends.tobytes())
+        with open(tmp_paths[self.METADATA_FILE], 'w', encoding='utf-8') as file:
+            for row in live_rows:
+                file.write(json.dumps(self._metadata[row], ensure_ascii=False) + "\n")
+        with open(tmp_paths[self.IDS_FILE], 'w', encoding='utf-8') as file:
+            for row in live_rows:
+                file.write(self._ids[row] + "\n")
+
+        self._close_files()
+        for name in (self.TEXTS_FILE, self.OFFSETS_FILE, self.METADATA_FILE, self.IDS_FILE):
+            os.replace(tmp_paths[name], os.path.join(self.path, name))
+
+        self._ids = [self._ids[row] for row in live_rows]
+        self._metadata = [self._metadata[row] for row in live_rows]
+        self._id_to_row = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._pending_texts = []
+        self._deleted_count = 0
+        self._open_files()
+
+    def load(self):
+        """
+        Reabre os chunks salvos em path. Os textos são mapeados em memória, e não lidos para a RAM.
+        """
+        with open(os.path.join(self.path, self.IDS_FILE), 'r', encoding='utf-8') as file:
+            self._ids = file.read().splitlines()
+        with open(os.path.join(self.path, self.METADATA_FILE), 'r', encoding='utf-8') as file:
+            self._metadata = [json.loads(line) for line in file]
+        self._id_to_row = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._pending_texts = []
+        self._deleted_count = 0
+        self._truncate_partial_save()
+        self._open_files()
+
+    def _truncate_partial_save(self):
+        """
+        Descarta o que um save interrompido tenha gravado além do último ID, para que os próximos saves
+        continuem alinhados com os IDs.
+        """
+        count = len(self._ids)
+        texts_path = os.path.join(self.path, self.TEXTS_FILE)
+        offsets_path = os.path.join(self.path, self.OFFSETS_FILE)
+
+        if os.path.getsize(offsets_path) > count * 8:
+            os.truncate(offsets_path, count * 8)
+        end = int(np.fromfile(offsets_path, dtype=np.int64, count=1, offset=(count - 1) * 8)[0]) if count else 0
+        if os.path.getsize(texts_path) > end:
+            os.truncate(texts_path, end)
+
+        if len(self._metadata) > count:
+            self._metadata = self._metadata[:count]
+            with open(os.path.join(self.path, self.METADATA_FILE), 'w', encoding='utf-8') as file:
+                for metadata in self._metadata:
+                    file.write(json.dumps(metadata, ensure_ascii=False) + "\n")
+
+    def _open_files(self):
+        """
+        Mapeia em memória o arquivo de textos e o arquivo de offsets persistidos.
+        """
+        self._close_files()
+        texts_path = os.path.join(self.path, self.TEXTS_FILE)
+        offsets_path = os.path.join(self.path, self.OFFSETS_FILE)
+
+        if os.path.getsize(offsets_path) > 0:
+            self._ends = np.memmap(offsets_path, dtype=np.int64, mode='r')[:len(self._ids)]
+        else:
+            self._ends = np.empty(0, dtype=np.int64)
+
+        if os.path.getsize(texts_path) > 0:
+            self._blob_file = open(texts_path, 'rb')
+            self._blob = mmap.mmap(self._blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._blob = b""
+
+    def _close_files(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        if self._blob_file is not None:
+            self._blob_file.close()
+        self._blob = b""
+        self._blob_file = None
+        self._ends = np.empty(0, dtype=np.int64)
+
+    def clear(self):
+        """
+        Remove todos os chunks, inclusive os arquivos salvos em path.
+        """
+        self._close_files()
+        self._ids = []
+        self._id_to_row = {}
+        self._metadata = []
+        self._pending_texts = []
+        self._deleted_count = 0
+
+        if self.path:
+            for file_name in (self.TEXTS_FILE, self.OFFSETS_FILE, self.IDS_FILE, self.METADATA_FILE):
+                path = os.path.join(self.path, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
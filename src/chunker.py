@@ -1,9 +1,49 @@
-import nltk
-import spacy
+import threading
+from collections import deque
+
+from src.model_registry import get_model_registry
+
+# Os dados do punkt (NLTK) são baixados apenas na primeira divisão em sentenças, e uma única vez por processo
+_PUNKT_LOCK = threading.Lock()
+_PUNKT_READY = False
+
+
+def ensure_punkt():
+    """
+    Garante que os dados do punkt (tokenizer de sentenças do NLTK) estejam disponíveis, baixando-os apenas se
+    ainda não existirem. A verificação é feita uma única vez por processo.
+    """
+    global _PUNKT_READY
+    if _PUNKT_READY:
+        return
+    with _PUNKT_LOCK:
+        if _PUNKT_READY:
+            return
+        import nltk
+        try:
+            nltk.data.find('tokenizers/punkt_tab')
+        except LookupError:
+            print("Baixando o punkt do NLTK...")
+            nltk.download('punkt_tab', quiet=True)
+        _PUNKT_READY = True
+
+
+def _load_spacy_blank(name):
+    """
+    Cria um pipeline vazio do spaCy para o idioma, apenas com o tokenizer e a divisão de sentenças baseada em regras
+    (carregador do registro de modelos).
+    """
+    import spacy
+    nlp = spacy.blank(name)
+    nlp.add_pipe("sentencizer")
+    return nlp
 
 
 class Chunker:
-    def __init__(self, method='sentences', chunk_size=100):
+    # Separador entre as unidades de um chunk e seu custo no tamanho do chunk, por método
+    SEPARATORS = {'sentences': (" ", 1), 'paragraphs': ("\n\n", 2), 'tokens': (" ", 0)}
+
+    def __init__(self, method='sentences', chunk_size=100, overlap=0, token_counter=None, block_size=100000):
         """
         Inicializa a classe Chunker com o método de chunking e o tamanho do chunk.
 
@@ -11,22 +51,40 @@ class Chunker:
         - method: Método de chunking. Pode ser 'sentences' (dividir por sentenças),
                   'paragraphs' (dividir por parágrafos) ou 'tokens' (dividir por tokens).
         - chunk_size: Tamanho máximo do chunk (em número de caracteres ou tokens, dependendo do método).
+        - overlap: Tamanho (na mesma unidade de chunk_size) das últimas sentenças ou parágrafos de cada chunk que
+                   são repetidos no início do chunk seguinte. 0 para chunks sem sobreposição.
+        - token_counter: Usado apenas no método 'tokens'. Função que conta os tokens de um texto ou nome de um
+                         tokenizer do Hugging Face (ex: o do modelo de embeddings ou do LLM), para que chunk_size
+                         corresponda aos tokens do modelo. Se None, os tokens são contados pelo tokenizer do spaCy.
+        - block_size: Tamanho máximo, em caracteres, dos blocos de texto processados de cada vez (textos maiores
+                      são divididos em quebras de parágrafo), o que mantém a memória limitada em textos grandes.
 
-        Se o método for 'tokens', o modelo SpaCy será carregado para processamento de tokens.
-        Se o método for 'sentences', o NLTK será utilizado para tokenização de sentenças.
+        Nenhum modelo é carregado (nem baixado) na construção: o spaCy e o tokenizer são carregados no primeiro
+        chunking, e os dados do punkt do NLTK (método 'sentences') são baixados apenas se ainda não existirem.
         """
+        if method not in self.SEPARATORS:
+            raise ValueError("Método de chunking inválido.")
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("A sobreposição deve ser maior ou igual a 0 e menor que o tamanho do chunk.")
         self.method = method
         self.chunk_size = chunk_size
-        if method == 'tokens':
-            try:
-                self.nlp = spacy.load("en_core_web_sm")
-            except OSError:
-                print("Baixando modelo do spaCy...")
-                from spacy.cli import download
-                download("en_core_web_sm")
-                self.nlp = spacy.load("en_core_web_sm")
-        elif method == 'sentences':
-            nltk.download('punkt')
+        self.overlap = overlap
+        self.token_counter = token_counter
+        self.block_size = block_size
+        self._nlp_handle = None
+        self._tokenizer = None
+
+    @property
+    def signature(self):
+        """
+        Identifica a configuração do chunking (chunks iguais para a mesma assinatura).
+        """
+        signature = f"{self.method}:{self.chunk_size}"
+        if self.overlap:
+            signature += f":overlap={self.overlap}"
+        if self.method == 'tokens' and isinstance(self.token_counter, str):
+            signature += f":tokenizer={self.token_counter}"
+        return signature
 
     def chunk_text(self, text):
         """
@@ -40,85 +98,180 @@ class Chunker:
 
         O método de chunking pode ser baseado em sentenças, parágrafos ou tokens.
         """
-        if self.method == 'sentences':
-            return self._chunk_by_sentences(text)
-        elif self.method == 'paragraphs':
-            return self._chunk_by_paragraphs(text)
-        elif self.method == 'tokens':
-            return self._chunk_by_tokens(text)
-        else:
-            raise ValueError("Método de chunking inválido.")
+        return list(self.iter_chunks(text))
 
-    def _chunk_by_sentences(self, text):
+    def iter_chunks(self, text):
         """
-        Divide o texto de entrada em chunks com base em sentenças.
+        Divide um texto em chunks sob demanda, sem manter o texto inteiro dividido em memória.
 
         Parâmetros:
-        - text: Texto de entrada a ser dividido.
+        - text: Texto de entrada, ou um iterável de trechos de texto (ex: as linhas de um arquivo aberto).
 
         Retorna:
-        - Uma lista de chunks, onde cada chunk contém uma ou mais sentenças, respeitando o tamanho máximo do chunk.
-        """
-        from nltk.tokenize import sent_tokenize
-        sentences = sent_tokenize(text)
-        chunks = []
-        current_chunk = ""
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) <= self.chunk_size:
-                current_chunk += sentence + " "
-            else:
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence + " "
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        return chunks
-
-    def _chunk_by_paragraphs(self, text):
-        """
-        Divide o texto de entrada em chunks com base em parágrafos.
+        - Um gerador dos chunks, na ordem do texto.
+        """
+        blocks = self._iter_blocks([text] if isinstance(text, str) else text)
+        separator, separator_cost = self.SEPARATORS[self.method]
+        return self._pack(self._iter_units(blocks), separator, separator_cost)
+
+    def locate_chunks(self, text, chunks):
+        """
+        Calcula o offset (em caracteres) de cada chunk dentro do texto de origem.
 
         Parâmetros:
-        - text: Texto de entrada a ser dividido.
+        - text: Texto que foi dividido em chunks.
+        - chunks: Lista de chunks retornada por chunk_text(text).
 
         Retorna:
-        - Uma lista de chunks, onde cada chunk contém um ou mais parágrafos, respeitando o tamanho máximo do chunk.
+        - Uma lista com o offset inicial de cada chunk, ou -1 quando o início do chunk não é encontrado
+          no texto (os chunks são reconstruídos com espaços entre as sentenças, então apenas o início é buscado).
         """
-        paragraphs = text.split("\n\n")
-        chunks = []
-        current_chunk = ""
-        for paragraph in paragraphs:
-            if len(current_chunk) + len(paragraph) <= self.chunk_size:
-                current_chunk += paragraph + "\n\n"
-            else:
-                chunks.append(current_chunk.strip())
-                current_chunk = paragraph + "\n\n"
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        return chunks
+        offsets = []
+        cursor = 0
+        for chunk in chunks:
+            offset = text.find(chunk[:32], cursor)
+            if offset >= 0:
+                cursor = offset + 1
+            offsets.append(offset)
+        return offsets
 
-    def _chunk_by_tokens(self, text):
+    def _iter_blocks(self, pieces):
         """
-        Divide o texto de entrada em chunks com base em tokens, utilizando o SpaCy para tokenização.
+        Agrupa os trechos de texto em blocos de até block_size caracteres, cortados na última quebra de parágrafo
+        antes do limite. Um trecho sem quebras de parágrafo maior que block_size é cortado no último espaço (ou,
+        sem espaços, exatamente em block_size), e nesse caso uma sentença pode ser dividida entre dois blocos.
+        """
+        parts = []
+        size = 0
+        for piece in pieces:
+            parts.append(piece)
+            size += len(piece)
+            if size < self.block_size:
+                continue
+            buffer = "".join(parts)
+            start = 0
+            while len(buffer) - start >= self.block_size:
+                limit = start + self.block_size
+                cut = buffer.rfind("\n\n", start, limit)
+                if cut > start:
+                    yield buffer[start:cut]
+                    start = cut + 2
+                    continue
+                cut = buffer.rfind(" ", start, limit)
+                cut = cut if cut > start else limit
+                yield buffer[start:cut]
+                start = cut
+            parts = [buffer[start:]]
+            size = len(parts[0])
+        if size:
+            yield "".join(parts)
 
-        Parâmetros:
-        - text: Texto de entrada a ser dividido.
+    def _iter_units(self, blocks):
+        """
+        Divide os blocos nas unidades do método (sentenças ou parágrafos) e calcula o tamanho de cada uma.
 
         Retorna:
-        - Uma lista de chunks, onde cada chunk contém um conjunto de tokens, respeitando o tamanho máximo do chunk.
-        """
-        doc = self.nlp(text)
-        chunks = []
-        current_chunk = []
-        current_token_count = 0
-        for sent in doc.sents:
-            sentence_length = len(sent)
-            if current_token_count + sentence_length <= self.chunk_size:
-                current_chunk.append(sent.text)
-                current_token_count += sentence_length
-            else:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = [sent.text]
-                current_token_count = sentence_length
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
-        return chunks
+        - Um gerador de tuplas (texto da unidade, tamanho em caracteres ou tokens).
+        """
+        if self.method == 'paragraphs':
+            for block in blocks:
+                for paragraph in block.split("\n\n"):
+                    yield paragraph, len(paragraph)
+        elif self.method == 'sentences':
+            ensure_punkt()
+            from nltk.tokenize import sent_tokenize
+            for block in blocks:
+                for sentence in sent_tokenize(block):
+                    yield sentence, len(sentence)
+        elif self.token_counter is None:
+            # Apenas o tokenizer e a divisão em sentenças do spaCy, em fluxo pelos blocos
+            for doc in self._get_nlp().pipe(blocks, batch_size=8):
+                for sent in doc.sents:
+                    yield sent.text, len(sent)
+        else:
+            ensure_punkt()
+            from nltk.tokenize import sent_tokenize
+            for block in blocks:
+                sentences = sent_tokenize(block)
+                yield from zip(sentences, self._count_tokens(sentences))
+
+    def _get_nlp(self):
+        """
+        Carrega um pipeline do spaCy apenas com o tokenizer e uma divisão de sentenças baseada em regras
+        (sem tagger, parser e NER, que não são necessários para contar tokens).
+        """
+        if self._nlp_handle is None:
+            # O pipeline é compartilhado pelos Chunkers do processo; max_length só aumenta
+            handle = get_model_registry().acquire('spacy', 'en', _load_spacy_blank)
+            with handle.lock:
+                handle.model.max_length = max(handle.model.max_length, self.block_size + 1)
+            self._nlp_handle = handle
+        return self._nlp_handle.model
+
+    def _count_tokens(self, sentences):
+        """
+        Conta os tokens de cada sentença com o token_counter (de uma vez só, no caso de um tokenizer).
+        """
+        if callable(self.token_counter):
+            return [self.token_counter(sentence) for sentence in sentences]
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.token_counter)
+        if not sentences:
+            return []
+        encoded = self._tokenizer(sentences, add_special_tokens=False)
+        return [len(input_ids) for input_ids in encoded['input_ids']]
+
+    def _pack(self, units, separator, separator_cost):
+        """
+        Agrupa as unidades em chunks de até chunk_size, na ordem do texto. Cada unidade custa seu tamanho mais
+        separator_cost; uma unidade maior que chunk_size forma um chunk sozinha.
+
+        Com overlap, as últimas unidades de cada chunk, até somarem overlap, também iniciam o chunk seguinte
+        (e são descartadas, da mais antiga para a mais recente, se a próxima unidade não couber junto delas).
+
+        Retorna:
+        - Um gerador dos chunks.
+        """
+        current = deque()
+        current_size = 0
+        carried = 0
+        for unit, size in units:
+            if current and current_size + size > self.chunk_size:
+                if len(current) > carried:
+                    chunk = separator.join(text for text, _ in current).strip()
+                    if chunk:
+                        yield chunk
+                    carried = self._keep_overlap(current)
+                else:
+                    carried = len(current)
+                current_size = sum(unit_size for _, unit_size in current) + separator_cost * len(current)
+                # Descartar a sobreposição que não cabe junto com a nova unidade
+                while current and current_size + size > self.chunk_size:
+                    _, dropped = current.popleft()
+                    current_size -= dropped + separator_cost
+                    carried -= 1
+            current.append((unit, size))
+            current_size += size + separator_cost
+        if len(current) > carried:
+            chunk = separator.join(text for text, _ in current).strip()
+            if chunk:
+                yield chunk
+
+    def _keep_overlap(self, current):
+        """
+        Mantém em current apenas as últimas unidades que somam no máximo overlap e retorna quantas são.
+        """
+        if not self.overlap:
+            current.clear()
+            return 0
+        kept = 0
+        total = 0
+        for _, size in reversed(current):
+            if total + size > self.overlap:
+                break
+            total += size
+            kept += 1
+        for _ in range(len(current) - kept):
+            current.popleft()
+        return kept
@@ -0,0 +1,86 @@
+import re
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class ContextAssembler:
+    def __init__(self, token_counter, max_prompt_tokens, overlap_threshold=0.8, shingle_size=3, separator="\n"):
+        """
+        Monta o contexto do prompt a partir dos chunks recuperados, respeitando um orçamento de tokens.
+
+        Os chunks são considerados na ordem de relevância da busca. Chunks quase duplicados ou sobrepostos a um
+        chunk já escolhido são descartados, e os demais entram enquanto couberem no orçamento, que já desconta os
+        tokens do restante do prompt (instruções e pergunta) — a pergunta nunca é cortada pelo truncamento do modelo.
+
+        Parâmetros:
+        - token_counter: Função que conta os tokens de um texto (ex: LLM.count_tokens, com o tokenizer do modelo).
+        - max_prompt_tokens: Número máximo de tokens do prompt inteiro, ou uma função sem argumentos que o retorna
+                             (chamada apenas na primeira montagem, ex: para não carregar o modelo na construção).
+        - overlap_threshold: Fração mínima das sequências de palavras (shingles) de um chunk presentes em um chunk já
+                             escolhido para que ele seja considerado duplicado ou sobreposto.
+        - shingle_size: Número de palavras de cada shingle.
+        - separator: Separador entre os chunks no contexto.
+        """
+        self.token_counter = token_counter
+        self._max_prompt_tokens = max_prompt_tokens
+        self.overlap_threshold = overlap_threshold
+        self.shingle_size = shingle_size
+        self.separator = separator
+        self._separator_tokens = None
+
+    @property
+    def max_prompt_tokens(self):
+        if callable(self._max_prompt_tokens):
+            self._max_prompt_tokens = self._max_prompt_tokens()
+        return self._max_prompt_tokens
+
+    @property
+    def separator_tokens(self):
+        if self._separator_tokens is None:
+            self._separator_tokens = self.token_counter(self.separator) if self.separator else 0
+        return self._separator_tokens
+
+    def _shingles(self, text):
+        words = _WORD_RE.findall(text.casefold())
+        if len(words) <= self.shingle_size:
+            return {tuple(words)} if words else set()
+        return {tuple(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def _is_redundant(self, shingles, selected_shingles):
+        """
+        Verifica se a maior parte dos shingles do chunk já aparece em algum chunk escolhido.
+        """
+        if not shingles:
+            return True
+        for other in selected_shingles:
+            if len(shingles & other) >= self.overlap_threshold * len(shingles):
+                return True
+        return False
+
+    def select(self, chunks, reserved_tokens=0):
+        """
+        Escolhe os chunks que formarão o contexto.
+
+        Parâmetros:
+        - chunks: Textos dos chunks, do mais para o menos relevante.
+        - reserved_tokens: Tokens do restante do prompt (instruções e pergunta), descontados do orçamento.
+
+        Retorna:
+        - A lista dos chunks escolhidos, na ordem de relevância.
+        """
+        budget = self.max_prompt_tokens - reserved_tokens
+        selected = []
+        selected_shingles = []
+        for chunk in chunks:
+            shingles = self._shingles(chunk)
+            if self._is_redundant(shingles, selected_shingles):
+                continue
+
+            tokens = self.token_counter(chunk) + (self.separator_tokens if selected else 0)
+            # Um chunk que não cabe é pulado, mas chunks menos relevantes e menores ainda podem caber
+            if tokens > budget:
+                continue
+            selected.append(chunk)
+            selected_shingles.append(shingles)
+            budget -= tokens
+        return selected
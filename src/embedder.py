@@ -1,45 +1,230 @@
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
+import asyncio
+import threading
+
 import numpy as np
 
+from src.embedding_cache import EmbeddingCache
+from src.instrumentation import get_tracer
+from src.model_registry import get_model_registry
+from src.openai_embedding_client import OpenAIEmbeddingClient
+
+
+def normalize_embeddings(embeddings):
+    """
+    Valida e normaliza uma matriz de embeddings inteira com operações vetorizadas do NumPy.
+
+    Parâmetros:
+    - embeddings: Matriz (n, d) de embeddings (ou qualquer objeto conversível para ela).
+
+    Processos realizados (sobre a matriz inteira, sem laços em Python):
+    - Substitui valores NaN e infinitos por 0.
+    - Normaliza cada linha para garantir que sua magnitude seja 1.
+    - Limita os valores entre 0.001 e 1.0, para evitar valores absolutos de 0.
+
+    Retorna:
+    - Uma matriz contígua float32 (n, d) com os embeddings validados e normalizados.
+    """
+    # Cópia float32 contígua, sobre a qual as demais operações são feitas no próprio buffer
+    embeddings = np.array(embeddings, dtype=np.float32, order='C', ndmin=2)
+
+    # Substituir NaN, infinitos positivos e negativos por 0
+    np.nan_to_num(embeddings, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+
+    # Normalizar cada linha (magnitude do vetor = 1); linhas nulas permanecem nulas
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+
+    # Limitar os valores entre 0.001 (Evitar valores de 0 absolutos) e 1
+    np.clip(embeddings, 0.001, 1.0, out=embeddings)
+
+    return embeddings
+
+
+def _load_sentence_transformer(name):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
 
 class Embedder:
-    def __init__(self, method='sbert', openai_api_key=None):
+    # Identifica a normalização aplicada por validate_and_normalize_embedding; faz parte da chave do cache,
+    # de modo que alterar a normalização invalida os embeddings cacheados
+    NORMALIZATION = "nan_to_num=0;l2;clip=0.001:1.0;float32"
+
+    def __init__(self, method='sbert', openai_api_key=None, cache_path=None, cache_max_bytes=1024 ** 3,
+                 openai_client=None, model_registry=None):
         """
         Inicializa a classe Embedder para gerar embeddings de chunks de texto.
 
         Parâmetros:
         - method: Método de geração de embeddings. Pode ser 'sbert' (Sentence-BERT) ou 'openai' (modelos da OpenAI).
         - openai_api_key: Chave da API da OpenAI, necessária se o método 'openai' for utilizado.
+        - cache_path: Caminho do arquivo de cache de embeddings (opcional). Com o cache, apenas os chunks ainda não
+                      embedados com o mesmo modelo são enviados ao SBERT ou à OpenAI.
+        - cache_max_bytes: Tamanho máximo do cache; os embeddings usados há mais tempo são removidos primeiro.
+        - openai_client: OpenAIEmbeddingClient opcional, para ajustar lotes, concorrência e novas tentativas
+                         (ou apontar para um servidor falso em testes). Por padrão, um é criado com openai_api_key.
+        - model_registry: ModelRegistry de onde o modelo SBERT é obtido (compartilhado com outros Embedders do
+                          processo). Por padrão, o registro do processo.
 
         O modelo 'all-MiniLM-L6-v2' é utilizado no caso do método 'sbert'. Se o método for 'openai', a chave da API
         da OpenAI é necessária para acessar os modelos de embeddings.
+
+        O modelo SBERT é carregado na primeira geração de embeddings (ou em warmup()), não na construção.
         """
-        self.client = OpenAI(api_key=openai_api_key)
         self.method = method
+        self.model_registry = model_registry
+        self._model_handle = None
+        self._model_lock = threading.Lock()
         if method == 'sbert':
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.model_name = 'all-MiniLM-L6-v2'
         elif method == 'openai':
-            if openai_api_key is None:
-                raise ValueError("Chave da API da OpenAI é necessária para usar OpenAI embeddings.")
+            if openai_client is None:
+                if openai_api_key is None:
+                    raise ValueError("Chave da API da OpenAI é necessária para usar OpenAI embeddings.")
+                openai_client = OpenAIEmbeddingClient(api_key=openai_api_key)
+            self.client = openai_client
+            self.model_name = openai_client.model
         else:
             raise ValueError("Método de embedding inválido.")
 
+        self.cache = EmbeddingCache(cache_path, max_bytes=cache_max_bytes) if cache_path else None
+
+    @property
+    def model(self):
+        """
+        Modelo SBERT, obtido do registro de modelos no primeiro uso (apenas no método 'sbert').
+        """
+        if self._model_handle is None:
+            with self._model_lock:
+                if self._model_handle is None:
+                    registry = self.model_registry or get_model_registry()
+                    self._model_handle = registry.acquire('sentence-transformer', self.model_name,
+                                                          _load_sentence_transformer)
+        return self._model_handle.model
+
+    def close(self):
+        """
+        Devolve o modelo SBERT ao registro (ele é carregado de novo se o Embedder voltar a ser usado).
+        """
+        with self._model_lock:
+            if self._model_handle is not None:
+                self._model_handle.release()
+                self._model_handle = None
+
+    def warmup(self, run_inference=True):
+        """
+        Carrega o modelo SBERT e, com run_inference, gera um embedding de teste, para que a primeira consulta não
+        pague esse custo. No método 'openai', não há nada a carregar.
+        """
+        if self.method == 'sbert':
+            model = self.model
+            if run_inference:
+                model.encode(["warmup"], convert_to_numpy=True)
+
     def generate_embeddings(self, chunks):
         """
         Gera embeddings para uma lista de chunks de texto, de acordo com o método especificado.
 
+        Se houver cache, os embeddings já calculados são lidos do cache em um único lote e apenas os chunks
+        ausentes (sem repetição) são embedados pelo modelo.
+
         Parâmetros:
         - chunks: Lista de pedaços (chunks) de texto para os quais os embeddings serão gerados.
 
         Retorna:
-        - Uma lista de embeddings gerados, que podem ser gerados via 'sbert' ou 'openai'.
+        - Uma matriz contígua float32 (n, d), com uma linha validada e normalizada por chunk, gerada via 'sbert' ou 'openai'.
+        """
+        if self.cache is None:
+            return self._generate_embeddings(chunks)
+
+        keys, embeddings, missing = self._lookup_cache(chunks)
+        if missing:
+            self._store_in_cache(embeddings, missing, self._generate_embeddings(list(missing.values())))
+        return self._stack(keys, embeddings)
+
+    async def agenerate_embeddings(self, chunks, executor=None):
         """
+        Versão assíncrona de generate_embeddings. Com o método 'openai', as requisições são assíncronas; o SBERT
+        e o acesso ao cache (CPU e disco) são executados no executor, sem bloquear o event loop.
+
+        Parâmetros:
+        - chunks: Lista de pedaços (chunks) de texto para os quais os embeddings serão gerados.
+        - executor: Executor limitado para o trabalho bloqueante. Se None, usa o executor padrão do event loop.
+
+        Retorna:
+        - Uma matriz contígua float32 (n, d), como em generate_embeddings.
+        """
+        loop = asyncio.get_running_loop()
+        if self.cache is None:
+            return await self._agenerate_embeddings(chunks, executor)
+
+        keys, embeddings, missing = await loop.run_in_executor(executor, self._lookup_cache, chunks)
+        if missing:
+            new_embeddings = await self._agenerate_embeddings(list(missing.values()), executor)
+            await loop.run_in_executor(executor, self._store_in_cache, embeddings, missing, new_embeddings)
+        return self._stack(keys, embeddings)
+
+    def _lookup_cache(self, chunks):
+        """
+        Lê do cache, em um único lote, os embeddings já calculados.
+
+        Retorna:
+        - As chaves dos chunks, o dicionário {chave: embedding} encontrado no cache e o dicionário {chave: chunk}
+          dos chunks ausentes (sem repetição).
+        """
+        keys = [EmbeddingCache.make_key(self.model_name, self.NORMALIZATION, chunk) for chunk in chunks]
+        embeddings = self.cache.get_many(keys)
+
+        # Embedar cada chunk ausente apenas uma vez, mesmo que ele se repita na lista
+        missing = {}
+        for key, chunk in zip(keys, chunks):
+            if key not in embeddings and key not in missing:
+                missing[key] = chunk
+
+        tracer = get_tracer()
+        tracer.count('embedding_cache_hits', len(embeddings))
+        tracer.count('embedding_cache_misses', len(missing))
+        return keys, embeddings, missing
+
+    def _store_in_cache(self, embeddings, missing, new_embeddings):
+        new_items = dict(zip(missing, new_embeddings))
+        self.cache.put_many(new_items)
+        embeddings.update(new_items)
+
+    @staticmethod
+    def _stack(keys, embeddings):
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([embeddings[key] for key in keys])
+
+    def _generate_embeddings(self, chunks):
+        """
+        Gera embeddings para uma lista de chunks de texto com o modelo configurado, sem passar pelo cache.
+        """
+        if not chunks:
+            return np.empty((0, 0), dtype=np.float32)
         if self.method == 'sbert':
             return self._generate_sbert_embeddings(chunks)
         elif self.method == 'openai':
             return self._generate_openai_embeddings(chunks)
 
+    async def _agenerate_embeddings(self, chunks, executor=None):
+        """
+        Versão assíncrona de _generate_embeddings.
+        """
+        if not chunks:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.method == 'openai':
+            return normalize_embeddings(await self.client.aembed(chunks))
+        return await asyncio.get_running_loop().run_in_executor(executor, self._generate_sbert_embeddings, chunks)
+
+    async def aclose(self):
+        """
+        Fecha as conexões assíncronas abertas por agenerate_embeddings (apenas no método 'openai').
+        """
+        if self.method == 'openai':
+            await self.client.aclose()
+
     def validate_and_normalize_embedding(self, embedding):
         """
         Valida e normaliza um vetor de embedding.
@@ -55,22 +240,10 @@ class Embedder:
 
         Retorna:
         - O vetor de embedding validado e normalizado.
-        """
-        # Substituir NaN, infinitos positivos e negativos por 0
-        embedding = np.nan_to_num(embedding, nan=0.0, posinf=0.0, neginf=0.0)
-
-        # Normalizar o vetor (magnitude do vetor = 1)
-        norm = np.linalg.norm(embedding)
-        if norm > 0:
-            embedding = embedding / norm
 
-        # Limitar os valores entre 0.001 (Evitar valores de 0 absolutos) e 1
-        embedding = np.clip(embedding, 0.001, 1.0)
-
-        # Garantir que o embedding está em formato de float32
-        embedding = embedding.astype(np.float32)
-
-        return embedding
+        Para vários embeddings, prefira normalize_embeddings, que processa a matriz inteira de uma vez.
+        """
+        return normalize_embeddings(embedding)[0]
 
     def _generate_sbert_embeddings(self, chunks):
         """
@@ -80,14 +253,12 @@ class Embedder:
         - chunks: Lista de pedaços (chunks) de texto para os quais os embeddings serão gerados.
 
         Retorna:
-        - Uma lista de embeddings SBERT normalizados.
+        - Uma matriz float32 (n, d) de embeddings SBERT normalizados.
         """
-        embeddings = self.model.encode(chunks)
+        embeddings = self.model.encode(chunks, convert_to_numpy=True)
 
         # Validar e normalizar os embeddings
-        embeddings = [self.validate_and_normalize_embedding(embedding) for embedding in embeddings]
-
-        return embeddings
+        return normalize_embeddings(embeddings)
 
     def _generate_openai_embeddings(self, chunks):
         """
@@ -97,16 +268,12 @@ class Embedder:
         - chunks: Lista de pedaços (chunks) de texto para os quais os embeddings serão gerados.
 
         Retorna:
-        - Uma lista de embeddings gerados pela OpenAI, que são validados e normalizados.
-        """
-        embeddings = []
-        for chunk in chunks:
-            response = self.client.embeddings.create(input=chunk, model="text-embedding-ada-002")
-            embedding = response['data'][0]['embedding']
-
-            # Validar e normalizar o embedding
-            embedding = self.validate_and_normalize_embedding(np.array(embedding))
+        - Uma matriz float32 (n, d) de embeddings gerados pela OpenAI, que são validados e normalizados.
 
-            embeddings.append(embedding.tolist())  # Converter para lista quando necessário
+        Os chunks são enviados em lotes (vários textos por requisição), com requisições concorrentes e novas
+        tentativas em caso de rate limit, pelo OpenAIEmbeddingClient.
+        """
+        embeddings = self.client.embed(chunks)
 
-        return embeddings
+        # Validar e normalizar os embeddings
+        return normalize_embeddings(embeddings)
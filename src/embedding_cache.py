@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+class EmbeddingCache:
+    # Limite de variáveis por consulta do SQLite (o padrão antigo é 999)
+    _BATCH_SIZE = 900
+
+    def __init__(self, path, max_bytes=1024 ** 3, max_entries=None):
+        """
+        Inicializa um cache de embeddings em disco, endereçado pelo conteúdo.
+
+        Cada embedding é indexado pelo hash de (nome do modelo, configuração de normalização, texto do chunk), de
+        modo que reprocessar o mesmo texto com o mesmo modelo não chama o SBERT nem a API da OpenAI novamente.
+        O cache é um arquivo SQLite; quando ele ultrapassa os limites, os embeddings usados há mais tempo (LRU)
+        são removidos.
+
+        Parâmetros:
+        - path: Caminho do arquivo SQLite do cache.
+        - max_bytes: Tamanho máximo somado dos vetores armazenados (em bytes).
+        - max_entries: Número máximo de embeddings armazenados (opcional).
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._connection.commit()
+
+        # Número de embeddings e tamanho somado, lidos uma vez e mantidos a cada inserção e remoção, para que
+        # put_many não percorra a tabela inteira para verificar os limites
+        self._count, self._total_bytes = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()
+
+    @staticmethod
+    def make_key(model_name, normalization, text):
+        """
+        Gera a chave do cache para um texto embedado com o modelo e a normalização informados.
+        """
+        digest = hashlib.sha256()
+        for part in (model_name, normalization, text):
+            digest.update(part.encode('utf-8'))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+        """
+        Busca vários embeddings de uma vez.
+
+        Parâmetros:
+        - keys: Lista de chaves geradas por make_key.
+
+        Retorna:
+        - Um dicionário {chave: embedding float32} apenas com as chaves encontradas no cache.
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time_ns()
+        with self._lock:
+            for start in range(0, len(unique_keys), self._BATCH_SIZE):
+                batch = unique_keys[start:start + self._BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+
+                # Atualiza o último acesso dos hits, usado pela remoção LRU
+                hit_keys = [key for key, _ in rows]
+                if hit_keys:
+                    placeholders = ",".join("?" * len(hit_keys))
+                    self._connection.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({placeholders})", [now, *hit_keys]
+                    )
+            self._connection.commit()
+        return found
+
+    def put_many(self, items):
+        """
+        Armazena vários embeddings de uma vez e aplica os limites de tamanho do cache.
+
+        Parâmetros:
+        - items: Dicionário {chave: embedding}.
+        """
+        now = time.time_ns()
+        rows = []
+        for key, embedding in items.items():
+            vector = np.ascontiguousarray(embedding, dtype=np.float32).tobytes()
+            rows.append((key, vector, len(vector), now))
+
+        with self._lock:
+            # Tamanho das entradas substituídas, para atualizar os totais (consulta pela chave primária)
+            replaced = {}
+            keys = [row[0] for row in rows]
+            for start in range(0, len(keys), self._BATCH_SIZE):
+                batch = keys[start:start + self._BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                replaced.update(self._connection.execute(
+                    f"SELECT key, size FROM embeddings WHERE key IN ({placeholders})", batch
+                ))
+
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)", rows
+            )
+            self._count += len(rows) - len(replaced)
+            self._total_bytes += sum(row[2] for row in rows) - sum(replaced.values())
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        """
+        Remove os embeddings usados há mais tempo até que o cache respeite max_bytes e max_entries.
+        """
+        if self._total_bytes <= self.max_bytes and (self.max_entries is None or self._count <= self.max_entries):
+            return
+
+        excess_entries = self._count - self.max_entries if self.max_entries is not None else 0
+        excess_bytes = self._total_bytes - self.max_bytes
+
+        removed_entries = 0
+        removed_bytes = 0
+        victims = []
+        for key, size in self._connection.execute("SELECT key, size FROM embeddings ORDER BY last_access"):
+            if removed_entries >= excess_entries and removed_bytes >= excess_bytes:
+                break
+            victims.append((key,))
+            removed_entries += 1
+            removed_bytes += size
+        self._connection.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        self._count -= removed_entries
+        self._total_bytes -= removed_bytes
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def clear(self):
+        """
+        Remove todos os embeddings do cache.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM embeddings")
+            self._connection.commit()
+            self._count, self._total_bytes = 0, 0
+
+    def close(self):
+        self._connection.close()
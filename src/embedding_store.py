@@ -1,73 +1,342 @@
-import pinecone
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
 
-class EmbeddingStore:
-    def __init__(self, pinecone_api_key, pinecone_environment, dimension=384, index_name="my-vector-index"):
+from src.async_clients import close_stale_client
+from src.instrumentation import get_tracer
+
+
+class BaseEmbeddingStore:
+    """
+    Interface comum aos backends de armazenamento de embeddings.
+
+    Todo backend deve implementar store_embeddings, search e delete_index. O método search retorna uma lista
+    de matches, onde cada match permite acesso por chave a 'id' e 'score' (como os resultados do Pinecone).
+    """
+
+    def store_embeddings(self, embeddings, ids=None, metadatas=None):
+        """
+        Armazena embeddings no backend.
+        - embeddings: lista (ou matriz) de embeddings a serem armazenados.
+        - ids: lista de IDs associada aos embeddings.
+        - metadatas: lista opcional de dicionários de metadados, um por embedding (backends que não guardam
+                     metadados a ignoram).
+        """
+        raise NotImplementedError
+
+    def search(self, query_embedding, top_k=5, namespace=None):
+        """
+        Busca os embeddings mais próximos do embedding da consulta.
+        - query_embedding: embedding da consulta.
+        - top_k: número de resultados a serem retornados.
+        - namespace: opcional, para organizar a busca em um namespace específico.
+        """
+        raise NotImplementedError
+
+    def search_batch(self, query_embeddings, top_k=5, namespace=None):
+        """
+        Busca várias consultas de uma vez, retornando a lista de matches de cada consulta na ordem das consultas.
+        A implementação padrão chama search para cada consulta; backends podem sobrescrevê-la com uma busca em lote.
+        """
+        return [self.search(query_embedding, top_k=top_k, namespace=namespace) for query_embedding in query_embeddings]
+
+    async def asearch(self, query_embedding, top_k=5, namespace=None, executor=None):
+        """
+        Versão assíncrona de search. A implementação padrão, usada pelos índices locais (trabalho de CPU), executa
+        search no executor, sem bloquear o event loop; backends remotos a sobrescrevem com requisições assíncronas.
+        - executor: executor limitado para o trabalho bloqueante. Se None, usa o executor padrão do event loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, lambda: self.search(query_embedding, top_k=top_k, namespace=namespace)
+        )
+
+    def warmup(self):
+        """
+        Prepara o backend antes da primeira busca (ex: abre conexões). A implementação padrão não faz nada.
+        """
+        pass
+
+    async def aclose(self):
+        """
+        Fecha as conexões assíncronas abertas por asearch (a implementação padrão não abre nenhuma).
+        """
+        pass
+
+    def delete(self, ids):
+        """
+        Remove os embeddings com os IDs informados (IDs inexistentes são ignorados).
+        - ids: lista de IDs a serem removidos.
+        """
+        raise NotImplementedError
+
+    def save(self):
+        """
+        Persiste o índice, quando o backend precisar disso. Backends remotos (como o Pinecone) já persistem
+        cada upsert, então a implementação padrão não faz nada.
+        """
+        pass
+
+    def delete_index(self):
+        """
+        Deleta o índice atual.
+        """
+        raise NotImplementedError
+
+
+class EmbeddingStore(BaseEmbeddingStore):
+    def __init__(self, pinecone_api_key, pinecone_environment, dimension=384, index_name="my-vector-index",
+                 batch_size=100, max_workers=4, max_retries=3, max_async_connections=100):
         """
         Inicializa o armazenamento de embeddings usando Pinecone.
         - pinecone_api_key: chave da API do Pinecone
         - pinecone_environment: ambiente Pinecone (ex: 'us-west1-gcp')
         - dimension: dimensão dos embeddings
         - index_name: nome do índice Pinecone a ser utilizado
-        """
-        # Inicializa o Pinecone usando a nova API
-        self.pinecone = pinecone.Pinecone(api_key=pinecone_api_key)
+        - batch_size: número máximo de vetores por requisição de upsert
+        - max_workers: número de requisições de upsert enviadas em paralelo (compartilhando o pool de conexões do índice)
+        - max_retries: número de novas tentativas de um lote de upsert que falhou
+        - max_async_connections: número máximo de conexões simultâneas das buscas assíncronas (asearch)
 
+        A conexão com o Pinecone (e a criação do índice, se ele não existir) é feita no primeiro uso ou em warmup().
+        """
+        self.pinecone_environment = pinecone_environment
         self.index_name = index_name
         self.dimension = dimension
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
 
-        # Verifica se o índice já existe, senão cria um novo
-        if self.index_name not in self.pinecone.list_indexes().names():
-            self.pinecone.create_index(
-                name=self.index_name,
-                dimension=self.dimension,
-                metric='euclidean',  # Escolha a métrica que você preferir
-                spec=pinecone.ServerlessSpec(cloud='aws', region=pinecone_environment)
-            )
+        self._connect_lock = threading.Lock()
+        self._pinecone = None
+        self._index = None
 
-        # Conecta ao índice
-        self.index = self.pinecone.Index(self.index_name)
+        # Cliente HTTP assíncrono usado por asearch, preso ao event loop em que foi criado
+        self.api_key = pinecone_api_key
+        self.max_async_connections = max_async_connections
+        self._host = None
+        self._async_client = None
+        self._async_client_loop = None
 
-    def store_embeddings(self, embeddings, ids=None):
+    @property
+    def pinecone(self):
         """
-        Armazena embeddings no índice do Pinecone.
-        - embeddings: lista de embeddings a serem armazenados.
+        Cliente do Pinecone, criado no primeiro uso.
+        """
+        if self._pinecone is None:
+            with self._connect_lock:
+                if self._pinecone is None:
+                    import pinecone
+                    self._pinecone = pinecone.Pinecone(api_key=self.api_key)
+        return self._pinecone
+
+    @property
+    def index(self):
+        """
+        Índice do Pinecone, conectado (e criado, se ainda não existir) no primeiro uso.
+        """
+        if self._index is None:
+            client = self.pinecone
+            with self._connect_lock:
+                if self._index is None:
+                    import pinecone
+
+                    # Verifica se o índice já existe, senão cria um novo
+                    if self.index_name not in client.list_indexes().names():
+                        client.create_index(
+                            name=self.index_name,
+                            dimension=self.dimension,
+                            metric='euclidean',  # Escolha a métrica que você preferir
+                            spec=pinecone.ServerlessSpec(cloud='aws', region=self.pinecone_environment)
+                        )
+
+                    # Conecta ao índice; o pool de conexões é dimensionado para os upserts paralelos
+                    self._index = client.Index(self.index_name, pool_threads=self.max_workers)
+        return self._index
+
+    def warmup(self):
+        """
+        Conecta ao índice do Pinecone antes da primeira consulta.
+        """
+        return self.index
+
+    def _upsert_batch(self, vectors):
+        """
+        Envia um lote de vetores ao Pinecone, repetindo a requisição com backoff exponencial em caso de falha.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.index.upsert(vectors=vectors)
+                get_tracer().observe('upsert_batch_size', len(vectors))
+                return len(vectors)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(min(30.0, 0.5 * 2 ** attempt))
+
+    def store_embeddings(self, embeddings, ids=None, metadatas=None, progress_callback=None):
+        """
+        Armazena embeddings no índice do Pinecone, em lotes de batch_size enviados em paralelo.
+        - embeddings: lista (ou matriz) de embeddings a serem armazenados.
         - ids: lista de IDs associada aos embeddings.
+        - metadatas: lista opcional de dicionários de metadados (ex: source, page), anexados a cada vetor.
+        - progress_callback: função opcional chamada como progress_callback(vetores_enviados, total) a cada lote concluído.
         """
         if ids is None:
             ids = [str(i) for i in range(len(embeddings))]
 
-        # Insere os embeddings no índice
-        vectors = list(zip(ids, embeddings))
-        self.index.upsert(vectors)
+        # Converter a matriz de uma vez para listas de floats, como o cliente do Pinecone espera
+        values = np.asarray(embeddings, dtype=np.float32).tolist()
+        if metadatas is not None:
+            vectors = [{'id': vector_id, 'values': vector, 'metadata': metadata}
+                       for vector_id, vector, metadata in zip(ids, values, metadatas)]
+        else:
+            vectors = list(zip(ids, values))
 
-    def search(self, query_embedding, top_k=5, namespace=None):
+        batches = [vectors[start:start + self.batch_size] for start in range(0, len(vectors), self.batch_size)]
+        if len(batches) <= 1:
+            for batch in batches:
+                self._upsert_batch(batch)
+            if progress_callback:
+                progress_callback(len(vectors), len(vectors))
+            return
+
+        # Insere os lotes em paralelo; a falha definitiva de um lote é propagada
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._upsert_batch, batch) for batch in batches]
+            for future in as_completed(futures):
+                done += future.result()
+                if progress_callback:
+                    progress_callback(done, len(vectors))
+
+    def search(self, query_embedding, top_k=5, namespace=None, include_values=False, include_metadata=True):
         """
         Busca embeddings mais próximos no Pinecone.
         - query_embedding: embedding da consulta.
         - top_k: número de resultados a serem retornados.
         - namespace: opcional, para organizar a busca em um namespace específico.
+        - include_values: se True, inclui os vetores dos matches na resposta (por padrão, apenas IDs, scores e
+                          metadados trafegam pela rede).
+        - include_metadata: se True, inclui os metadados dos matches na resposta.
         """
-        # Converter embedding para lista de floats
-        query_embedding = [float(x) for x in query_embedding]
-
-        # Verificar o formato do embedding
-        print(f"Embedding para busca: {query_embedding[:10]}...")
+        # Converter embedding para lista de floats (uma única conversão do array inteiro)
+        query_embedding = np.asarray(query_embedding, dtype=np.float32).ravel().tolist()
+        get_tracer().count('pinecone_queries')
 
         # Realizar a busca no Pinecone usando 'vector' e 'namespace' (opcional)
         result = self.index.query(
             vector=query_embedding,
             top_k=top_k,
             namespace=namespace,
-            include_values=True  # Incluir os valores dos vetores correspondentes no resultado
+            include_values=include_values,
+            include_metadata=include_metadata
         )
 
         # Verificar o resultado
         if 'matches' in result:
             return result['matches']
         else:
-            print(f"Erro na busca no Pinecone: {result}")
+            get_tracer().count('pinecone_query_errors')
+            return []
+
+    def search_batch(self, query_embeddings, top_k=5, namespace=None, include_values=False, include_metadata=True):
+        """
+        Busca várias consultas no Pinecone, enviando até max_workers requisições em paralelo (o Pinecone não tem
+        uma consulta em lote). Os parâmetros são os de search.
+
+        Retorna:
+        - Uma lista com a lista de matches de cada consulta, na ordem das consultas.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        def run(query):
+            return self.search(query, top_k=top_k, namespace=namespace, include_values=include_values,
+                               include_metadata=include_metadata)
+
+        if len(queries) <= 1:
+            return [run(query) for query in queries]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(run, queries))
+
+    async def _get_async_client(self):
+        """
+        Retorna o cliente HTTP assíncrono do event loop atual, reaproveitando suas conexões entre buscas. O cliente
+        de um event loop anterior é fechado antes de ser substituído.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            if self._async_client is not None:
+                stale, stale_loop = self._async_client, self._async_client_loop
+                self._async_client = None
+                await close_stale_client(stale, stale_loop)
+            if self._host is None:
+                # O cliente síncrono descobre o host do índice; as buscas assíncronas vão direto a ele
+                self._host = self.pinecone.describe_index(self.index_name).host
+            import httpx
+            self._async_client = httpx.AsyncClient(
+                base_url=f"https://{self._host}",
+                headers={'Api-Key': self.api_key, 'X-Pinecone-API-Version': '2024-07'},
+                limits=httpx.Limits(max_connections=self.max_async_connections),
+                timeout=30.0
+            )
+            self._async_client_loop = loop
+        return self._async_client
+
+    async def asearch(self, query_embedding, top_k=5, namespace=None, executor=None, include_values=False,
+                      include_metadata=True):
+        """
+        Versão assíncrona de search, que consulta a API REST do índice diretamente com httpx (sem ocupar uma
+        thread por busca em andamento). Os parâmetros são os de search; executor é usado apenas na primeira busca,
+        para descobrir o host do índice (chamada bloqueante) sem bloquear o event loop.
+        """
+        if self._host is None:
+            # describe_index é uma chamada bloqueante, feita uma única vez
+            self._host = await asyncio.get_running_loop().run_in_executor(
+                executor, lambda: self.pinecone.describe_index(self.index_name).host
+            )
+        client = await self._get_async_client()
+
+        body = {
+            'vector': np.asarray(query_embedding, dtype=np.float32).ravel().tolist(),
+            'topK': top_k,
+            'includeValues': include_values,
+            'includeMetadata': include_metadata
+        }
+        if namespace:
+            body['namespace'] = namespace
+
+        get_tracer().count('pinecone_queries')
+        response = await client.post("/query", json=body)
+        response.raise_for_status()
+        result = response.json()
+        if 'matches' not in result:
+            get_tracer().count('pinecone_query_errors')
             return []
+        return result['matches']
+
+    async def aclose(self):
+        """
+        Fecha as conexões do cliente HTTP assíncrono usado por asearch.
+        """
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        self._async_client = None
+        self._async_client_loop = None
+
+    def delete(self, ids, batch_size=1000):
+        """
+        Remove embeddings do índice do Pinecone.
+        - ids: lista de IDs a serem removidos.
+        - batch_size: número de IDs por requisição (o Pinecone aceita até 1000 IDs por delete).
+        """
+        ids = list(ids)
+        for start in range(0, len(ids), batch_size):
+            self.index.delete(ids=ids[start:start + batch_size])
 
     def delete_index(self):
         """
@@ -0,0 +1,160 @@
+import json
+import math
+
+from src.evaluator import Evaluator
+
+STAGES = ('embed', 'search', 'rerank', 'assemble', 'generate')
+
+
+def load_qa_dataset(path):
+    """
+    Carrega um conjunto de perguntas para avaliação.
+
+    Parâmetros:
+    - path: Arquivo JSON (uma lista) ou JSONL (um objeto por linha). Cada item tem 'question' e, opcionalmente,
+            'answer' (resposta de referência, para BLEU/ROUGE) e 'gold_ids' (IDs dos chunks que respondem a
+            pergunta, para as métricas de recuperação).
+
+    Retorna:
+    - A lista de itens, cada um com as chaves 'question', 'answer' e 'gold_ids'.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        if path.endswith('.jsonl'):
+            items = [json.loads(line) for line in file if line.strip()]
+        else:
+            items = json.load(file)
+
+    dataset = []
+    for item in items:
+        if not item.get('question'):
+            raise ValueError("Todo item do conjunto de avaliação precisa de uma 'question'.")
+        dataset.append({'question': item['question'], 'answer': item.get('answer'),
+                        'gold_ids': list(item.get('gold_ids') or [])})
+    return dataset
+
+
+def retrieval_metrics(retrieved_ids, gold_ids, k_values=(1, 3, 5, 10)):
+    """
+    Calcula as métricas de recuperação de uma consulta em relação aos chunks corretos.
+
+    Parâmetros:
+    - retrieved_ids: IDs dos chunks recuperados, do mais para o menos relevante.
+    - gold_ids: IDs dos chunks que respondem a pergunta.
+    - k_values: Cortes do ranking em que recall e nDCG são calculados.
+
+    Retorna:
+    - Um dicionário com 'recall@k' e 'ndcg@k' (relevância binária) para cada k, e 'mrr' (inverso da posição do
+      primeiro chunk correto; 0 se nenhum foi recuperado).
+    """
+    gold = set(gold_ids)
+    if not gold:
+        raise ValueError("É preciso pelo menos um chunk correto para calcular as métricas de recuperação.")
+
+    hits = [chunk_id in gold for chunk_id in retrieved_ids]
+    metrics = {}
+    for k in k_values:
+        found = sum(hits[:k])
+        dcg = sum(1 / math.log2(rank + 2) for rank, hit in enumerate(hits[:k]) if hit)
+        idcg = sum(1 / math.log2(rank + 2) for rank in range(min(len(gold), k)))
+        metrics[f'recall@{k}'] = found / len(gold)
+        metrics[f'ndcg@{k}'] = dcg / idcg
+    metrics['mrr'] = next((1 / (rank + 1) for rank, hit in enumerate(hits) if hit), 0.0)
+    return metrics
+
+
+def percentile(values, q):
+    """
+    Percentil q (0 a 100) de uma lista de valores, com interpolação linear.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class EvaluationHarness:
+    def __init__(self, rag_system, evaluator=None, k_values=(1, 3, 5, 10), max_workers=None):
+        """
+        Inicializa a avaliação offline de um RAGSystem sobre um conjunto de perguntas.
+
+        As perguntas são respondidas uma a uma com RAGSystem.trace_query (que mede o tempo de cada etapa, sem cache
+        de respostas); depois, as métricas de recuperação são calculadas contra os chunks corretos e BLEU/ROUGE são
+        calculados para todas as respostas de uma vez, em paralelo (Evaluator.evaluate_batch). Assim, o cálculo das
+        métricas fica fora das consultas.
+
+        Parâmetros:
+        - rag_system: RAGSystem com os dados já preparados.
+        - evaluator: Evaluator usado para BLEU/ROUGE. Por padrão, o evaluator do rag_system.
+        - k_values: Cortes do ranking das métricas de recuperação (recall@k e nDCG@k).
+        - max_workers: Número de processos que calculam BLEU/ROUGE (por padrão, o número de núcleos disponíveis).
+        """
+        self.rag_system = rag_system
+        self.evaluator = evaluator or rag_system.evaluator or Evaluator()
+        self.k_values = tuple(k_values)
+        self.max_workers = max_workers
+
+    def run(self, dataset, top_k=5, retrieval_mode=None, generate=True):
+        """
+        Avalia o sistema em um conjunto de perguntas.
+
+        Parâmetros:
+        - dataset: Lista de itens com 'question' e, opcionalmente, 'answer' e 'gold_ids' (veja load_qa_dataset).
+        - top_k: Número de chunks recuperados por pergunta (as métricas usam no máximo top_k posições).
+        - retrieval_mode: 'dense', 'sparse' ou 'hybrid'; por padrão, o do sistema.
+        - generate: Se False, avalia apenas a recuperação (sem LLM nem BLEU/ROUGE).
+
+        Retorna:
+        - Um dicionário com 'questions' (para cada pergunta: IDs recuperados, resposta, métricas e tempos por
+          etapa) e 'summary' (média de cada métrica e p50/p95 do tempo de cada etapa e do total).
+        """
+        records = []
+        for item in dataset:
+            trace = self.rag_system.trace_query(item['question'], top_k=top_k, retrieval_mode=retrieval_mode,
+                                                generate=generate)
+            record = {
+                'question': item['question'],
+                'retrieved_ids': trace['retrieved_ids'],
+                'answer': trace['answer'],
+                'metrics': {},
+                'timings': dict(trace['timings'], total=sum(trace['timings'].values()))
+            }
+            if item.get('gold_ids'):
+                record['metrics'].update(retrieval_metrics(trace['retrieved_ids'], item['gold_ids'],
+                                                           self.k_values))
+            records.append(record)
+
+        # BLEU/ROUGE de todas as respostas de uma vez, em paralelo
+        scored = [(record, item['answer']) for record, item in zip(records, dataset)
+                  if record['answer'] is not None and item.get('answer')]
+        if scored:
+            scores = self.evaluator.evaluate_batch([(record['answer'], reference) for record, reference in scored],
+                                                   max_workers=self.max_workers)
+            for (record, _), record_scores in zip(scored, scores):
+                record['metrics'].update(record_scores)
+
+        return {'questions': records, 'summary': self.summarize(records)}
+
+    @staticmethod
+    def summarize(records):
+        """
+        Resume os resultados por pergunta: média de cada métrica (sobre as perguntas em que ela foi calculada) e
+        p50/p95 do tempo, em milissegundos, de cada etapa.
+        """
+        metrics = {}
+        for record in records:
+            for name, value in record['metrics'].items():
+                metrics.setdefault(name, []).append(value)
+
+        latency_ms = {}
+        for stage in STAGES + ('total',):
+            values = [record['timings'][stage] * 1000 for record in records]
+            latency_ms[stage] = {'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+
+        return {
+            'questions': len(records),
+            'metrics': {name: sum(values) / len(values) for name, values in metrics.items()},
+            'latency_ms': latency_ms
+        }
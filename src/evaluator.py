@@ -1,8 +1,48 @@
-from rouge_score import rouge_scorer
-from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
-import nltk
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-nltk.download('punkt')
+from src.chunker import ensure_punkt
+
+# Evaluators já construídos neste processo (um por conjunto de métricas), reaproveitados entre os lotes de evaluate_batch
+_EVALUATORS = {}
+
+
+@lru_cache(maxsize=16384)
+def word_tokenize(text):
+    """
+    Tokeniza um texto em palavras com o NLTK (usado pelo BLEU), guardando o resultado: respostas de referência
+    repetidas entre avaliações não são tokenizadas de novo.
+    """
+    import nltk
+
+    # O word_tokenize usa os dados do punkt, baixados apenas na primeira vez, se necessário
+    ensure_punkt()
+    return tuple(nltk.word_tokenize(text))
+
+
+class _CachedRougeTokenizer:
+    """
+    Tokenizer padrão do ROUGE (com stemming), com cache dos textos já tokenizados.
+    """
+
+    def __init__(self, maxsize=16384):
+        from rouge_score import tokenizers
+        self._tokenize = lru_cache(maxsize=maxsize)(tokenizers.DefaultTokenizer(use_stemmer=True).tokenize)
+
+    def tokenize(self, text):
+        return list(self._tokenize(text))
+
+
+def _evaluate_pairs(metrics, pairs):
+    """
+    Avalia um lote de pares (resposta gerada, resposta de referência) em um processo de evaluate_batch.
+    """
+    key = tuple(metrics)
+    if key not in _EVALUATORS:
+        _EVALUATORS[key] = Evaluator(list(metrics))
+    evaluator = _EVALUATORS[key]
+    return [evaluator.evaluate(generated, reference) for generated, reference in pairs]
 
 
 class Evaluator:
@@ -19,9 +59,16 @@ class Evaluator:
             if metric not in self.available_metrics:
                 raise ValueError(f"Métrica {metric} não é suportada. Métricas disponíveis: {self.available_metrics}")
 
-        # Inicializa o RougeScorer se ROUGE for solicitado
-        if 'rouge' in self.metrics:
-            self.rouge_scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
+        # O RougeScorer é criado na primeira avaliação com ROUGE
+        self._rouge_scorer = None
+
+    @property
+    def rouge_scorer(self):
+        if self._rouge_scorer is None:
+            from rouge_score import rouge_scorer
+            self._rouge_scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'],
+                                                          tokenizer=_CachedRougeTokenizer())
+        return self._rouge_scorer
 
     def evaluate(self, generated_response, reference_response):
         """
@@ -40,12 +87,41 @@ class Evaluator:
 
         return results
 
+    def evaluate_batch(self, pairs, max_workers=None, batch_size=64):
+        """
+        Avalia vários pares de respostas, distribuindo-os entre processos.
+
+        Parâmetros:
+        - pairs: Lista de tuplas (resposta gerada, resposta de referência).
+        - max_workers: Número de processos. Se None, usa o número de núcleos disponíveis; com 1, avalia neste
+                       processo.
+        - batch_size: Número de pares enviados de cada vez a um processo.
+
+        Retorna:
+        - Uma lista com os scores de cada par (como em evaluate), na ordem dos pares.
+        """
+        pairs = list(pairs)
+        if max_workers is None:
+            max_workers = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        batches = [pairs[i:i + batch_size] for i in range(0, len(pairs), batch_size)]
+        max_workers = min(max_workers or 1, len(batches))
+        if max_workers <= 1:
+            return [self.evaluate(generated, reference) for generated, reference in pairs]
+
+        results = []
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for scores in executor.map(_evaluate_pairs, [self.metrics] * len(batches), batches):
+                results.extend(scores)
+        return results
+
     def compute_bleu(self, generated_response, reference_response):
         """
         Calcula a métrica BLEU para a resposta gerada.
         """
-        reference_tokens = [nltk.word_tokenize(reference_response)]
-        generated_tokens = nltk.word_tokenize(generated_response)
+        from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
+
+        reference_tokens = [list(word_tokenize(reference_response))]
+        generated_tokens = list(word_tokenize(generated_response))
 
         # Corrigir a atribuição do smoothing_function
         smoothing_fn = SmoothingFunction().method1
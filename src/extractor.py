@@ -1,6 +1,5 @@
+import hashlib
 import os
-import PyPDF2
-import fitz  # PyMuPDF
 
 
 class PDFExtractor:
@@ -24,17 +23,64 @@ class PDFExtractor:
         - Uma string contendo todo o texto extraído do PDF.
         """
         text = ""
+        for _, page_text in self.extract_pages():
+            text += page_text + "\n"
+        return text.strip()
+
+    def extract_pages(self, pages=None):
+        """
+        Extrai o texto do PDF página por página.
+
+        Caso uma página não contenha texto, uma mensagem é exibida e a página é ignorada.
+
+        Parâmetros:
+        - pages: Conjunto opcional de números de página (começando em 1) a serem extraídos. Se None, extrai todas.
+
+        Retorna:
+        - Um gerador de tuplas (número da página, começando em 1; texto da página).
+        """
+        import PyPDF2
+
         with open(self.pdf_path, 'rb') as file:
             reader = PyPDF2.PdfReader(file)
             num_pages = len(reader.pages)
             for page_num in range(num_pages):
+                if pages is not None and page_num + 1 not in pages:
+                    continue
                 page = reader.pages[page_num]
                 page_text = page.extract_text()
                 if page_text and page_text.strip():
-                    text += page_text + "\n"
+                    yield page_num + 1, page_text
                 else:
                     print(f"A página {page_num + 1} não contém texto.")
-        return text.strip()
+
+    def file_fingerprint(self):
+        """
+        Calcula o fingerprint (SHA-256) do arquivo PDF inteiro, lendo-o em blocos.
+        """
+        digest = hashlib.sha256()
+        with open(self.pdf_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def page_fingerprints(self):
+        """
+        Calcula o fingerprint de cada página a partir do seu content stream, sem extrair o texto.
+
+        Retorna:
+        - Um dicionário {número da página (começando em 1): fingerprint SHA-256 da página}.
+        """
+        fingerprints = {}
+        import PyPDF2
+
+        with open(self.pdf_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            for page_num, page in enumerate(reader.pages):
+                contents = page.get_contents()
+                data = contents.get_data() if contents is not None else b""
+                fingerprints[page_num + 1] = hashlib.sha256(data).hexdigest()
+        return fingerprints
 
     def extract_images(self, output_folder='imagens_extraidas'):
         """
@@ -49,6 +95,8 @@ class PDFExtractor:
         Retorna:
         - O número total de imagens extraídas do PDF.
         """
+        import fitz  # PyMuPDF
+
         pdf_document = fitz.open(self.pdf_path)
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
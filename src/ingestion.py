@@ -0,0 +1,251 @@
+import glob
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from src.chunker import Chunker
+from src.extractor import PDFExtractor
+from src.manifest import make_chunk_id
+
+# Chunkers já construídos neste processo, reaproveitados entre tarefas (carregar o spaCy é caro)
+_CHUNKERS = {}
+
+
+def resolve_pdf_paths(pdf_path):
+    """
+    Resolve a fonte de documentos em uma lista ordenada de arquivos PDF.
+
+    Parâmetros:
+    - pdf_path: Caminho de um PDF, de um diretório (todos os PDFs dele e de seus subdiretórios), um padrão
+                glob (ex: 'data/pdfs/*.pdf') ou uma lista de qualquer um desses.
+
+    Retorna:
+    - A lista de caminhos dos PDFs, sem repetições e em ordem alfabética.
+    """
+    sources = pdf_path if isinstance(pdf_path, (list, tuple)) else [pdf_path]
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(glob.glob(os.path.join(source, '**', '*.pdf'), recursive=True))
+        elif glob.has_magic(source):
+            paths.extend(glob.glob(source, recursive=True))
+        else:
+            paths.append(source)
+
+    paths = sorted(set(paths))
+    if not paths:
+        raise ValueError(f"Nenhum PDF encontrado em {pdf_path}.")
+    return paths
+
+
+def iter_batches(iterable, batch_size):
+    """
+    Agrupa os itens de um iterável em listas de até batch_size itens, consumindo-o sob demanda.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _get_chunker(chunk_method, chunk_size, chunk_overlap=0, chunk_tokenizer=None):
+    key = (chunk_method, chunk_size, chunk_overlap, chunk_tokenizer)
+    if key not in _CHUNKERS:
+        _CHUNKERS[key] = Chunker(method=chunk_method, chunk_size=chunk_size, overlap=chunk_overlap,
+                                 token_counter=chunk_tokenizer)
+    return _CHUNKERS[key]
+
+
+def plan_document(pdf_path, known_fingerprint=None, known_pages=None):
+    """
+    Compara um PDF com o estado da última indexação e decide quais páginas precisam ser reprocessadas.
+    Executada nos processos do pool, por isso recebe e retorna apenas dados simples (serializáveis).
+
+    Parâmetros:
+    - pdf_path: Caminho do PDF.
+    - known_fingerprint: Fingerprint do arquivo na última indexação (ou None). Se for igual ao atual, o
+                         documento não é reprocessado.
+    - known_pages: Dicionário {número da página (str): fingerprint} da última indexação.
+
+    Retorna:
+    - Um dicionário com 'source', 'fingerprint', 'unchanged', 'page_fingerprints' ({página: fingerprint}) e
+      'changed_pages' (lista ordenada das páginas novas ou alteradas).
+    """
+    extractor = PDFExtractor(pdf_path)
+    fingerprint = extractor.file_fingerprint()
+    plan = {'source': pdf_path, 'fingerprint': fingerprint, 'unchanged': fingerprint == known_fingerprint,
+            'page_fingerprints': {}, 'changed_pages': []}
+    if plan['unchanged']:
+        return plan
+
+    known_pages = known_pages or {}
+    plan['page_fingerprints'] = extractor.page_fingerprints()
+    plan['changed_pages'] = sorted(page_num for page_num, page_fingerprint in plan['page_fingerprints'].items()
+                                   if known_pages.get(str(page_num)) != page_fingerprint)
+    return plan
+
+
+def process_pages(pdf_path, pages, chunk_method, chunk_size, chunk_overlap=0, chunk_tokenizer=None):
+    """
+    Extrai e divide em chunks um conjunto de páginas de um PDF. Executada nos processos do pool.
+
+    Parâmetros:
+    - pdf_path: Caminho do PDF.
+    - pages: Lista ordenada dos números das páginas a processar.
+    - chunk_method, chunk_size, chunk_overlap, chunk_tokenizer: Configuração do Chunker.
+
+    Retorna:
+    - Uma lista de (número da página, lista de chunks) na ordem das páginas, em que cada chunk é um dicionário
+      com 'id', 'text' e 'offset'. Páginas sem texto aparecem com uma lista vazia.
+    """
+    chunker = _get_chunker(chunk_method, chunk_size, chunk_overlap, chunk_tokenizer)
+    results = {page_num: [] for page_num in pages}
+    for page_num, page_text in PDFExtractor(pdf_path).extract_pages(pages=set(pages)):
+        page_chunks = chunker.chunk_text(page_text)
+        offsets = chunker.locate_chunks(page_text, page_chunks)
+        occurrences = {}
+        for chunk, offset in zip(page_chunks, offsets):
+            occurrence = occurrences.get(chunk, 0)
+            occurrences[chunk] = occurrence + 1
+            results[page_num].append({'id': make_chunk_id(pdf_path, page_num, occurrence, chunk),
+                                      'text': chunk, 'offset': offset})
+    return [(page_num, results[page_num]) for page_num in pages]
+
+
+def _ordered_results(executor, calls, window):
+    """
+    Executa chamadas no executor mantendo no máximo `window` em andamento e retorna os resultados na ordem
+    das chamadas. As chamadas são consumidas sob demanda: uma nova só é submetida quando um resultado é
+    entregue, o que limita a memória e propaga a contrapressão do consumidor até os workers.
+
+    Parâmetros:
+    - executor: Executor usado para as chamadas; se None, elas são executadas no próprio processo.
+    - calls: Iterável de (tag, função, argumentos); função None produz o resultado None sem submeter nada.
+    - window: Número máximo de chamadas em andamento.
+
+    Retorna:
+    - Um gerador de (tag, resultado).
+    """
+    pending = deque()
+    for tag, function, args in calls:
+        if executor is None:
+            yield tag, function(*args) if function else None
+            continue
+        pending.append((tag, executor.submit(function, *args) if function else None))
+        if len(pending) >= window:
+            tag, future = pending.popleft()
+            yield tag, future.result() if future else None
+    while pending:
+        tag, future = pending.popleft()
+        yield tag, future.result() if future else None
+
+
+def iter_document_pages(tasks, chunk_method, chunk_size, max_workers=None, pages_per_task=16, chunk_overlap=0,
+                        chunk_tokenizer=None):
+    """
+    Processa documentos em paralelo em um ProcessPoolExecutor e retorna os chunks de suas páginas alteradas
+    em fluxo, na ordem dos documentos e das páginas.
+
+    Cada documento é primeiro planejado (plan_document) e suas páginas alteradas são divididas em tarefas de até
+    pages_per_task páginas (process_pages), de modo que mesmo um único PDF grande é processado em paralelo
+    e nenhum estágio precisa manter o documento inteiro em memória.
+
+    Parâmetros:
+    - tasks: Lista de tuplas (caminho do PDF, fingerprint conhecido, páginas conhecidas), como em plan_document.
+    - chunk_method, chunk_size: Configuração do Chunker.
+    - max_workers: Número de processos. Se None, usa o número de núcleos disponíveis. Com 1 worker, o
+                   processamento é feito no próprio processo.
+    - pages_per_task: Número máximo de páginas por tarefa enviada a um worker.
+    - chunk_overlap, chunk_tokenizer: Sobreposição e tokenizer (nome no Hugging Face) do Chunker.
+
+    Retorna:
+    - Um gerador de (plano do documento, lista de (página, chunks), is_last), em que is_last indica a última
+      entrega do documento. Documentos inalterados produzem uma única entrega sem páginas.
+    """
+    tasks = list(tasks)
+    if max_workers is None:
+        max_workers = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    max_workers = max(1, max_workers)
+    window = 2 * max_workers
+
+    executor = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+    try:
+        plans = _ordered_results(executor, ((None, plan_document, task) for task in tasks), window)
+
+        def page_calls():
+            for _, plan in plans:
+                changed_pages = plan['changed_pages']
+                if not changed_pages:
+                    yield (plan, True), None, ()
+                    continue
+                for start in range(0, len(changed_pages), pages_per_task):
+                    pages = changed_pages[start:start + pages_per_task]
+                    is_last = start + pages_per_task >= len(changed_pages)
+                    yield (plan, is_last), process_pages, (plan['source'], pages, chunk_method, chunk_size,
+                                                           chunk_overlap, chunk_tokenizer)
+
+        for (plan, is_last), page_results in _ordered_results(executor, page_calls(), window):
+            yield plan, page_results or [], is_last
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class UpsertQueue:
+    def __init__(self, embedding_store, max_pending=4):
+        """
+        Fila limitada que envia embeddings ao índice em uma thread separada, para que o envio ao índice ocorra
+        em paralelo com a geração dos próximos embeddings.
+
+        Quando max_pending lotes estão aguardando, put bloqueia (contrapressão), mantendo a memória constante
+        mesmo se o índice for mais lento que o embedder. Cada lote fica pesquisável assim que é enviado; a divisão
+        em requisições menores fica a cargo do próprio armazenamento (ex: EmbeddingStore.batch_size).
+
+        Parâmetros:
+        - embedding_store: Armazenamento de embeddings (qualquer implementação de BaseEmbeddingStore).
+        - max_pending: Número máximo de lotes aguardando envio.
+        """
+        self.embedding_store = embedding_store
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="upsert-queue", daemon=True)
+        self._error = None
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._queue.put(None)
+        self._thread.join()
+        if exc_type is None:
+            self._raise_if_failed()
+
+    def put(self, ids, embeddings, metadatas=None):
+        """
+        Enfileira embeddings (e, opcionalmente, seus metadados) para envio ao índice. Bloqueia se a fila estiver cheia.
+        """
+        self._raise_if_failed()
+        self._queue.put((list(ids), embeddings, metadatas))
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError("Falha ao enviar embeddings para o índice.") from self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # Após uma falha, a fila continua sendo esvaziada para que put nunca fique bloqueado
+            if self._error is not None:
+                continue
+            ids, embeddings, metadatas = item
+            try:
+                self.embedding_store.store_embeddings(embeddings, ids=ids, metadatas=metadatas)
+            except Exception as error:
+                self._error = error
@@ -0,0 +1,233 @@
+import json
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    """
+    Tracer desabilitado (o padrão): spans e contadores não fazem nada. span() retorna sempre o mesmo objeto, então
+    o custo nas etapas instrumentadas é o de uma chamada de método.
+    """
+    enabled = False
+
+    def span(self, name, **attributes):
+        return _NULL_SPAN
+
+    def count(self, name, value=1):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'attributes', 'start')
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        for sink in self.tracer.sinks:
+            sink.record_span(self.name, seconds, self.attributes)
+        return False
+
+
+class Tracer:
+    enabled = True
+
+    def __init__(self, *sinks):
+        """
+        Inicializa um tracer, que mede a duração das etapas (spans) e acumula contadores, enviando-os aos sinks.
+
+        Parâmetros:
+        - sinks: Destinos das medições (InMemorySink, JSONLogSink, PrometheusSink ou qualquer objeto com os métodos
+                 record_span(nome, segundos, atributos), record_counter(nome, valor) e record_value(nome, valor)).
+        """
+        self.sinks = list(sinks)
+
+    def span(self, name, **attributes):
+        """
+        Mede a duração de um bloco: with tracer.span('query.search', mode='dense'): ...
+        Se o bloco terminar com uma exceção, o span é registrado com o atributo 'error'.
+        """
+        return _Span(self, name, attributes)
+
+    def count(self, name, value=1):
+        """
+        Soma value a um contador (ex: chunks indexados, tokens gerados, hits de cache).
+        """
+        for sink in self.sinks:
+            sink.record_counter(name, value)
+
+    def observe(self, name, value):
+        """
+        Registra um valor de uma distribuição (ex: tamanho de um lote).
+        """
+        for sink in self.sinks:
+            sink.record_value(name, value)
+
+
+class InMemorySink:
+    def __init__(self, max_spans=1000):
+        """
+        Inicializa um sink que acumula as medições em memória: para cada span, o número de ocorrências, a duração
+        total e a máxima; para cada contador, o total; para cada distribuição, o número de valores, a soma e o máximo.
+
+        Parâmetros:
+        - max_spans: Número de spans recentes mantidos individualmente (com seus atributos), para inspeção.
+        """
+        self._lock = threading.Lock()
+        self.max_spans = max_spans
+        self.reset()
+
+    def reset(self):
+        """
+        Descarta todas as medições acumuladas.
+        """
+        with self._lock:
+            self.spans = {}
+            self.counters = {}
+            self.values = {}
+            self.recent_spans = deque(maxlen=self.max_spans)
+
+    def record_span(self, name, seconds, attributes):
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = {'count': 0, 'total_s': 0.0, 'max_s': 0.0}
+            stats['count'] += 1
+            stats['total_s'] += seconds
+            stats['max_s'] = max(stats['max_s'], seconds)
+            self.recent_spans.append((name, seconds, attributes))
+
+    def record_counter(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_value(self, name, value):
+        with self._lock:
+            stats = self.values.get(name)
+            if stats is None:
+                stats = self.values[name] = {'count': 0, 'sum': 0, 'max': value}
+            stats['count'] += 1
+            stats['sum'] += value
+            stats['max'] = max(stats['max'], value)
+
+    def snapshot(self):
+        """
+        Retorna uma cópia das medições acumuladas: {'spans': ..., 'counters': ..., 'values': ...}.
+        """
+        with self._lock:
+            return {
+                'spans': {name: dict(stats) for name, stats in self.spans.items()},
+                'counters': dict(self.counters),
+                'values': {name: dict(stats) for name, stats in self.values.items()}
+            }
+
+
+class JSONLogSink:
+    def __init__(self, path=None, stream=None):
+        """
+        Inicializa um sink que escreve cada medição como uma linha JSON (um evento por linha).
+
+        Parâmetros:
+        - path: Arquivo onde os eventos são acrescentados. Se None, usa stream.
+        - stream: Stream de saída (por padrão, sys.stderr).
+        """
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path is not None else None
+        self._stream = self._file or stream or sys.stderr
+
+    def _write(self, event):
+        event['time'] = time.time()
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+    def record_span(self, name, seconds, attributes):
+        self._write({'type': 'span', 'name': name, 'seconds': seconds, 'attributes': attributes})
+
+    def record_counter(self, name, value):
+        self._write({'type': 'counter', 'name': name, 'value': value})
+
+    def record_value(self, name, value):
+        self._write({'type': 'value', 'name': name, 'value': value})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class PrometheusSink(InMemorySink):
+    """
+    Sink em memória que exporta as medições no formato de texto do Prometheus (ex: para um endpoint /metrics).
+    """
+
+    def render(self, prefix='rag'):
+        """
+        Retorna as medições no formato de texto do Prometheus: a duração das etapas como um summary com o rótulo
+        stage, cada contador como um counter e cada distribuição como um summary.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        if snapshot['spans']:
+            metric = f"{prefix}_stage_duration_seconds"
+            lines += [f"# HELP {metric} Duração das etapas instrumentadas.", f"# TYPE {metric} summary"]
+            for name, stats in sorted(snapshot['spans'].items()):
+                lines.append(f'{metric}_sum{{stage="{name}"}} {stats["total_s"]}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {stats["count"]}')
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, stats in sorted(snapshot['values'].items()):
+            metric = f"{prefix}_{_metric_name(name)}"
+            lines += [f"# TYPE {metric} summary", f"{metric}_sum {stats['sum']}", f"{metric}_count {stats['count']}"]
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+_DEFAULT_TRACER = NullTracer()
+
+
+def get_tracer():
+    """
+    Retorna o tracer padrão do processo (um NullTracer, a menos que set_tracer tenha sido chamado).
+    """
+    return _DEFAULT_TRACER
+
+
+def set_tracer(tracer):
+    """
+    Define o tracer padrão do processo, usado pelos componentes que não recebem um tracer. None desabilita a
+    instrumentação.
+    """
+    global _DEFAULT_TRACER
+    _DEFAULT_TRACER = tracer if tracer is not None else NullTracer()
@@ -0,0 +1,324 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from src.local_embedding_store import LocalEmbeddingStore
+
+
+class IVFEmbeddingStore(LocalEmbeddingStore):
+    CENTROIDS_FILE = "ivf_centroids.npy"
+    ASSIGNMENTS_FILE = "ivf_assignments.npy"
+    LIST_ORDER_FILE = "ivf_list_order.npy"
+    LIST_OFFSETS_FILE = "ivf_list_offsets.npy"
+    PARAMS_FILE = "ivf_params.json"
+
+    def __init__(self, dimension=384, index_path=None, metric='euclidean', mmap=True,
+                 n_lists=None, nprobe=None, train_threshold=10000, kmeans_iterations=20, seed=0):
+        """
+        Inicializa um índice aproximado (IVF - inverted file) sobre o índice local em NumPy.
+
+        Os vetores são agrupados em n_lists clusters por k-means; na busca, apenas os nprobe clusters mais
+        próximos da consulta são varridos. Enquanto o índice tiver menos de train_threshold vetores, a busca
+        continua exata (como no LocalEmbeddingStore), pois a varredura completa ainda é barata.
+
+        Parâmetros:
+        - dimension, index_path, metric, mmap: os mesmos do LocalEmbeddingStore.
+        - n_lists: Número de clusters (listas invertidas). Se None, usa 4 * sqrt(n), recalculado a cada treino.
+        - nprobe: Número de clusters varridos por consulta. Mais clusters aumentam o recall e a latência.
+                  Se None, usa o valor salvo com o índice (ou 8, em um índice novo).
+        - train_threshold: Número de vetores a partir do qual o k-means é treinado automaticamente.
+        - kmeans_iterations: Número de iterações do k-means.
+        - seed: Semente usada na amostragem do k-means, para que o treino seja reprodutível.
+        """
+        self.n_lists = n_lists
+        # n_lists escolhido pelo usuário; se None, o número de clusters acompanha o tamanho do índice
+        self._fixed_n_lists = n_lists
+        self.nprobe = nprobe or 8
+        self._nprobe_from_index = nprobe is None
+        self.train_threshold = train_threshold
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+
+        self._centroids = None
+        self._centroid_sq_norms = None
+        # Cluster de cada linha da matriz de vetores
+        self._assignments = np.empty(0, dtype=np.int32)
+        # Listas invertidas em formato CSR: linhas ordenadas por cluster e o início de cada cluster
+        self._list_order = np.empty(0, dtype=np.int64)
+        self._list_offsets = np.zeros(1, dtype=np.int64)
+        # Linhas inseridas ou alteradas desde a última reconstrução das listas
+        self._pending_rows = []
+
+        super().__init__(dimension=dimension, index_path=index_path, metric=metric, mmap=mmap)
+
+    @property
+    def is_trained(self):
+        return self._centroids is not None
+
+    def _on_rows_updated(self, rows):
+        """
+        Atribui as linhas novas ou alteradas ao cluster mais próximo. As listas invertidas não são reconstruídas
+        a cada upsert: as linhas ficam pendentes e são varridas à parte até a próxima reconstrução.
+        """
+        if not self.is_trained:
+            if self._size >= self.train_threshold:
+                self.train()
+            return
+
+        if isinstance(self._assignments, np.memmap) or self._assignments.shape[0] < self._vectors.shape[0]:
+            assignments = np.zeros(self._vectors.shape[0], dtype=np.int32)
+            assignments[:self._assignments.shape[0]] = self._assignments[:self._vectors.shape[0]]
+            self._assignments = assignments
+
+        self._assignments[rows] = self._assign(self._vectors[rows])
+        self._pending_rows.extend(int(row) for row in rows)
+
+        # Reconstrói as listas quando as linhas pendentes passam a pesar na busca
+        if len(self._pending_rows) > max(1024, self._size // 10):
+            self._build_lists()
+
+    def _on_rows_moved(self, moves):
+        """
+        Replica nas atribuições de cluster as movimentações de linhas feitas pela remoção e reconstrói as listas.
+        """
+        if not self.is_trained:
+            return
+        if isinstance(self._assignments, np.memmap):
+            self._assignments = np.array(self._assignments)
+        for source, destination in moves:
+            if destination is not None:
+                self._assignments[destination] = self._assignments[source]
+        self._build_lists()
+
+    def _assign(self, vectors, block_size=65536):
+        """
+        Retorna o cluster mais próximo (distância euclidiana) de cada vetor, processando em blocos para
+        limitar a memória da matriz de distâncias.
+        """
+        assignments = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], block_size):
+            block = vectors[start:start + block_size]
+            distances = self._centroid_sq_norms - 2.0 * (block @ self._centroids.T)
+            assignments[start:start + block_size] = np.argmin(distances, axis=1)
+        return assignments
+
+    def train(self, max_training_points=None):
+        """
+        Treina (ou re-treina) os centróides com k-means sobre uma amostra dos vetores armazenados e
+        reatribui todos os vetores aos clusters.
+
+        Parâmetros:
+        - max_training_points: Tamanho máximo da amostra de treino. Por padrão, 256 pontos por cluster.
+        """
+        if self._size == 0:
+            raise ValueError("Não há vetores armazenados para treinar o índice IVF.")
+
+        n_lists = self._fixed_n_lists or max(1, int(4 * np.sqrt(self._size)))
+        n_lists = min(n_lists, self._size)
+        self.n_lists = n_lists
+
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(self._size, max_training_points or 256 * n_lists)
+        sample_rows = np.sort(rng.choice(self._size, size=sample_size, replace=False))
+        sample = np.asarray(self._vectors[sample_rows], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            self._centroids = centroids
+            self._centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+            labels = self._assign(sample)
+
+            # Soma os pontos de cada cluster ordenando-os por rótulo e usando reduceat sobre os intervalos
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=n_lists)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            non_empty = counts > 0
+            sums = np.add.reduceat(sample[order], starts[non_empty], axis=0)
+            # Clusters vazios mantêm o centróide anterior
+            centroids = centroids.copy()
+            centroids[non_empty] = sums / counts[non_empty, None]
+
+        self._centroids = centroids.astype(np.float32)
+        self._centroid_sq_norms = np.einsum('ij,ij->i', self._centroids, self._centroids)
+
+        self._assignments = np.zeros(self._vectors.shape[0], dtype=np.int32)
+        self._assignments[:self._size] = self._assign(self._vectors[:self._size])
+        self._build_lists()
+
+    def _build_lists(self):
+        """
+        Reconstrói as listas invertidas (CSR) a partir da atribuição de cada linha.
+        """
+        assignments = self._assignments[:self._size]
+        self._list_order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        self._list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self._pending_rows = []
+
+    def _candidate_rows(self, query, nprobe):
+        """
+        Retorna as linhas pertencentes aos nprobe clusters mais próximos da consulta.
+        """
+        centroid_distances = self._centroid_sq_norms - 2.0 * (self._centroids @ query)
+        nprobe = min(nprobe, self.n_lists)
+        probe = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+
+        parts = [self._list_order[self._list_offsets[c]:self._list_offsets[c + 1]] for c in probe]
+        if self._pending_rows:
+            parts.append(np.asarray(self._pending_rows, dtype=np.int64))
+        candidates = np.unique(np.concatenate(parts))
+
+        # Linhas alteradas depois da reconstrução podem ter mudado de cluster
+        if self._pending_rows:
+            candidates = candidates[np.isin(self._assignments[candidates], probe)]
+        return candidates
+
+    def search(self, query_embedding, top_k=5, namespace=None, nprobe=None):
+        """
+        Busca aproximada dos embeddings mais próximos (exata enquanto o índice não estiver treinado).
+        - query_embedding: embedding da consulta.
+        - top_k: número de resultados a serem retornados.
+        - namespace: ignorado; mantido para compatibilidade com o EmbeddingStore do Pinecone.
+        - nprobe: sobrescreve o nprobe do índice nesta consulta.
+
+        Retorna:
+        - Uma lista de matches no formato {'id': ..., 'score': ...}, do mais para o menos relevante.
+        """
+        if self._size == 0:
+            return []
+        if not self.is_trained:
+            return super().search(query_embedding, top_k=top_k, namespace=namespace)
+
+        query = self._as_matrix(query_embedding)[0]
+        candidates = self._candidate_rows(query, nprobe or self.nprobe)
+        if candidates.shape[0] == 0:
+            return []
+
+        dots = self._vectors[candidates] @ query
+        if self.metric == 'euclidean':
+            scores = self._sq_norms[candidates] - 2.0 * dots + float(query @ query)
+        else:
+            scores = dots
+
+        return [{'id': self._ids[candidates[i]], 'score': float(scores[i])} for i in self._top_k(scores, top_k)]
+
+    def search_batch(self, query_embeddings, top_k=5, namespace=None, nprobe=None):
+        """
+        Busca várias consultas de uma vez. Enquanto o índice não estiver treinado, usa a busca exata em lote do
+        LocalEmbeddingStore; depois, cada consulta percorre seus próprios clusters, como em search.
+
+        Retorna:
+        - Uma lista com a lista de matches de cada consulta, na ordem das consultas.
+        """
+        if not self.is_trained:
+            return super().search_batch(query_embeddings, top_k=top_k, namespace=namespace)
+        return [self.search(query, top_k=top_k, nprobe=nprobe) for query in self._as_matrix(query_embeddings)]
+
+    def recall_report(self, queries=None, top_k=10, nprobe_values=(1, 2, 4, 8, 16, 32, 64), n_queries=100):
+        """
+        Mede o recall@top_k e a latência da busca aproximada em relação à busca exata, para cada valor de nprobe.
+
+        Parâmetros:
+        - queries: Matriz de consultas. Se None, usa n_queries vetores amostrados do próprio índice.
+        - top_k: Número de resultados comparados.
+        - nprobe_values: Valores de nprobe a serem avaliados.
+        - n_queries: Número de consultas amostradas quando queries não é fornecido.
+
+        Retorna:
+        - Uma lista de dicionários com 'nprobe', 'recall', 'latency_ms' (média por consulta) e
+          'exact_latency_ms' (média da busca exata), útil para escolher o nprobe a partir de medições.
+        """
+        if queries is None:
+            rng = np.random.default_rng(self.seed)
+            rows = rng.choice(self._size, size=min(n_queries, self._size), replace=False)
+            queries = np.asarray(self._vectors[np.sort(rows)])
+        queries = self._as_matrix(queries)
+
+        start = time.perf_counter()
+        exact = [{match['id'] for match in LocalEmbeddingStore.search(self, query, top_k=top_k)} for query in queries]
+        exact_latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        report = []
+        for nprobe in nprobe_values:
+            start = time.perf_counter()
+            approximate = [{match['id'] for match in self.search(query, top_k=top_k, nprobe=nprobe)} for query in queries]
+            latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            hits = sum(len(a & e) for a, e in zip(approximate, exact))
+            total = sum(len(e) for e in exact)
+            report.append({
+                'nprobe': nprobe,
+                'recall': hits / total if total else 1.0,
+                'latency_ms': latency_ms,
+                'exact_latency_ms': exact_latency_ms
+            })
+        return report
+
+    def save(self):
+        """
+        Salva o índice em index_path: os vetores (como no LocalEmbeddingStore), os centróides, a atribuição de
+        cada vetor e as listas invertidas, para que o índice seja reaberto sem re-treino.
+        """
+        if not self.index_path:
+            return
+        super().save()
+        if self._pending_rows:
+            self._build_lists()
+
+        params = {'n_lists': self.n_lists, 'fixed_n_lists': self._fixed_n_lists is not None, 'nprobe': self.nprobe,
+                  'trained': self.is_trained}
+        self._write_json(self.PARAMS_FILE, params)
+        if self.is_trained:
+            self._write_npy(self.CENTROIDS_FILE, self._centroids)
+            self._write_npy(self.ASSIGNMENTS_FILE, self._assignments[:self._size])
+            self._write_npy(self.LIST_ORDER_FILE, self._list_order)
+            self._write_npy(self.LIST_OFFSETS_FILE, self._list_offsets)
+
+    def load(self):
+        """
+        Reabre um índice salvo em index_path, incluindo a estrutura IVF quando ela já tiver sido treinada, e o
+        nprobe salvo (a menos que um nprobe tenha sido passado ao construtor).
+        """
+        super().load()
+        params_path = os.path.join(self.index_path, self.PARAMS_FILE)
+        if not os.path.exists(params_path):
+            return
+
+        with open(params_path, 'r', encoding='utf-8') as file:
+            params = json.load(file)
+        self.n_lists = params['n_lists']
+        if self._fixed_n_lists is None and params.get('fixed_n_lists', True):
+            self._fixed_n_lists = params['n_lists']
+        if self._nprobe_from_index and params.get('nprobe'):
+            self.nprobe = params['nprobe']
+        if not params['trained']:
+            return
+
+        mmap_mode = 'r' if self.mmap else None
+        self._centroids = np.load(os.path.join(self.index_path, self.CENTROIDS_FILE))
+        self._centroid_sq_norms = np.einsum('ij,ij->i', self._centroids, self._centroids)
+        self._assignments = np.load(os.path.join(self.index_path, self.ASSIGNMENTS_FILE), mmap_mode=mmap_mode)
+        self._list_order = np.load(os.path.join(self.index_path, self.LIST_ORDER_FILE), mmap_mode=mmap_mode)
+        self._list_offsets = np.load(os.path.join(self.index_path, self.LIST_OFFSETS_FILE))
+        self._pending_rows = []
+
+    def delete_index(self):
+        """
+        Remove todos os vetores e a estrutura IVF, apagando os arquivos salvos em index_path.
+        """
+        super().delete_index()
+        self._centroids = None
+        self._centroid_sq_norms = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._list_order = np.empty(0, dtype=np.int64)
+        self._list_offsets = np.zeros(1, dtype=np.int64)
+        self._pending_rows = []
+
+        if self.index_path:
+            for file_name in (self.CENTROIDS_FILE, self.ASSIGNMENTS_FILE, self.LIST_ORDER_FILE,
+                              self.LIST_OFFSETS_FILE, self.PARAMS_FILE):
+                path = os.path.join(self.index_path, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
@@ -1,9 +1,93 @@
-from openai import OpenAI
-import torch
-from transformers import pipeline
+import asyncio
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.async_clients import close_stale_client
+from src.instrumentation import get_tracer
+from src.model_registry import get_model_registry
+
+
+def resolve_torch_dtype(torch_dtype='auto', cuda_available=None):
+    """
+    Escolhe o tipo numérico dos pesos do modelo local.
+
+    Parâmetros:
+    - torch_dtype: 'auto', um nome ('float32', 'bfloat16', 'float16') ou um torch.dtype.
+    - cuda_available: Se há GPU; por padrão, consulta torch.cuda.is_available().
+
+    Retorna:
+    - Com 'auto': float16 na GPU; na CPU, bfloat16 se o processador tiver suporte nativo (AVX512-BF16/AMX)
+      e float32 caso contrário, já que float16 na CPU é lento ou não suportado em muitas operações.
+    """
+    import torch
+
+    if isinstance(torch_dtype, torch.dtype):
+        return torch_dtype
+    if torch_dtype != 'auto':
+        dtype = getattr(torch, torch_dtype, None)
+        if not isinstance(dtype, torch.dtype):
+            raise ValueError(f"Tipo {torch_dtype} não é suportado.")
+        return dtype
+
+    if cuda_available is None:
+        cuda_available = torch.cuda.is_available()
+    if cuda_available:
+        return torch.float16
+    supports_bf16 = getattr(torch.cpu, '_is_avx512_bf16_supported', None)
+    return torch.bfloat16 if supports_bf16 is not None and supports_bf16() else torch.float32
+
+
+def _load_text_generation(name, torch_dtype, quantize, device):
+    """
+    Carrega o pipeline de geração de texto do Hugging Face (carregador do registro de modelos).
+    """
+    import torch
+    from transformers import pipeline
+
+    generator = pipeline(
+        "text-generation",
+        model=name,
+        pad_token_id=50256,  # Especifica o token de preenchimento adequado ao modelo
+        truncation=True,  # Trunca a entrada longa automaticamente
+        device=device,  # Define GPU se disponível
+        torch_dtype=resolve_torch_dtype(torch_dtype)
+    )
+
+    if quantize:
+        generator.model = torch.ao.quantization.quantize_dynamic(
+            generator.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    # Geração em lote: o preenchimento fica à esquerda, para que todos os prompts de um lote terminem na
+    # mesma posição e a geração continue logo após o texto de cada um
+    tokenizer = generator.tokenizer
+    tokenizer.padding_side = 'left'
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return generator
+
+
+def _stop_on_event(event):
+    """
+    Cria um critério de parada que interrompe a geração do modelo local quando o evento é sinalizado
+    (ex: o consumidor do streaming desistiu).
+    """
+    from transformers import StoppingCriteria
+
+    class StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return event.is_set()
+
+    return StopOnEvent()
+
 
 class LLM:
-    def __init__(self, method='openai', openai_api_key=None, local_model_name="EleutherAI/gpt-neo-2.7B"):
+    # Janela de contexto (em tokens) do modelo de chat usado no método 'openai'
+    OPENAI_CONTEXT_WINDOW = 16385
+
+    def __init__(self, method='openai', openai_api_key=None, local_model_name="EleutherAI/gpt-neo-2.7B",
+                 torch_dtype='auto', quantize=False, prompt_prefix=None, model_registry=None):
         """
         Inicializa a classe LLM com base no método desejado para gerar respostas.
 
@@ -11,28 +95,220 @@ class LLM:
         - method: Define qual método será usado, 'openai' para a API da OpenAI ou 'local' para um modelo local do Hugging Face.
         - openai_api_key: Chave da API da OpenAI, necessária se o método escolhido for 'openai'.
         - local_model_name: Nome do modelo local a ser usado (disponível no Hugging Face), necessário se o método escolhido for 'local'.
+        - torch_dtype: Tipo dos pesos do modelo local; 'auto' escolhe float16 na GPU e bfloat16 ou float32 na CPU
+                       (veja resolve_torch_dtype).
+        - quantize: Se True, aplica quantização dinâmica int8 às camadas lineares do modelo local (apenas na CPU;
+                    os pesos são carregados em float32 para isso). Reduz a memória e acelera a geração na CPU.
+        - prompt_prefix: Início fixo, comum a todos os prompts (ex: as instruções do RAGSystem). O estado (KV cache)
+                         desse prefixo é calculado uma única vez, e cada prompt que começa com ele só processa o
+                         restante (contexto e pergunta) na geração local.
+        - model_registry: ModelRegistry de onde o modelo local é obtido (compartilhado com outros LLMs do processo).
+                          Por padrão, o registro do processo.
+
+        Nenhum modelo ou cliente é criado na construção: o modelo local (e o cliente da OpenAI) são carregados no
+        primeiro uso ou em warmup().
         """
         self.method = method
+        self._load_lock = threading.Lock()
         if method == 'openai':
             if openai_api_key is None:
                 raise ValueError("Chave da API da OpenAI é necessária para usar OpenAI LLM.")
-            self.client = OpenAI(api_key=openai_api_key)
+            self.openai_api_key = openai_api_key
+            self._client = None
+            # Cliente assíncrono usado por agenerate_response, preso ao event loop em que foi criado
+            self._async_client = None
+            self._async_client_loop = None
         elif method == 'local':
-            # Detecta se uma GPU está disponível e escolhe o dispositivo adequado (GPU ou CPU).
-            device = 0 if torch.cuda.is_available() else -1  # 0 para GPU, -1 para CPU
-
-            # Inicializa o pipeline de geração de texto do Hugging Face
-            self.generator = pipeline(
-                "text-generation",
-                model=local_model_name,
-                pad_token_id=50256,  # Especifica o token de preenchimento adequado ao modelo
-                truncation=True,  # Trunca a entrada longa automaticamente
-                device=device,  # Define GPU se disponível
-                torch_dtype=torch.float16  # Usa half-precision (FP16) para reduzir o uso de memória
-            )
+            self.local_model_name = local_model_name
+            # Tipo e quantização pedidos; os efetivos são definidos quando o modelo é carregado
+            self.torch_dtype = torch_dtype
+            self.quantize = quantize
+            self.prompt_prefix = prompt_prefix
+            self.model_registry = model_registry
+            self._generator_handle = None
+            self._context_window = None
+            self._prefix_ids, self._prefix_cache = None, None
+            self._prefix_ready = False
         else:
             raise ValueError("Método de LLM inválido.")
 
+    @property
+    def client(self):
+        """
+        Cliente síncrono da OpenAI, criado no primeiro uso (apenas no método 'openai').
+        """
+        if self._client is None:
+            with self._load_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.openai_api_key)
+        return self._client
+
+    @property
+    def generator(self):
+        """
+        Pipeline de geração de texto do modelo local, obtido do registro de modelos no primeiro uso (apenas no
+        método 'local'). LLMs com o mesmo modelo, tipo, quantização e dispositivo compartilham o mesmo pipeline.
+        """
+        if self._generator_handle is None:
+            with self._load_lock:
+                if self._generator_handle is None:
+                    self._load_local_model()
+        return self._generator_handle.model
+
+    def _load_local_model(self):
+        """
+        Obtém do registro o modelo local, com o tipo e a quantização escolhidos.
+        """
+        import torch
+
+        # Detecta se uma GPU está disponível e escolhe o dispositivo adequado (GPU ou CPU).
+        cuda_available = torch.cuda.is_available()
+        device = 0 if cuda_available else -1  # 0 para GPU, -1 para CPU
+
+        # A quantização dinâmica int8 só existe na CPU e parte de pesos float32
+        quantize = self.quantize and not cuda_available
+        torch_dtype = torch.float32 if quantize else resolve_torch_dtype(self.torch_dtype, cuda_available)
+
+        registry = self.model_registry or get_model_registry()
+        handle = registry.acquire('text-generation', self.local_model_name, _load_text_generation,
+                                  torch_dtype=str(torch_dtype).replace('torch.', ''), quantize=quantize,
+                                  device=device)
+
+        self.quantize = quantize
+        self.torch_dtype = torch_dtype
+        self._context_window = getattr(handle.model.model.config, 'max_position_embeddings', None) or 2048
+        self._generator_handle = handle
+
+    def _get_prefix_cache(self, generator):
+        """
+        Retorna os IDs e o KV cache do prefixo dos prompts deste LLM, calculados na primeira geração.
+        """
+        if self.prompt_prefix and not self._prefix_ready:
+            with self._load_lock:
+                if not self._prefix_ready:
+                    self._prefix_ids, self._prefix_cache = self._build_prefix_cache(generator, self.prompt_prefix)
+                    self._prefix_ready = True
+        return self._prefix_ids, self._prefix_cache
+
+    def close(self):
+        """
+        Devolve o modelo local ao registro (ele é obtido de novo se o LLM voltar a ser usado).
+        """
+        if self.method != 'local':
+            return
+        with self._load_lock:
+            if self._generator_handle is not None:
+                self._generator_handle.release()
+                self._generator_handle = None
+            self._prefix_ids, self._prefix_cache = None, None
+            self._prefix_ready = False
+
+    @property
+    def context_window(self):
+        """
+        Janela de contexto (em tokens) do modelo. No modelo local ainda não carregado, é lida apenas da
+        configuração do modelo, sem carregar os pesos.
+        """
+        if self.method == 'openai':
+            return self.OPENAI_CONTEXT_WINDOW
+        if self._context_window is None:
+            from transformers import AutoConfig
+            config = AutoConfig.from_pretrained(self.local_model_name)
+            self._context_window = getattr(config, 'max_position_embeddings', None) or 2048
+        return self._context_window
+
+    def warmup(self, run_inference=True):
+        """
+        Carrega o modelo local (ou cria o cliente da OpenAI) e, com run_inference, gera um token de teste (o que
+        também calcula o KV cache do prefixo), para que a primeira consulta não pague o custo de carregamento e
+        inicialização.
+        """
+        if self.method == 'openai':
+            return self.client
+        self.generator
+        if run_inference:
+            self._generate_local("warmup", max_new_tokens=1, temperature=0.7)
+
+    def count_tokens(self, text):
+        """
+        Conta os tokens de um texto com o tokenizer do modelo local. Para a OpenAI, cujo tokenizer não está
+        disponível localmente, usa uma estimativa conservadora (cerca de 3 caracteres por token).
+        """
+        if self.method == 'local':
+            return len(self.generator.tokenizer(text, add_special_tokens=False).input_ids)
+        return len(text) // 3 + 1
+
+    def max_prompt_tokens(self, max_new_tokens=100):
+        """
+        Retorna o número máximo de tokens do prompt que ainda deixa espaço para max_new_tokens tokens gerados.
+        """
+        return self.context_window - max_new_tokens
+
+    @staticmethod
+    def _build_prefix_cache(generator, prefix):
+        """
+        Processa o prefixo fixo dos prompts uma única vez e guarda seus IDs e seu KV cache.
+        Se o modelo não suportar o reaproveitamento do cache, a geração segue sem ele.
+        """
+        import torch
+        from transformers import DynamicCache
+
+        model = generator.model
+        try:
+            prefix_ids = generator.tokenizer(prefix, return_tensors='pt').input_ids.to(model.device)
+            with torch.no_grad():
+                prefix_cache = model(prefix_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+        except Exception:
+            get_tracer().count('prefix_cache_errors')
+            return None, None
+        return prefix_ids, prefix_cache
+
+    def _generate_local(self, prompt, max_new_tokens, temperature, **generate_kwargs):
+        """
+        Gera o texto de um prompt com o modelo local, retornando apenas a continuação, sem o prompt (o mesmo texto
+        que o streaming produz).
+
+        Se o prompt começa com o prefixo cujo KV cache foi calculado e cabe na janela de contexto junto com os
+        max_new_tokens tokens gerados, model.generate recebe uma cópia desse cache e processa apenas os tokens
+        restantes; caso contrário, usa o pipeline (que trunca o prompt).
+        """
+        generator = self.generator
+        prefix_ids, prefix_cache = self._get_prefix_cache(generator)
+        if prefix_cache is not None:
+            import torch
+
+            tokenizer = generator.tokenizer
+            input_ids = tokenizer(prompt, return_tensors='pt').input_ids.to(generator.model.device)
+            n_prefix = prefix_ids.shape[1]
+            # A tokenização do prompt precisa começar exatamente pelos tokens do prefixo, e o prompt não pode
+            # passar da janela de contexto (o caminho com cache não trunca)
+            fits = input_ids.shape[1] + max_new_tokens <= self.context_window
+            if fits and input_ids.shape[1] > n_prefix and torch.equal(input_ids[0, :n_prefix], prefix_ids[0]):
+                with torch.no_grad():
+                    output = generator.model.generate(
+                        input_ids,
+                        attention_mask=torch.ones_like(input_ids),
+                        past_key_values=copy.deepcopy(prefix_cache),
+                        max_new_tokens=max_new_tokens,
+                        do_sample=True,
+                        temperature=temperature,
+                        pad_token_id=tokenizer.pad_token_id,
+                        **generate_kwargs
+                    )
+                continuation = output[0, input_ids.shape[1]:]
+                return [{'generated_text': tokenizer.decode(continuation, skip_special_tokens=True)}]
+
+        return generator(
+            prompt,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=temperature,
+            truncation=True,  # Trunca a resposta se ela exceder o número máximo de tokens
+            return_full_text=False,
+            **generate_kwargs
+        )
+
     def generate_response(self, prompt, max_new_tokens=100, temperature=0.7):
         """
         Gera uma resposta para o prompt dado, usando o método definido (OpenAI ou local).
@@ -43,36 +319,198 @@ class LLM:
         - temperature: Define a aleatoriedade da geração de texto (valores mais baixos produzem respostas mais determinísticas).
 
         Retorna:
-        - A resposta gerada pelo modelo em forma de string.
+        - A resposta gerada pelo modelo em forma de string (no modelo local, apenas o texto gerado, sem o prompt).
         """
         if self.method == 'openai':
             # Faz uma requisição à API da OpenAI e obtém a resposta
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo-0125",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            response = self.client.chat.completions.create(**self._chat_request(prompt))
             # Extrai e retorna o conteúdo da resposta
-            answer = response['choices'][0]['message']['content'].strip()
-            return answer
+            return self._extract_openai_answer(response)
 
         elif self.method == 'local':
             # Gera uma resposta usando o modelo local
-            response = self.generator(
-                prompt,
-                max_new_tokens=max_new_tokens,
-                do_sample=True,
-                temperature=temperature,
-                truncation=True  # Trunca a resposta se ela exceder o número máximo de tokens
-            )
-
-            # Verifica o conteúdo da resposta gerada pelo modelo local
-            print(f"Resposta do modelo local: {response}")
+            response = self._generate_local(prompt, max_new_tokens, temperature)
 
             # Extrai e retorna o texto gerado corretamente
-            answer = response[0]['generated_text'].strip() if 'generated_text' in response[0] else response[0]['text'].strip()
+            answer = self._extract_local_answer(response)
+            self._count_local_tokens(prompt, answer)
             return answer
+
+    def generate_response_stream(self, prompt, max_new_tokens=100, temperature=0.7):
+        """
+        Gera uma resposta em streaming, produzindo os trechos de texto à medida que o modelo os gera.
+
+        Na OpenAI, usa stream=True; no modelo local, a geração roda em uma thread e os tokens são lidos de um
+        TextIteratorStreamer (apenas o texto novo, sem o prompt). Se o consumidor parar de ler, a geração local é
+        interrompida no próximo token.
+
+        Parâmetros:
+        - prompt, max_new_tokens, temperature: Como em generate_response.
+
+        Retorna:
+        - Um gerador de trechos de texto da resposta.
+        """
+        if self.method == 'openai':
+            stream = self.client.chat.completions.create(**self._chat_request(prompt), stream=True)
+            try:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+            finally:
+                stream.close()
+            return
+
+        from transformers import StoppingCriteriaList, TextIteratorStreamer
+
+        streamer = TextIteratorStreamer(self.generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        stop = threading.Event()
+        errors = []
+
+        def generate():
+            try:
+                self._generate_local(prompt, max_new_tokens, temperature, streamer=streamer,
+                                     stopping_criteria=StoppingCriteriaList([_stop_on_event(stop)]))
+            except Exception as error:
+                errors.append(error)
+                # Libera o consumidor, que de outra forma esperaria pelo próximo token indefinidamente
+                streamer.end()
+
+        thread = threading.Thread(target=generate, name="llm-stream", daemon=True)
+        thread.start()
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            stop.set()
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    @staticmethod
+    def _chat_request(prompt):
+        return {
+            'model': "gpt-3.5-turbo-0125",
+            'messages': [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+
+    @staticmethod
+    def _extract_openai_answer(response):
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            tracer = get_tracer()
+            tracer.count('llm_prompt_tokens', usage.prompt_tokens)
+            tracer.count('llm_completion_tokens', usage.completion_tokens)
+        return response.choices[0].message.content.strip()
+
+    def _count_local_tokens(self, prompt, answer):
+        """
+        Registra no tracer os tokens do prompt e os gerados pelo modelo local (a resposta não inclui o prompt).
+        A contagem só é feita com a instrumentação habilitada.
+        """
+        tracer = get_tracer()
+        if tracer.enabled:
+            tracer.count('llm_prompt_tokens', self.count_tokens(prompt))
+            tracer.count('llm_completion_tokens', self.count_tokens(answer))
+
+    @staticmethod
+    def _extract_local_answer(response):
+        return response[0]['generated_text'].strip() if 'generated_text' in response[0] else response[0]['text'].strip()
+
+    async def agenerate_response(self, prompt, max_new_tokens=100, temperature=0.7, executor=None):
+        """
+        Versão assíncrona de generate_response. Na OpenAI, a requisição é assíncrona (sem ocupar uma thread);
+        o modelo local (trabalho de CPU/GPU) é executado no executor, sem bloquear o event loop.
+
+        Parâmetros:
+        - prompt, max_new_tokens, temperature: Como em generate_response.
+        - executor: Executor limitado para o modelo local. Se None, usa o executor padrão do event loop.
+
+        Retorna:
+        - A resposta gerada pelo modelo em forma de string.
+        """
+        loop = asyncio.get_running_loop()
+        if self.method == 'openai':
+            if self._async_client is None or self._async_client_loop is not loop:
+                from openai import AsyncOpenAI
+                # O cliente de um event loop anterior (ex: outro asyncio.run) é fechado antes de ser substituído
+                if self._async_client is not None:
+                    stale, stale_loop = self._async_client, self._async_client_loop
+                    self._async_client = None
+                    await close_stale_client(stale, stale_loop)
+                self._async_client = AsyncOpenAI(api_key=self.openai_api_key)
+                self._async_client_loop = loop
+            response = await self._async_client.chat.completions.create(**self._chat_request(prompt))
+            return self._extract_openai_answer(response)
+
+        return await loop.run_in_executor(
+            executor, lambda: self.generate_response(prompt, max_new_tokens=max_new_tokens, temperature=temperature)
+        )
+
+    async def aclose(self):
+        """
+        Fecha as conexões do cliente assíncrono da OpenAI usado por agenerate_response.
+        """
+        if self.method == 'openai' and self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self._async_client_loop = None
+
+    def generate_responses(self, prompts, max_new_tokens=100, temperature=0.7, batch_size=8, max_concurrency=8):
+        """
+        Gera respostas para vários prompts de uma vez.
+
+        No modelo local, os prompts são ordenados por tamanho (reduzindo o preenchimento) e enviados ao pipeline em
+        lotes de batch_size, preenchidos à esquerda. Se o KV cache do prefixo estiver disponível, cada prompt é
+        gerado como em generate_response (reaproveitando o cache, que não serve a um lote preenchido à esquerda), de
+        modo que a resposta em lote é calculada da mesma forma que a individual. Na OpenAI, até max_concurrency
+        requisições são feitas em paralelo.
+
+        Parâmetros:
+        - prompts: Lista de prompts.
+        - max_new_tokens, temperature: Como em generate_response.
+        - batch_size: Número de prompts por lote do modelo local.
+        - max_concurrency: Número máximo de requisições simultâneas à OpenAI.
+
+        Retorna:
+        - A lista de respostas, na ordem dos prompts.
+        """
+        prompts = list(prompts)
+        if not prompts:
+            return []
+
+        if self.method == 'openai':
+            if len(prompts) == 1:
+                return [self.generate_response(prompts[0], max_new_tokens=max_new_tokens, temperature=temperature)]
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                return list(executor.map(
+                    lambda prompt: self.generate_response(prompt, max_new_tokens=max_new_tokens, temperature=temperature),
+                    prompts
+                ))
+
+        if self._get_prefix_cache(self.generator)[1] is not None:
+            return [self.generate_response(prompt, max_new_tokens=max_new_tokens, temperature=temperature)
+                    for prompt in prompts]
+
+        order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+        responses = self.generator(
+            [prompts[i] for i in order],
+            batch_size=batch_size,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=temperature,
+            truncation=True,
+            return_full_text=False
+        )
+
+        answers = [None] * len(prompts)
+        for i, response in zip(order, responses):
+            answers[i] = self._extract_local_answer(response)
+            self._count_local_tokens(prompts[i], answers[i])
+        return answers
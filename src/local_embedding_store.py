@@ -0,0 +1,290 @@
+import json
+import os
+
+import numpy as np
+
+from src.embedding_store import BaseEmbeddingStore
+
+
+class LocalEmbeddingStore(BaseEmbeddingStore):
+    VECTORS_FILE = "vectors.npy"
+    NORMS_FILE = "norms.npy"
+    IDS_FILE = "ids.json"
+
+    METRICS = ('euclidean', 'cosine', 'dotproduct')
+
+    def __init__(self, dimension=384, index_path=None, metric='euclidean', mmap=True):
+        """
+        Inicializa um armazenamento de embeddings em memória, sem dependência de rede.
+
+        Todos os vetores ficam em uma única matriz contígua float32 (n, dimension), e a busca é exata:
+        um único produto matriz-vetor seguido de np.argpartition para selecionar os top_k.
+
+        Parâmetros:
+        - dimension: Dimensão dos embeddings.
+        - index_path: Diretório onde o índice é salvo. Se já existir um índice salvo nesse diretório,
+                      ele é reaberto automaticamente (sem necessidade de refazer o upsert).
+        - metric: Métrica de similaridade: 'euclidean' (mesma do índice Pinecone criado pelo EmbeddingStore),
+                  'cosine' ou 'dotproduct'.
+        - mmap: Se True, o arquivo .npy salvo é aberto com memory-map em vez de ser lido inteiro para a memória.
+        """
+        if metric not in self.METRICS:
+            raise ValueError(f"Métrica {metric} não é suportada. Métricas disponíveis: {list(self.METRICS)}")
+
+        self.dimension = dimension
+        self.index_path = index_path
+        self.metric = metric
+        self.mmap = mmap
+
+        # Matriz com capacidade reservada; apenas as primeiras self._size linhas são válidas
+        self._vectors = np.empty((0, dimension), dtype=np.float32)
+        # Norma ao quadrado de cada linha, usada pela métrica euclidiana
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._ids = []
+        self._id_to_row = {}
+
+        if index_path and os.path.exists(os.path.join(index_path, self.VECTORS_FILE)):
+            self.load()
+
+    def __len__(self):
+        return self._size
+
+    def _ensure_capacity(self, capacity):
+        """
+        Garante que a matriz de vetores comporte ao menos `capacity` linhas e seja gravável.
+        A capacidade cresce de forma geométrica para que upserts sucessivos tenham custo amortizado constante.
+        """
+        writable = self._vectors.flags.writeable and not isinstance(self._vectors, np.memmap)
+        if writable and self._vectors.shape[0] >= capacity:
+            return
+
+        new_capacity = max(capacity, 2 * self._vectors.shape[0], 1024)
+        vectors = np.empty((new_capacity, self.dimension), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        sq_norms = np.empty(new_capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        self._vectors = vectors
+        self._sq_norms = sq_norms
+
+    def _as_matrix(self, embeddings):
+        """
+        Converte uma lista de embeddings (ou uma matriz) em uma matriz float32 contígua (n, dimension).
+        """
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Dimensão do embedding ({matrix.shape[1]}) difere da dimensão do índice ({self.dimension}).")
+
+        if self.metric == 'cosine':
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms > 0, norms, 1.0)
+        return matrix
+
+    def store_embeddings(self, embeddings, ids=None, metadatas=None):
+        """
+        Armazena embeddings no índice local. IDs já existentes têm seus vetores substituídos (semântica de upsert).
+        - embeddings: lista (ou matriz) de embeddings a serem armazenados.
+        - ids: lista de IDs associada aos embeddings.
+        - metadatas: ignorado; os metadados dos chunks ficam no ChunkStore.
+        """
+        if len(embeddings) == 0:
+            return
+        matrix = self._as_matrix(embeddings)
+        if ids is None:
+            ids = [str(i) for i in range(len(matrix))]
+        if len(ids) != len(matrix):
+            raise ValueError("O número de IDs deve ser igual ao número de embeddings.")
+
+        # Resolve a linha de cada ID, reservando novas linhas no final da matriz para IDs inéditos
+        rows = np.empty(len(ids), dtype=np.int64)
+        next_row = self._size
+        for i, vector_id in enumerate(ids):
+            vector_id = str(vector_id)
+            row = self._id_to_row.get(vector_id)
+            if row is None:
+                row = next_row
+                self._id_to_row[vector_id] = row
+                self._ids.append(vector_id)
+                next_row += 1
+            rows[i] = row
+
+        self._ensure_capacity(next_row)
+        self._vectors[rows] = matrix
+        self._sq_norms[rows] = np.einsum('ij,ij->i', matrix, matrix)
+        self._size = next_row
+        self._on_rows_updated(rows)
+
+    def _on_rows_updated(self, rows):
+        """
+        Chamado após cada upsert com as linhas da matriz que foram inseridas ou substituídas.
+        Subclasses que mantêm estruturas auxiliares (ex.: índices aproximados) a atualizam aqui.
+        """
+        pass
+
+    def delete(self, ids):
+        """
+        Remove embeddings do índice local (IDs inexistentes são ignorados). Cada linha removida é preenchida
+        com a última linha da matriz, mantendo os vetores contíguos.
+        - ids: lista de IDs a serem removidos.
+        """
+        moves = []
+        for vector_id in ids:
+            row = self._id_to_row.pop(str(vector_id), None)
+            if row is None:
+                continue
+            # Garante que a matriz seja gravável (um índice reaberto com mmap é somente leitura)
+            self._ensure_capacity(self._size)
+
+            last = self._size - 1
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                moved_id = self._ids[last]
+                self._ids[row] = moved_id
+                self._id_to_row[moved_id] = row
+                moves.append((last, row))
+            self._ids.pop()
+            self._size -= 1
+            moves.append((last, None))
+
+        if moves:
+            self._on_rows_moved(moves)
+
+    def _on_rows_moved(self, moves):
+        """
+        Chamado após uma remoção com a lista de movimentações (linha de origem, linha de destino), na ordem em
+        que ocorreram; destino None indica que a linha de origem foi descartada.
+        """
+        pass
+
+    def _scores(self, queries):
+        """
+        Calcula os scores de uma matriz de consultas (q, dimension) contra todos os vetores com um único
+        produto matriz-matriz, retornando uma matriz (q, n).
+        Para 'euclidean' o score é a distância ao quadrado (menor é melhor); para as demais, maior é melhor.
+        """
+        dots = queries @ self._vectors[:self._size].T
+        if self.metric == 'euclidean':
+            return self._sq_norms[:self._size] - 2.0 * dots + np.einsum('ij,ij->i', queries, queries)[:, None]
+        return dots
+
+    def _top_k(self, scores, top_k):
+        """
+        Seleciona os índices dos top_k melhores scores com np.argpartition e os ordena.
+        """
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        # Para a métrica euclidiana, menor distância é melhor; invertemos o sinal para usar a mesma seleção
+        keys = scores if self.metric == 'euclidean' else -scores
+        if k < scores.shape[0]:
+            candidates = np.argpartition(keys, k - 1)[:k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        return candidates[np.argsort(keys[candidates], kind='stable')]
+
+    def search(self, query_embedding, top_k=5, namespace=None):
+        """
+        Busca exata dos embeddings mais próximos no índice local.
+        - query_embedding: embedding da consulta.
+        - top_k: número de resultados a serem retornados.
+        - namespace: ignorado; mantido para compatibilidade com o EmbeddingStore do Pinecone.
+
+        Retorna:
+        - Uma lista de matches no formato {'id': ..., 'score': ...}, do mais para o menos relevante.
+        """
+        return self._exact_search_batch(self._as_matrix(query_embedding)[:1], top_k)[0]
+
+    def search_batch(self, query_embeddings, top_k=5, namespace=None, max_block_bytes=64 * 2 ** 20):
+        """
+        Busca exata para várias consultas de uma vez: os scores de cada bloco de consultas são calculados com um
+        único produto matriz-matriz, e o resultado de cada consulta é o mesmo de search.
+        - query_embeddings: lista (ou matriz) de embeddings das consultas.
+        - top_k: número de resultados a serem retornados por consulta.
+        - namespace: ignorado; mantido para compatibilidade com o EmbeddingStore do Pinecone.
+        - max_block_bytes: tamanho máximo da matriz de scores de um bloco de consultas, para limitar a memória.
+
+        Retorna:
+        - Uma lista com a lista de matches de cada consulta, na ordem das consultas.
+        """
+        return self._exact_search_batch(self._as_matrix(query_embeddings), top_k, max_block_bytes)
+
+    def _exact_search_batch(self, queries, top_k, max_block_bytes=64 * 2 ** 20):
+        if self._size == 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        block = max(1, max_block_bytes // (4 * self._size))
+        results = []
+        for start in range(0, queries.shape[0], block):
+            scores = self._scores(queries[start:start + block])
+            for row_scores in scores:
+                results.append([{'id': self._ids[row], 'score': float(row_scores[row])}
+                                for row in self._top_k(row_scores, top_k)])
+        return results
+
+    def save(self):
+        """
+        Salva o índice em index_path (vetores e normas em .npy, IDs em JSON).
+        Os arquivos são escritos em arquivos temporários e renomeados, para que um worker lendo o índice
+        nunca encontre um arquivo pela metade. Sem index_path, o índice vive apenas em memória e nada é salvo.
+        """
+        if not self.index_path:
+            return
+        os.makedirs(self.index_path, exist_ok=True)
+
+        self._write_npy(self.VECTORS_FILE, self._vectors[:self._size])
+        self._write_npy(self.NORMS_FILE, self._sq_norms[:self._size])
+        self._write_json(self.IDS_FILE, self._ids)
+
+    def load(self):
+        """
+        Reabre um índice salvo em index_path. Com mmap=True, os vetores são mapeados em memória (somente leitura)
+        e só são copiados para a RAM no primeiro upsert.
+        """
+        mmap_mode = 'r' if self.mmap else None
+        self._vectors = np.load(os.path.join(self.index_path, self.VECTORS_FILE), mmap_mode=mmap_mode)
+        if self._vectors.shape[1] != self.dimension:
+            raise ValueError(f"O índice salvo tem dimensão {self._vectors.shape[1]}, mas a dimensão esperada é {self.dimension}.")
+
+        norms_path = os.path.join(self.index_path, self.NORMS_FILE)
+        if os.path.exists(norms_path):
+            self._sq_norms = np.load(norms_path, mmap_mode=mmap_mode)
+        else:
+            self._sq_norms = np.einsum('ij,ij->i', self._vectors, self._vectors).astype(np.float32)
+
+        with open(os.path.join(self.index_path, self.IDS_FILE), 'r', encoding='utf-8') as file:
+            self._ids = json.load(file)
+        self._id_to_row = {vector_id: row for row, vector_id in enumerate(self._ids)}
+        self._size = len(self._ids)
+
+    def delete_index(self):
+        """
+        Remove todos os vetores do índice local e apaga os arquivos salvos em index_path.
+        """
+        self._vectors = np.empty((0, self.dimension), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._ids = []
+        self._id_to_row = {}
+
+        if self.index_path:
+            for file_name in (self.VECTORS_FILE, self.NORMS_FILE, self.IDS_FILE):
+                path = os.path.join(self.index_path, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _write_npy(self, file_name, array):
+        path = os.path.join(self.index_path, file_name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            np.save(file, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+
+    def _write_json(self, file_name, data):
+        path = os.path.join(self.index_path, file_name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+
+def make_chunk_id(source, page, occurrence, text):
+    """
+    Gera um ID estável para um chunk, derivado do seu conteúdo.
+
+    Parâmetros:
+    - source: Caminho do documento de origem.
+    - page: Número da página do chunk.
+    - occurrence: Quantas vezes o mesmo texto já apareceu antes na mesma página (diferencia chunks repetidos).
+    - text: Texto do chunk.
+
+    Retorna:
+    - Um ID hexadecimal que só muda quando o texto, a página ou o documento do chunk mudam, de forma que
+      inserir texto em outro ponto do documento não altera os IDs dos demais chunks.
+    """
+    digest = hashlib.sha1()
+    for part in (source, str(page), str(occurrence), text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+    def __init__(self, path=None):
+        """
+        Inicializa o manifesto de ingestão, que registra o que já foi indexado de cada documento.
+
+        Para cada documento são guardados o fingerprint do arquivo, a configuração usada na indexação
+        (chunking e modelo de embeddings) e, para cada página, o fingerprint da página e os IDs dos chunks
+        gerados a partir dela. Comparando esses fingerprints, o prepare_data reprocessa apenas as páginas alteradas.
+
+        Parâmetros:
+        - path: Caminho do arquivo JSON do manifesto. Se None, o manifesto vive apenas em memória.
+        """
+        self.path = path
+        self.documents = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.documents = json.load(file).get('documents', {})
+
+    def get(self, source):
+        """
+        Retorna o registro do documento ({'fingerprint', 'config', 'pages'}) ou None se ele ainda não foi indexado.
+        """
+        return self.documents.get(source)
+
+    def update(self, source, fingerprint, config, pages):
+        """
+        Registra o estado indexado de um documento.
+
+        Parâmetros:
+        - source: Caminho do documento.
+        - fingerprint: Fingerprint do arquivo inteiro.
+        - config: Configuração usada na indexação.
+        - pages: Dicionário {número da página (str): {'fingerprint': ..., 'chunk_ids': [...]}}.
+        """
+        self.documents[source] = {'fingerprint': fingerprint, 'config': config, 'pages': pages}
+
+    def remove(self, source):
+        self.documents.pop(source, None)
+
+    def save(self):
+        """
+        Salva o manifesto em path (escrita atômica). Sem path, nada é salvo.
+        """
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'documents': self.documents}, file)
+        os.replace(tmp_path, self.path)
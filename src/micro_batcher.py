@@ -0,0 +1,148 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    # Limites superiores dos buckets do histograma de tamanhos de lote
+    BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+    # Limites superiores dos buckets do histograma da profundidade da fila, observada a cada lote formado
+    QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+    def __init__(self, handler, max_batch_size=16, max_wait_ms=10):
+        """
+        Agrupa requisições que chegam concorrentemente em micro-lotes processados por uma única chamada.
+
+        Uma thread de trabalho espera a primeira requisição e, a partir dela, aguarda até max_wait_ms por mais
+        requisições (ou até juntar max_batch_size), chamando então handler com o lote inteiro. Assim, sob carga, os
+        modelos (SBERT e LLM local) processam lotes em vez de itens isolados; com pouca carga, a latência extra
+        é de no máximo max_wait_ms.
+
+        Parâmetros:
+        - handler: Função que recebe uma lista de itens e retorna a lista de resultados, na mesma ordem.
+        - max_batch_size: Número máximo de itens por lote.
+        - max_wait_ms: Tempo máximo, em milissegundos, que o primeiro item de um lote espera por outros.
+        """
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_size_counts = [0] * (len(self.BATCH_SIZE_BUCKETS) + 1)
+        self._batch_size_sum = 0
+        self._queue_depth_counts = [0] * (len(self.QUEUE_DEPTH_BUCKETS) + 1)
+        self._queue_depth_sum = 0
+        self._batches = 0
+        self._failed_batches = 0
+
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """
+        Enfileira um item para o próximo lote.
+
+        Retorna:
+        - Um concurrent.futures.Future com o resultado do item (ou a exceção levantada pelo handler).
+        """
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        """
+        Processa os itens já enfileirados e encerra a thread de trabalho.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        """
+        Monta um lote a partir do primeiro item, esperando pelos demais até o prazo ou o tamanho máximo.
+        Retorna o lote e um indicador de que o sinal de encerramento foi recebido.
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self):
+        closing = False
+        while not closing:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, closing = self._collect(first)
+            # Requisições canceladas pelo cliente enquanto esperavam não entram no lote
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            # Consultas que ficaram na fila depois de o lote ser formado
+            self._record(len(batch), self._queue.qsize())
+
+            try:
+                results = list(self.handler([item for item, _ in batch]))
+            except Exception as error:
+                with self._lock:
+                    self._failed_batches += 1
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            if len(results) != len(batch):
+                # Sem um resultado, os demais itens esperariam indefinidamente
+                with self._lock:
+                    self._failed_batches += 1
+                error = ValueError(f"O handler retornou {len(results)} resultados para um lote de {len(batch)} itens.")
+                for _, future in batch[len(results):]:
+                    future.set_exception(error)
+
+    @staticmethod
+    def _bucket(buckets, value):
+        return next((i for i, limit in enumerate(buckets) if value <= limit), len(buckets))
+
+    def _record(self, batch_size, queue_depth):
+        with self._lock:
+            self._batch_size_counts[self._bucket(self.BATCH_SIZE_BUCKETS, batch_size)] += 1
+            self._batch_size_sum += batch_size
+            self._queue_depth_counts[self._bucket(self.QUEUE_DEPTH_BUCKETS, queue_depth)] += 1
+            self._queue_depth_sum += queue_depth
+            self._batches += 1
+
+    def _histogram(self, buckets, counts):
+        histogram = {}
+        cumulative = 0
+        for limit, count in zip(buckets, counts):
+            cumulative += count
+            histogram[str(limit)] = cumulative
+        histogram['+Inf'] = self._batches
+        return histogram
+
+    def metrics(self):
+        """
+        Retorna as métricas do agrupamento: profundidade atual da fila, número de lotes (e de lotes com falha) e,
+        para os tamanhos dos lotes e para a profundidade da fila observada a cada lote formado, a soma e o
+        histograma cumulativo ({limite superior: lotes com até esse valor}, com '+Inf' para o total), no formato
+        de um histograma do Prometheus.
+        """
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'failed_batches': self._failed_batches,
+                'batch_size_sum': self._batch_size_sum,
+                'batch_size_histogram': self._histogram(self.BATCH_SIZE_BUCKETS, self._batch_size_counts),
+                'queue_depth_sum': self._queue_depth_sum,
+                'queue_depth_histogram': self._histogram(self.QUEUE_DEPTH_BUCKETS, self._queue_depth_counts)
+            }
@@ -0,0 +1,218 @@
+import gc
+import threading
+import time
+
+
+class ModelHandle:
+    """
+    Referência a um modelo compartilhado do ModelRegistry. O modelo fica disponível em handle.model até
+    release(); handle.lock é compartilhado por todos os handles do mesmo modelo, para operações que alteram
+    o seu estado (a inferência com os pesos em modo somente leitura não precisa dele).
+    """
+
+    def __init__(self, registry, key, entry):
+        self._registry = registry
+        self.key = key
+        self._entry = entry
+
+    @property
+    def model(self):
+        if self._entry is None:
+            raise RuntimeError("O handle do modelo já foi liberado.")
+        return self._entry['model']
+
+    @property
+    def lock(self):
+        return self._entry['lock']
+
+    def release(self):
+        """
+        Devolve a referência ao registro (chamadas repetidas são ignoradas).
+        """
+        if self._entry is not None:
+            self._entry = None
+            self._registry._release(self.key)
+
+
+class ModelRegistry:
+    def __init__(self, idle_ttl_seconds=300):
+        """
+        Inicializa um registro de modelos compartilhados pelo processo inteiro.
+
+        Cada modelo é carregado uma única vez por chave (tipo, nome e opções como dtype e dispositivo), e todos os
+        componentes que pedem a mesma chave (ex: vários RAGSystem, um por índice ou cliente) recebem handles para a
+        mesma instância, em vez de cópias idênticas dos pesos. As referências são contadas: um modelo sem nenhum
+        handle em uso é removido depois de idle_ttl_seconds, liberando a memória.
+
+        Em servidores com processos pré-criados (fork), o processo pai pode carregar os modelos com preload() e
+        chamar freeze() antes de criar os workers, que passam a compartilhar os pesos copy-on-write.
+
+        Parâmetros:
+        - idle_ttl_seconds: Tempo, em segundos, que um modelo sem referências permanece carregado (0 para remover
+                            imediatamente; None para nunca remover).
+        """
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(kind, name, **options):
+        """
+        Monta a chave de um modelo: tipo, nome e opções de carregamento (ex: torch_dtype, device), em ordem.
+        """
+        return (kind, name) + tuple(sorted((option, str(value)) for option, value in options.items()))
+
+    def acquire(self, kind, name, loader, **options):
+        """
+        Retorna um handle para o modelo, carregando-o se ainda não estiver no registro.
+
+        Parâmetros:
+        - kind: Tipo do modelo (ex: 'sentence-transformer', 'text-generation', 'cross-encoder', 'spacy').
+        - name: Nome do modelo (ex: no Hugging Face).
+        - loader: Função chamada como loader(name, **options) para carregar o modelo. Apenas uma thread carrega
+                  cada chave; as demais esperam pelo mesmo modelo.
+        - options: Opções de carregamento, que fazem parte da chave.
+
+        Retorna:
+        - Um ModelHandle; chame handle.release() quando o modelo não for mais usado.
+        """
+        key = self.make_key(kind, name, **options)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {'model': None, 'lock': threading.RLock(), 'loaded': threading.Event(), 'error': None,
+                         'refs': 0, 'pinned': False, 'idle_since': None, 'timer': None}
+                self._entries[key] = entry
+                load = True
+            else:
+                load = False
+                self.hits += 1
+            entry['refs'] += 1
+            entry['idle_since'] = None
+            self._cancel_timer(entry)
+
+        if load:
+            try:
+                entry['model'] = loader(name, **options)
+                with self._lock:
+                    self.loads += 1
+            except BaseException as error:
+                entry['error'] = error
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                raise
+            finally:
+                entry['loaded'].set()
+        else:
+            entry['loaded'].wait()
+            if entry['error'] is not None:
+                raise entry['error']
+        return ModelHandle(self, key, entry)
+
+    def preload(self, kind, name, loader, **options):
+        """
+        Carrega um modelo e o mantém no registro enquanto o processo existir (nunca é removido por ociosidade).
+        Use no processo pai, antes de freeze() e de criar os workers.
+
+        Retorna:
+        - O modelo carregado.
+        """
+        handle = self.acquire(kind, name, loader, **options)
+        with self._lock:
+            handle._entry['pinned'] = True
+        return handle.model
+
+    @staticmethod
+    def freeze():
+        """
+        Prepara o processo para fork: coleta o lixo e move todos os objetos existentes (incluindo os modelos
+        carregados) para a geração permanente do coletor (gc.freeze). Assim, as coletas nos processos filhos não
+        escrevem nos cabeçalhos desses objetos, e as páginas de memória dos pesos continuam compartilhadas
+        copy-on-write entre os workers.
+        """
+        gc.collect()
+        gc.freeze()
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['refs'] -= 1
+            if entry['refs'] > 0 or entry['pinned'] or self.idle_ttl_seconds is None:
+                return
+            entry['idle_since'] = time.monotonic()
+            if self.idle_ttl_seconds <= 0:
+                self._evict(key)
+                return
+            timer = threading.Timer(self.idle_ttl_seconds, self._evict_if_idle, args=(key, entry))
+            timer.daemon = True
+            entry['timer'] = timer
+            timer.start()
+
+    def _evict_if_idle(self, key, entry):
+        with self._lock:
+            if self._entries.get(key) is entry and entry['refs'] == 0 and not entry['pinned']:
+                self._evict(key)
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        self._cancel_timer(entry)
+        entry['model'] = None
+        self.evictions += 1
+
+    @staticmethod
+    def _cancel_timer(entry):
+        if entry['timer'] is not None:
+            entry['timer'].cancel()
+            entry['timer'] = None
+
+    def evict_idle(self):
+        """
+        Remove imediatamente todos os modelos sem referências em uso (exceto os carregados com preload).
+
+        Retorna:
+        - O número de modelos removidos.
+        """
+        with self._lock:
+            idle = [key for key, entry in self._entries.items()
+                    if entry['refs'] == 0 and not entry['pinned'] and entry['loaded'].is_set()]
+            for key in idle:
+                self._evict(key)
+        if idle:
+            gc.collect()
+        return len(idle)
+
+    def stats(self):
+        """
+        Retorna os contadores do registro e, para cada modelo carregado, suas referências em uso.
+        """
+        with self._lock:
+            return {
+                'loads': self.loads,
+                'hits': self.hits,
+                'evictions': self.evictions,
+                'models': {key: {'refs': entry['refs'], 'pinned': entry['pinned']}
+                           for key, entry in self._entries.items()}
+            }
+
+
+_DEFAULT_REGISTRY = None
+_DEFAULT_REGISTRY_LOCK = threading.Lock()
+
+
+def get_model_registry():
+    """
+    Retorna o registro de modelos padrão do processo, usado pelos componentes que não recebem um registro.
+    """
+    global _DEFAULT_REGISTRY
+    if _DEFAULT_REGISTRY is None:
+        with _DEFAULT_REGISTRY_LOCK:
+            if _DEFAULT_REGISTRY is None:
+                _DEFAULT_REGISTRY = ModelRegistry()
+    return _DEFAULT_REGISTRY
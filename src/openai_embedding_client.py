@@ -0,0 +1,199 @@
+import asyncio
+import random
+import threading
+
+from src.async_clients import close_stale_client
+
+
+def _retryable_errors():
+    """
+    Erros transitórios para os quais a requisição é repetida com backoff exponencial.
+    """
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    return RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+
+
+def estimate_tokens(text):
+    """
+    Estimativa conservadora do número de tokens de um texto (cerca de 3 caracteres por token), usada para
+    montar lotes sem depender de um tokenizer.
+    """
+    return len(text) // 3 + 1
+
+
+class OpenAIEmbeddingClient:
+    def __init__(self, api_key, model="text-embedding-ada-002", max_batch_tokens=100000, max_batch_inputs=2048,
+                 max_concurrency=8, max_retries=6, initial_backoff=1.0, max_backoff=60.0,
+                 token_counter=estimate_tokens, transport=None, base_url=None):
+        """
+        Inicializa um cliente de embeddings da OpenAI que agrupa vários textos por requisição e envia os lotes
+        concorrentemente com asyncio.
+
+        Parâmetros:
+        - api_key: Chave da API da OpenAI.
+        - model: Modelo de embeddings.
+        - max_batch_tokens: Orçamento de tokens por requisição (soma estimada dos tokens dos textos do lote).
+        - max_batch_inputs: Número máximo de textos por requisição (a API aceita até 2048).
+        - max_concurrency: Número máximo de requisições em andamento ao mesmo tempo.
+        - max_retries: Número máximo de novas tentativas de um lote após erros de rate limit, timeout ou servidor.
+        - initial_backoff, max_backoff: Espera inicial e máxima (em segundos) do backoff exponencial.
+        - token_counter: Função que conta (ou estima) os tokens de um texto.
+        - transport: Transporte httpx opcional (ex: httpx.MockTransport), para testar contra um servidor falso.
+        - base_url: URL base opcional da API (ex: um servidor local compatível com a OpenAI).
+        """
+        self.api_key = api_key
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.token_counter = token_counter
+        self.transport = transport
+        self.base_url = base_url
+
+        # O cliente assíncrono fica preso ao event loop em que foi criado
+        self._client = None
+        self._client_loop = None
+
+    def _new_client(self):
+        # O SDK da OpenAI e o httpx só são importados quando a primeira requisição é feita
+        import httpx
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(transport=self.transport) if self.transport is not None else None
+        # As novas tentativas são feitas por este cliente, então as do SDK ficam desabilitadas
+        return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client, max_retries=0)
+
+    async def _get_client(self):
+        """
+        Retorna o cliente assíncrono do event loop atual, reaproveitando suas conexões entre chamadas. O cliente de
+        um event loop anterior é fechado antes de ser substituído.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            if self._client is not None:
+                stale, stale_loop = self._client, self._client_loop
+                self._client = None
+                await close_stale_client(stale, stale_loop)
+            self._client = self._new_client()
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        """
+        Fecha as conexões do cliente assíncrono reaproveitado por aembed.
+        """
+        if self._client is not None:
+            await self._client.close()
+        self._client = None
+        self._client_loop = None
+
+    def make_batches(self, texts):
+        """
+        Divide os textos em lotes consecutivos que respeitam max_batch_tokens e max_batch_inputs.
+
+        Retorna:
+        - Uma lista de tuplas (índice do primeiro texto do lote, lista de textos do lote).
+        """
+        batches = []
+        start = 0
+        batch = []
+        batch_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = self.token_counter(text)
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) >= self.max_batch_inputs):
+                batches.append((start, batch))
+                start, batch, batch_tokens = i, [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append((start, batch))
+        return batches
+
+    def _backoff(self, attempt, error):
+        """
+        Calcula a espera antes da próxima tentativa: o cabeçalho retry-after, quando presente, ou backoff
+        exponencial com jitter.
+        """
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        return min(self.max_backoff, self.initial_backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def _embed_batch(self, client, texts):
+        """
+        Envia um lote de textos em uma única requisição, repetindo-a com backoff em erros transitórios.
+
+        Retorna:
+        - Os embeddings do lote, na ordem dos textos.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await client.embeddings.create(input=texts, model=self.model)
+                # A API informa o índice de cada embedding; a ordem da lista não é garantida
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except _retryable_errors() as error:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, error))
+
+    async def aembed(self, texts, client=None):
+        """
+        Gera embeddings para uma lista de textos, enviando os lotes concorrentemente (no máximo
+        max_concurrency requisições em andamento).
+
+        Parâmetros:
+        - texts: Lista de textos.
+        - client: Cliente AsyncOpenAI opcional; por padrão, usa o cliente reaproveitado do event loop atual.
+
+        Retorna:
+        - Uma lista de embeddings (listas de floats), na mesma ordem dos textos.
+        """
+        client = client or await self._get_client()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        embeddings = [None] * len(texts)
+
+        async def run(start, batch):
+            async with semaphore:
+                embeddings[start:start + len(batch)] = await self._embed_batch(client, batch)
+
+        await asyncio.gather(*(run(start, batch) for start, batch in self.make_batches(texts)))
+        return embeddings
+
+    async def _embed_with_own_client(self, texts):
+        client = self._new_client()
+        try:
+            return await self.aembed(texts, client=client)
+        finally:
+            await client.close()
+
+    def embed(self, texts):
+        """
+        Versão síncrona de aembed. Cada chamada usa um event loop e um cliente próprios, fechados ao final.
+        Se já houver um event loop rodando nesta thread, a chamada é executada em uma thread auxiliar.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._embed_with_own_client(texts))
+
+        result = {}
+
+        def target():
+            try:
+                result['value'] = asyncio.run(self._embed_with_own_client(texts))
+            except BaseException as error:
+                result['error'] = error
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        if 'error' in result:
+            raise result['error']
+        return result['value']
@@ -1,98 +1,444 @@
 from src.evaluator import Evaluator
-from src.extractor import PDFExtractor
 from src.chunker import Chunker
 from src.embedder import Embedder
 from src.embedding_store import EmbeddingStore
+from src.local_embedding_store import LocalEmbeddingStore
+from src.ivf_embedding_store import IVFEmbeddingStore
+from src.chunk_store import ChunkStore
+from src.bm25_index import BM25Index, reciprocal_rank_fusion
+from src.manifest import IngestionManifest
+from src.ingestion import resolve_pdf_paths, iter_document_pages, iter_batches, UpsertQueue
 from src.llm import LLM
-import numpy as np
+from src.context_assembler import ContextAssembler
+from src.instrumentation import get_tracer
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import time
+
+# Início fixo de todos os prompts; o LLM local reaproveita o KV cache desse prefixo entre consultas
+PROMPT_PREFIX = "Aqui estão algumas informações relevantes extraídas de documentos:\n"
 
 
 class RAGSystem:
+    # Modos de recuperação: busca vetorial, busca por palavras-chave (BM25) ou a combinação das duas (RRF)
+    RETRIEVAL_MODES = ('dense', 'sparse', 'hybrid')
+
     def __init__(self,
                  pdf_path,
                  chunk_method='sentences',
                  chunk_size=100,
+                 chunk_overlap=0,
+                 chunk_tokenizer=None,
                  embedder_method='sbert',
+                 embedding_cache_path=None,
                  openai_api_key=None,
                  pinecone_api_key=None,
                  pinecone_environment=None,
                  embedding_dimension=384,
                  index_name="my-vector-index",
+                 store_method='pinecone',
+                 index_path=None,
+                 chunk_store_path=None,
                  llm_method='openai',
                  local_llm_model_name="EleutherAI/gpt-neo-2.7B",
-                 evaluator=None):
+                 llm_torch_dtype='auto',
+                 llm_quantize=False,
+                 max_prompt_tokens=None,
+                 evaluator=None,
+                 ingestion_workers=None,
+                 pages_per_task=16,
+                 embed_batch_size=256,
+                 upsert_batch_size=100,
+                 max_pending_upserts=4,
+                 store_chunk_metadata=False,
+                 answer_cache=None,
+                 async_workers=4,
+                 retrieval_mode='dense',
+                 reranker=None,
+                 rerank_candidates=20,
+                 model_registry=None,
+                 inline_evaluation=True,
+                 tracer=None):
         """
         Inicializa o sistema RAG (Retrieval-Augmented Generation), que combina a extração de dados de um PDF,
         a divisão do texto em chunks, a criação de embeddings e a geração de respostas com um LLM.
 
         Parâmetros:
-        - pdf_path: Caminho para o arquivo PDF que será extraído.
+        - pdf_path: PDF(s) a serem indexados: caminho de um arquivo, de um diretório (todos os PDFs dele),
+                    um padrão glob (ex: 'data/pdfs/*.pdf') ou uma lista desses.
         - chunk_method: Método de chunking ('sentences', 'paragraphs', 'tokens') para dividir o texto extraído.
         - chunk_size: Tamanho máximo de cada chunk em caracteres ou tokens.
+        - chunk_overlap: Tamanho (em caracteres ou tokens) do trecho final de cada chunk repetido no início do seguinte.
+        - chunk_tokenizer: Nome do tokenizer do Hugging Face usado para contar os tokens no chunk_method 'tokens'
+                           (ex: o do LLM local). Se None, os tokens são contados pelo spaCy.
         - embedder_method: Método de embedding ('sbert' ou 'openai') para gerar vetores de embeddings.
+        - embedding_cache_path: Caminho do arquivo de cache de embeddings (opcional), que evita recalcular embeddings
+                                de chunks que não mudaram entre execuções de prepare_data.
         - openai_api_key: Chave da API OpenAI, necessária se embedder_method ou llm_method for 'openai'.
         - pinecone_api_key: Chave da API do Pinecone, usada para armazenar e consultar os embeddings.
         - pinecone_environment: Ambiente do Pinecone (ex: 'us-west1-gcp').
         - embedding_dimension: Dimensão dos embeddings gerados.
         - index_name: Nome do índice do Pinecone para armazenar embeddings.
+        - store_method: Backend de armazenamento dos embeddings, 'pinecone' (remoto), 'local' (índice NumPy
+                        exato em memória, persistido em index_path) ou 'ivf' (índice local aproximado, para
+                        corpora grandes).
+        - index_path: Diretório do índice local (usado apenas se store_method for 'local' ou 'ivf').
+        - chunk_store_path: Diretório onde os textos e metadados dos chunks são salvos. Se já houver chunks
+                            salvos nele, o sistema pode responder consultas sem chamar prepare_data. Por padrão,
+                            usa o mesmo diretório de index_path; se ambos forem None, os chunks ficam só em memória.
         - llm_method: Método para gerar respostas, 'openai' ou 'local' (modelo Hugging Face).
         - local_llm_model_name: Nome do modelo local para geração de texto (se llm_method for 'local').
+        - llm_torch_dtype: Tipo dos pesos do modelo local ('auto': float16 na GPU, bfloat16 ou float32 na CPU).
+        - llm_quantize: Se True, aplica quantização dinâmica int8 ao modelo local (apenas na CPU).
+        - max_prompt_tokens: Orçamento de tokens do prompt (contados com o tokenizer do LLM). Os chunks mais
+                             relevantes, sem duplicatas, entram no contexto até esse limite, sempre reservando espaço
+                             para a pergunta. Por padrão, a janela de contexto do LLM menos os tokens gerados.
         - evaluator: Objeto de avaliação de respostas (usando métricas como BLEU ou ROUGE), opcional.
+        - ingestion_workers: Número de processos usados para extrair e dividir os PDFs em chunks no prepare_data.
+                             Se None, usa o número de núcleos disponíveis.
+        - pages_per_task: Número máximo de páginas extraídas por tarefa enviada a um processo de ingestão.
+        - embed_batch_size: Número de chunks embedados por vez no prepare_data.
+        - upsert_batch_size: Número máximo de embeddings por requisição de upsert ao Pinecone.
+        - max_pending_upserts: Número máximo de lotes de embeddings aguardando envio ao índice; quando a fila
+                               enche, a geração de embeddings espera (a memória do prepare_data fica limitada).
+        - store_chunk_metadata: Se True, os metadados de cada chunk (source, page, offset) também são anexados
+                                aos vetores no índice.
+        - answer_cache: Cache de respostas (AnswerCache) consultado antes de cada query, opcional. É esvaziado
+                        sempre que prepare_data altera o índice.
+        - async_workers: Número de threads do executor usado por aquery para o trabalho bloqueante (modelos locais,
+                         índice local, cache em disco); limita quantas dessas tarefas rodam ao mesmo tempo.
+        - retrieval_mode: Modo de recuperação padrão das consultas: 'dense' (busca vetorial), 'sparse' (BM25 sobre os
+                          chunks, bom para nomes próprios e códigos) ou 'hybrid' (as duas, combinadas por Reciprocal
+                          Rank Fusion). Pode ser alterado em cada consulta.
+        - reranker: Estágio de re-ranking (Reranker) entre a busca e a montagem do prompt, opcional. Com ele, a busca
+                    retorna rerank_candidates chunks e apenas os top_k mais bem pontuados pelo cross-encoder seguem
+                    para o LLM.
+        - rerank_candidates: Número de candidatos recuperados para o re-ranking (usado apenas com um reranker).
+        - model_registry: ModelRegistry de onde o embedder e o LLM obtêm seus modelos locais. Por padrão, o registro
+                          do processo, de modo que vários RAGSystem (ex: um por índice) com os mesmos modelos
+                          compartilham uma única cópia dos pesos.
+        - inline_evaluation: Se False, as respostas de referência passadas às consultas são ignoradas e nenhuma
+                             métrica é calculada durante as consultas (recomendado em produção; para avaliar um
+                             conjunto de perguntas, use EvaluationHarness, de src/evaluation.py). Se True, as
+                             métricas são registradas no tracer como valores 'evaluation_<métrica>'.
+        - tracer: Tracer (src/instrumentation.py) que mede a duração de cada etapa de prepare_data e das consultas e
+                  acumula contadores (chunks, tokens, tamanhos de lote, hits de cache). Por padrão, o tracer do
+                  processo (desabilitado, a menos que set_tracer tenha sido chamado).
         """
-        # Extração de texto do PDF
-        self.extractor = PDFExtractor(pdf_path)
+        if retrieval_mode not in self.RETRIEVAL_MODES:
+            raise ValueError("Modo de recuperação inválido.")
+        self.retrieval_mode = retrieval_mode
+
+        # PDFs a serem indexados
+        self.pdf_paths = resolve_pdf_paths(pdf_path)
+        self.ingestion_workers = ingestion_workers
+        self.pages_per_task = pages_per_task
+        self.embed_batch_size = embed_batch_size
+        self.max_pending_upserts = max_pending_upserts
+        self.store_chunk_metadata = store_chunk_metadata
 
         # Divisão do texto em chunks
-        self.chunker = Chunker(method=chunk_method, chunk_size=chunk_size)
+        self.chunker = Chunker(method=chunk_method, chunk_size=chunk_size, overlap=chunk_overlap,
+                               token_counter=chunk_tokenizer)
 
         # Criação de embeddings para os chunks
-        self.embedder = Embedder(method=embedder_method, openai_api_key=openai_api_key)
-
-        # Armazenamento de embeddings no Pinecone
-        self.embedding_store = EmbeddingStore(
-            pinecone_api_key=pinecone_api_key,
-            pinecone_environment=pinecone_environment,
-            dimension=embedding_dimension,
-            index_name=index_name
-        )
+        self.embedder = Embedder(method=embedder_method, openai_api_key=openai_api_key, cache_path=embedding_cache_path,
+                                 model_registry=model_registry)
+
+        # Armazenamento de embeddings no Pinecone ou em um índice local
+        if store_method == 'pinecone':
+            self.embedding_store = EmbeddingStore(
+                pinecone_api_key=pinecone_api_key,
+                pinecone_environment=pinecone_environment,
+                dimension=embedding_dimension,
+                index_name=index_name,
+                batch_size=upsert_batch_size
+            )
+        elif store_method == 'local':
+            self.embedding_store = LocalEmbeddingStore(dimension=embedding_dimension, index_path=index_path)
+        elif store_method == 'ivf':
+            self.embedding_store = IVFEmbeddingStore(dimension=embedding_dimension, index_path=index_path)
+        else:
+            raise ValueError("Método de armazenamento de embeddings inválido.")
 
         # Inicializa o LLM (Language Model) para gerar respostas
-        self.llm = LLM(method=llm_method, openai_api_key=openai_api_key, local_model_name=local_llm_model_name)
+        self.llm = LLM(method=llm_method, openai_api_key=openai_api_key, local_model_name=local_llm_model_name,
+                       torch_dtype=llm_torch_dtype, quantize=llm_quantize, prompt_prefix=PROMPT_PREFIX,
+                       model_registry=model_registry)
+
+        # Montagem do contexto dentro do orçamento de tokens do prompt
+        self.context_assembler = ContextAssembler(
+            self.llm.count_tokens,
+            max_prompt_tokens=max_prompt_tokens or self.llm.max_prompt_tokens
+        )
 
         # Inicializa o avaliador para calcular métricas (se não for fornecido, cria uma instância)
         self.evaluator = evaluator if evaluator else Evaluator()
+        self.inline_evaluation = inline_evaluation
+
+        # Instrumentação das etapas (sem custo relevante quando desabilitada)
+        self.tracer = tracer or get_tracer()
+        # Número de consultas, duração e vazão do último query_batch (disponíveis mesmo sem tracer)
+        self.last_batch_stats = None
+
+        # Inicializa o armazenamento dos chunks (texto e metadados, indexados pelo ID do embedding)
+        store_path = chunk_store_path or index_path
+        self.chunk_store = ChunkStore(path=store_path)
 
-        # Inicializa a lista de chunks armazenados
-        self.chunks = []
+        # Índice invertido BM25 dos chunks, salvo junto com eles, para a busca por palavras-chave
+        self.bm25_index = BM25Index(path=store_path)
+        self._sync_sparse_index()
+
+        # Manifesto com os fingerprints do que já foi indexado, usado para reindexar apenas o que mudou
+        self.manifest = IngestionManifest(path=os.path.join(store_path, "manifest.json") if store_path else None)
+
+        # Cache de respostas para consultas repetidas ou muito parecidas
+        self.answer_cache = answer_cache
+
+        # Re-ranking dos candidatos da busca com um cross-encoder
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+
+        # Executor limitado para o trabalho bloqueante das consultas assíncronas (as threads são criadas sob demanda)
+        self.executor = ThreadPoolExecutor(max_workers=async_workers, thread_name_prefix="rag-async")
+
+    def warmup(self, run_inference=True):
+        """
+        Carrega antecipadamente os modelos e conexões usados nas consultas (embedder, índice de embeddings, índice
+        BM25, LLM e reranker), para que a primeira consulta não pague esse custo. Útil em servidores; sem warmup,
+        cada componente é carregado no primeiro uso.
+
+        Parâmetros:
+        - run_inference: Se True, também executa uma inferência de teste em cada modelo. Use False em um processo
+                         pai antes de fork: os pesos são carregados (e compartilhados com os workers), mas nenhuma
+                         thread do PyTorch nem conexão com o Pinecone é iniciada antes do fork.
+        """
+        if self.retrieval_mode != 'sparse':
+            self.embedder.warmup(run_inference=run_inference)
+            if run_inference:
+                self.embedding_store.warmup()
+        if self.retrieval_mode != 'dense':
+            self.bm25_index.build()
+        self.llm.warmup(run_inference=run_inference)
+        if self.reranker is not None:
+            self.reranker.warmup(run_inference=run_inference)
 
     def prepare_data(self):
         """
-        Prepara os dados do sistema RAG, extraindo texto do PDF, dividindo-o em chunks, gerando embeddings e
-        armazenando-os no Pinecone.
+        Prepara os dados do sistema RAG, extraindo texto dos PDFs, dividindo-o em chunks, gerando embeddings e
+        armazenando-os no índice.
+
+        A ingestão é um pipeline em fluxo (páginas -> chunks -> lotes de embeddings -> lotes de upsert): a extração e
+        o chunking são distribuídos entre processos (ingestion_workers), os chunks são embedados em lotes de
+        embed_batch_size e cada lote é enviado ao índice por uma fila limitada enquanto o próximo é embedado.
+        Assim, a memória não cresce com o tamanho dos documentos e os chunks ficam pesquisáveis à medida que chegam ao índice.
+
+        A indexação é incremental: o manifesto guarda o fingerprint de cada arquivo e de cada página já indexada,
+        de modo que apenas as páginas novas ou alteradas são extraídas, embedadas e enviadas ao índice, e os
+        chunks que deixaram de existir (inclusive de PDFs removidos) são removidos do índice e do armazenamento de chunks.
 
         Passos:
-        1. Extrai o texto do arquivo PDF.
-        2. Divide o texto em chunks de acordo com o método escolhido (sentences, paragraphs, tokens).
-        3. Gera embeddings para cada chunk de texto.
-        4. Armazena os embeddings no Pinecone, associando cada embedding a um ID exclusivo.
+        1. Compara os fingerprints de cada PDF e de suas páginas com os do manifesto.
+        2. Extrai o texto das páginas alteradas e o divide em chunks de acordo com o método escolhido
+           (sentences, paragraphs, tokens), com IDs estáveis derivados do conteúdo.
+        3. Salva o texto e os metadados (arquivo, página e offset) de cada chunk novo no armazenamento de chunks.
+        4. Gera embeddings apenas para os chunks novos e os armazena no índice (Pinecone ou local).
+        5. Remove do índice e do armazenamento os chunks que deixaram de existir.
         """
-        # Extrair texto do PDF
-        text = self.extractor.extract_text()
+        with self.tracer.span('prepare_data'):
+            self._prepare_data()
+
+    def _prepare_data(self):
+        tracer = self.tracer
+        config = f"{self.chunker.signature}:{self.embedder.model_name}"
+
+        tasks = []
+        for source in self.pdf_paths:
+            document = self.manifest.get(source)
+            # Se a configuração de chunking ou o modelo mudaram, o documento inteiro precisa ser reprocessado
+            if document and document['config'] == config:
+                known_pages = {page_num: page['fingerprint'] for page_num, page in document['pages'].items()}
+                tasks.append((source, document['fingerprint'], known_pages))
+            else:
+                tasks.append((source, None, None))
+
+        removed_ids = []
+        index_changed = False
+        new_chunks = self._iter_new_chunks(tasks, config, removed_ids)
+        batches = iter_batches(new_chunks, self.embed_batch_size)
+        with UpsertQueue(self.embedding_store, max_pending=self.max_pending_upserts) as upsert_queue:
+            while True:
+                # Extração e chunking (em paralelo nos processos de ingestão) até completar o próximo lote
+                with tracer.span('prepare_data.chunk'):
+                    batch = next(batches, None)
+                if batch is None:
+                    break
+                index_changed = True
+                ids = [chunk_id for chunk_id, _, _ in batch]
+                texts = [text for _, text, _ in batch]
+                tracer.count('chunks_indexed', len(batch))
+                tracer.observe('embed_batch_size', len(batch))
 
-        # Dividir o texto em chunks
-        self.chunks = self.chunker.chunk_text(text)
-        print(f"{len(self.chunks)} chunks criados.")
+                # Salvar os chunks antes dos embeddings, para que todo ID retornado pela busca tenha um texto
+                # (um chunk pode já estar no armazenamento se uma execução anterior foi interrompida antes do manifesto)
+                with tracer.span('prepare_data.store_chunks'):
+                    to_store = [item for item in batch if item[0] not in self.chunk_store]
+                    self.chunk_store.add([item[0] for item in to_store], [item[1] for item in to_store],
+                                         [item[2] for item in to_store])
+                    self.chunk_store.save()
+                    self.bm25_index.add(ids, texts)
 
-        # Gerar embeddings para cada chunk
-        embeddings = self.embedder.generate_embeddings(self.chunks)
+                metadatas = [metadata for _, _, metadata in batch] if self.store_chunk_metadata else None
+                with tracer.span('prepare_data.embed', batch_size=len(batch)):
+                    embeddings = self.embedder.generate_embeddings(texts)
+                # Espera apenas se a fila de upserts estiver cheia
+                with tracer.span('prepare_data.upsert'):
+                    upsert_queue.put(ids, embeddings, metadatas)
 
-        # Gerar IDs para os embeddings (usando o índice dos chunks)
-        ids = [str(i) for i in range(len(embeddings))]
+        # Remover os documentos que foram indexados antes, mas não fazem mais parte do corpus
+        for source in list(self.manifest.documents):
+            if source not in self.pdf_paths:
+                source_ids = [chunk_id for page in self.manifest.get(source)['pages'].values() for chunk_id in page['chunk_ids']]
+                print(f"Removendo {source} do índice ({len(source_ids)} chunks).")
+                removed_ids.extend(source_ids)
+                self.manifest.remove(source)
 
-        # Armazenar os embeddings no Pinecone
-        self.embedding_store.store_embeddings(embeddings, ids=ids)
+        # Remover do índice e do armazenamento os chunks que deixaram de existir
+        with tracer.span('prepare_data.delete', chunks=len(removed_ids)):
+            self._delete_chunks(removed_ids)
+        tracer.count('chunks_removed', len(removed_ids))
 
-    def query(self, user_query, reference_answer=None, top_k=5):
+        # Persistir os índices (no-op para o Pinecone) e, por último, o manifesto
+        with tracer.span('prepare_data.save'):
+            self.embedding_store.save()
+            self.bm25_index.save()
+            self.manifest.save()
+
+        # As respostas em cache podem ter sido geradas a partir de chunks que mudaram
+        if self.answer_cache is not None and (index_changed or removed_ids):
+            self.answer_cache.clear()
+
+    def _iter_new_chunks(self, tasks, config, removed_ids):
+        """
+        Percorre as páginas alteradas dos documentos (processadas em paralelo) e produz os chunks que ainda não
+        estão indexados. Ao final de cada documento, atualiza o manifesto em memória e acrescenta a removed_ids
+        os IDs dos chunks do documento que deixaram de existir.
+
+        Parâmetros:
+        - tasks: Lista de tuplas (caminho do PDF, fingerprint conhecido, páginas conhecidas).
+        - config: Configuração de indexação atual (chunking e modelo de embeddings).
+        - removed_ids: Lista que recebe os IDs dos chunks removidos.
+
+        Retorna:
+        - Um gerador de tuplas (ID do chunk, texto, metadados).
+        """
+        state = None
+        for plan, page_results, is_last in iter_document_pages(tasks, self.chunker.method, self.chunker.chunk_size,
+                                                               max_workers=self.ingestion_workers,
+                                                               pages_per_task=self.pages_per_task,
+                                                               chunk_overlap=self.chunker.overlap,
+                                                               chunk_tokenizer=self.chunker.token_counter):
+            source = plan['source']
+            if plan['unchanged']:
+                continue
+
+            if state is None:
+                document = self.manifest.get(source)
+                old_pages = document['pages'] if document and document['config'] == config else {}
+                state = {
+                    'old_pages': old_pages,
+                    'old_ids': [chunk_id for page in (document or {}).get('pages', {}).values()
+                                for chunk_id in page['chunk_ids']],
+                    # IDs já embedados com a configuração atual; o manifesto é salvo por último, então um chunk
+                    # listado nele certamente tem seu embedding no índice
+                    'indexed_ids': {chunk_id for page in old_pages.values() for chunk_id in page['chunk_ids']},
+                    'pages': {},
+                    'new_chunks': 0
+                }
+
+            for page_num, chunks in page_results:
+                state['pages'][str(page_num)] = {'fingerprint': plan['page_fingerprints'][page_num],
+                                                 'chunk_ids': [chunk['id'] for chunk in chunks]}
+                for chunk in chunks:
+                    # Chunks cujo ID já está indexado não precisam ser embedados de novo
+                    if chunk['id'] not in state['indexed_ids']:
+                        state['new_chunks'] += 1
+                        yield chunk['id'], chunk['text'], {'source': source, 'page': page_num, 'offset': chunk['offset']}
+
+            if not is_last:
+                continue
+
+            # As páginas inalteradas mantêm seus chunks
+            pages = state['pages']
+            for page_num in plan['page_fingerprints']:
+                if str(page_num) not in pages:
+                    pages[str(page_num)] = state['old_pages'][str(page_num)]
+
+            current_ids = {chunk_id for page in pages.values() for chunk_id in page['chunk_ids']}
+            document_removed_ids = [chunk_id for chunk_id in state['old_ids'] if chunk_id not in current_ids]
+            removed_ids.extend(document_removed_ids)
+            print(f"{source}: {len(plan['changed_pages'])} páginas alteradas, {state['new_chunks']} chunks novos, "
+                  f"{len(document_removed_ids)} chunks removidos.")
+
+            self.manifest.update(source, plan['fingerprint'], config, pages)
+            state = None
+
+    def _delete_chunks(self, chunk_ids):
+        """
+        Remove chunks do índice de embeddings e do armazenamento de chunks.
+        """
+        if not chunk_ids:
+            return
+        self.embedding_store.delete(chunk_ids)
+        self.bm25_index.delete(chunk_ids)
+        self.chunk_store.delete(chunk_ids)
+        self.chunk_store.save()
+
+    def _sync_sparse_index(self, batch_size=10000):
+        """
+        Indexa no BM25 os chunks do armazenamento que ainda não estão nele (ex: chunks salvos antes de o índice
+        BM25 existir), para que a busca por palavras-chave cubra todo o corpus.
+        """
+        if len(self.bm25_index) >= len(self.chunk_store):
+            return
+        missing = [chunk_id for chunk_id in self.chunk_store.ids() if chunk_id not in self.bm25_index]
+        for batch in iter_batches(missing, batch_size):
+            self.bm25_index.add(batch, self.chunk_store.get_many(batch))
+        self.bm25_index.save()
+
+    def _resolve_retrieval_mode(self, retrieval_mode):
+        retrieval_mode = retrieval_mode or self.retrieval_mode
+        if retrieval_mode not in self.RETRIEVAL_MODES:
+            raise ValueError("Modo de recuperação inválido.")
+        return retrieval_mode
+
+    def _candidate_top_k(self, top_k):
+        """
+        Número de candidatos recuperados: com um reranker, um conjunto maior, do qual ficam os top_k melhores.
+        """
+        return max(top_k, self.rerank_candidates) if self.reranker is not None else top_k
+
+    @staticmethod
+    def _dense_top_k(retrieval_mode, top_k):
+        """
+        Número de resultados da busca vetorial: no modo híbrido, mais candidatos são buscados para a fusão.
+        """
+        return 2 * top_k if retrieval_mode == 'hybrid' else top_k
+
+    def _combine_matches(self, retrieval_mode, user_query, dense_matches, top_k):
+        """
+        Completa a recuperação de acordo com o modo: busca BM25 (sparse) ou fusão por RRF dos resultados da busca
+        vetorial com os do BM25 (hybrid). No modo dense, retorna os resultados da busca vetorial.
+        """
+        if retrieval_mode == 'dense':
+            return dense_matches
+        sparse_matches = self.bm25_index.search(user_query, top_k=self._dense_top_k(retrieval_mode, top_k))
+        if retrieval_mode == 'sparse':
+            return sparse_matches
+        return reciprocal_rank_fusion([dense_matches, sparse_matches], top_k=top_k)
+
+    def query(self, user_query, reference_answer=None, top_k=5, retrieval_mode=None):
         """
         Faz uma consulta ao sistema RAG, utilizando embeddings e um modelo de linguagem para responder à pergunta do usuário.
 
@@ -100,51 +446,426 @@ class RAGSystem:
         - user_query: A pergunta ou consulta do usuário.
         - reference_answer: Resposta de referência para avaliação (opcional).
         - top_k: Número de chunks mais relevantes a serem retornados na busca.
+        - retrieval_mode: 'dense', 'sparse' ou 'hybrid'; por padrão, o retrieval_mode do sistema.
 
         Retorna:
         - answer: A resposta gerada pelo modelo LLM.
         - relevant_chunks: Os chunks mais relevantes encontrados para a consulta.
+
+        Com um answer_cache, uma consulta idêntica (após normalização) a uma anterior é respondida sem gerar
+        embeddings; uma consulta parecida (acima do limiar de similaridade do cache) é respondida sem busca nem LLM.
+        """
+        retrieval_mode = self._resolve_retrieval_mode(retrieval_mode)
+        with self.tracer.span('query'):
+            query_embedding, cached, relevant_chunks = self._retrieve(user_query, top_k, retrieval_mode)
+            if cached is not None:
+                answer, relevant_chunks = cached
+            elif relevant_chunks is None:
+                return None, None
+            else:
+                # Gerar a resposta com o LLM
+                with self.tracer.span('query.generate'):
+                    answer = self.llm.generate_response(self._build_prompt(user_query, relevant_chunks))
+                if self.answer_cache is not None:
+                    self.answer_cache.put(user_query, answer, relevant_chunks, query_embedding, top_k, retrieval_mode)
+
+        # Avaliar a resposta se houver uma resposta de referência
+        if reference_answer and self.inline_evaluation:
+            self._record_evaluation(self.evaluator.evaluate(answer, reference_answer))
+
+        return answer, relevant_chunks
+
+    def _retrieve(self, user_query, top_k, retrieval_mode=None):
+        """
+        Etapa de recuperação de query: consulta o cache de respostas e, se necessário, gera o embedding da
+        consulta e busca os chunks relevantes.
+
+        Retorna:
+        - Uma tupla (query_embedding, cached, relevant_chunks): cached é a tupla (answer, relevant_chunks) do cache
+          ou None; relevant_chunks é None se a resposta veio do cache ou se nenhum chunk foi encontrado.
+        """
+        retrieval_mode = self._resolve_retrieval_mode(retrieval_mode)
+        tracer = self.tracer
+        query_embedding = None
+        cached = self.answer_cache.get(user_query, top_k, retrieval_mode) if self.answer_cache is not None else None
+        if cached is None:
+            # Gerar embedding para a consulta do usuário (já validado e normalizado pelo Embedder);
+            # a busca apenas por palavras-chave não precisa dele
+            if retrieval_mode != 'sparse':
+                with tracer.span('query.embed'):
+                    query_embedding = self.embedder.generate_embeddings([user_query])[0]
+            if self.answer_cache is not None:
+                cached = self.answer_cache.get_similar(query_embedding, top_k, retrieval_mode)
+        if self.answer_cache is not None:
+            tracer.count('answer_cache_hits' if cached is not None else 'answer_cache_misses')
+        if cached is not None:
+            return query_embedding, cached, None
+
+        # Buscar no Pinecone pelos embeddings mais próximos e/ou no índice BM25
+        with tracer.span('query.search', mode=retrieval_mode):
+            candidates = self._candidate_top_k(top_k)
+            dense_matches = None
+            if retrieval_mode != 'sparse':
+                dense_matches = self.embedding_store.search(query_embedding,
+                                                            top_k=self._dense_top_k(retrieval_mode, candidates))
+            matches = self._combine_matches(retrieval_mode, user_query, dense_matches, candidates)
+
+        # Recuperar os chunks relevantes com base nos IDs retornados
+        return query_embedding, None, self._relevant_chunks(matches, user_query, top_k)
+
+    def trace_query(self, user_query, top_k=5, retrieval_mode=None, generate=True):
+        """
+        Faz uma consulta medindo o tempo de cada etapa, para avaliação offline. O cache de respostas não é usado
+        (nem atualizado) e nenhuma métrica é calculada.
+
+        Parâmetros:
+        - user_query, top_k, retrieval_mode: Como em query.
+        - generate: Se False, apenas a recuperação é feita (sem chamar o LLM).
+
+        Retorna:
+        - Um dicionário com 'retrieved_ids' (IDs dos top_k chunks, na ordem final da recuperação, após o re-ranking),
+          'relevant_chunks' (os chunks do prompt, ou None), 'answer' (ou None) e 'timings' (segundos por etapa:
+          'embed', 'search', 'rerank', 'assemble' e 'generate').
+        """
+        retrieval_mode = self._resolve_retrieval_mode(retrieval_mode)
+        timings = dict.fromkeys(('embed', 'search', 'rerank', 'assemble', 'generate'), 0.0)
+        trace = {'retrieved_ids': [], 'relevant_chunks': None, 'answer': None, 'timings': timings}
+
+        start = time.perf_counter()
+        query_embedding = None
+        if retrieval_mode != 'sparse':
+            query_embedding = self.embedder.generate_embeddings([user_query])[0]
+        timings['embed'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        candidates = self._candidate_top_k(top_k)
+        dense_matches = None
+        if retrieval_mode != 'sparse':
+            dense_matches = self.embedding_store.search(query_embedding,
+                                                        top_k=self._dense_top_k(retrieval_mode, candidates))
+        matches = self._combine_matches(retrieval_mode, user_query, dense_matches, candidates)
+        resolved = self._resolve_chunks(matches)
+        timings['search'] = time.perf_counter() - start
+        if resolved is None:
+            return trace
+
+        ids, chunks = resolved
+        if self.reranker is not None:
+            start = time.perf_counter()
+            reranked = self.reranker.rerank(user_query, chunks, ids=ids, top_k=top_k, with_ids=True)
+            timings['rerank'] = time.perf_counter() - start
+            ids = [chunk_id for chunk_id, _ in reranked]
+            chunks = [chunk for _, chunk in reranked]
+        trace['retrieved_ids'] = ids[:top_k]
+
+        start = time.perf_counter()
+        relevant_chunks = self._assemble_context(user_query, chunks[:top_k])
+        timings['assemble'] = time.perf_counter() - start
+        trace['relevant_chunks'] = relevant_chunks
+
+        if generate and relevant_chunks is not None:
+            start = time.perf_counter()
+            trace['answer'] = self.llm.generate_response(self._build_prompt(user_query, relevant_chunks))
+            timings['generate'] = time.perf_counter() - start
+        return trace
+
+    def query_stream(self, user_query, reference_answer=None, top_k=5, retrieval_mode=None):
+        """
+        Versão de query em streaming: a recuperação é feita imediatamente e a resposta é produzida aos poucos,
+        à medida que o LLM gera os tokens, de modo que o primeiro trecho chega muito antes da resposta completa.
+
+        Parâmetros:
+        - user_query, reference_answer, top_k, retrieval_mode: Como em query. A avaliação (e o armazenamento no cache de
+          respostas) é feita quando o gerador termina.
+
+        Retorna:
+        - answer_stream: Um gerador dos trechos da resposta (a resposta em cache é produzida de uma vez).
+        - relevant_chunks: Os chunks mais relevantes encontrados para a consulta.
+        Se nenhum chunk relevante for encontrado, retorna (None, None).
         """
-        # Gerar embedding para a consulta do usuário
-        query_embedding = self.embedder.generate_embeddings([user_query])[0]
+        retrieval_mode = self._resolve_retrieval_mode(retrieval_mode)
+        query_embedding, cached, relevant_chunks = self._retrieve(user_query, top_k, retrieval_mode)
+        if cached is None and relevant_chunks is None:
+            return None, None
+
+        def answer_stream():
+            if cached is not None:
+                answer = cached[0]
+                yield answer
+            else:
+                pieces = []
+                for piece in self.llm.generate_response_stream(self._build_prompt(user_query, relevant_chunks)):
+                    pieces.append(piece)
+                    yield piece
+                answer = "".join(pieces).strip()
+                if self.answer_cache is not None:
+                    self.answer_cache.put(user_query, answer, relevant_chunks, query_embedding, top_k, retrieval_mode)
+
+            if reference_answer and self.inline_evaluation:
+                self._record_evaluation(self.evaluator.evaluate(answer, reference_answer))
+
+        return answer_stream(), cached[1] if cached is not None else relevant_chunks
+
+    async def aquery(self, user_query, reference_answer=None, top_k=5, retrieval_mode=None):
+        """
+        Versão assíncrona de query, para atender muitas consultas concorrentes em um único processo.
+
+        As chamadas remotas (embeddings e LLM da OpenAI, busca no Pinecone) são assíncronas; o trabalho de CPU
+        local (SBERT, índice local, LLM local, avaliação) é executado no executor limitado (async_workers threads),
+        de modo que o event loop nunca fica bloqueado. Os parâmetros e o retorno são os de query.
+        """
+        loop = asyncio.get_running_loop()
+        retrieval_mode = self._resolve_retrieval_mode(retrieval_mode)
+
+        tracer = self.tracer
+        query_embedding = None
+        cached = self.answer_cache.get(user_query, top_k, retrieval_mode) if self.answer_cache is not None else None
+        if cached is None:
+            if retrieval_mode != 'sparse':
+                with tracer.span('query.embed'):
+                    query_embedding = (await self.embedder.agenerate_embeddings([user_query],
+                                                                                executor=self.executor))[0]
+            if self.answer_cache is not None:
+                cached = self.answer_cache.get_similar(query_embedding, top_k, retrieval_mode)
+        if self.answer_cache is not None:
+            tracer.count('answer_cache_hits' if cached is not None else 'answer_cache_misses')
 
-        # Validar e normalizar o embedding gerado
-        query_embedding = self.embedder.validate_and_normalize_embedding(np.array(query_embedding))
+        if cached is not None:
+            answer, relevant_chunks = cached
+        else:
+            with tracer.span('query.search', mode=retrieval_mode):
+                candidates = self._candidate_top_k(top_k)
+                dense_matches = None
+                if retrieval_mode != 'sparse':
+                    dense_matches = await self.embedding_store.asearch(
+                        query_embedding, top_k=self._dense_top_k(retrieval_mode, candidates), executor=self.executor
+                    )
+                # A busca BM25 leva menos de 1 ms e é feita no próprio event loop
+                matches = self._combine_matches(retrieval_mode, user_query, dense_matches, candidates)
+            if self.reranker is not None:
+                # O cross-encoder roda na CPU/GPU local: fora do event loop
+                relevant_chunks = await loop.run_in_executor(self.executor, self._relevant_chunks, matches,
+                                                             user_query, top_k)
+            else:
+                relevant_chunks = self._relevant_chunks(matches, user_query, top_k)
+            if relevant_chunks is None:
+                return None, None
 
-        # Limitar o número de casas decimais dos valores para 6
-        query_embedding = [round(float(x), 9) for x in query_embedding]
+            with tracer.span('query.generate'):
+                answer = await self.llm.agenerate_response(self._build_prompt(user_query, relevant_chunks),
+                                                           executor=self.executor)
+            if self.answer_cache is not None:
+                self.answer_cache.put(user_query, answer, relevant_chunks, query_embedding, top_k, retrieval_mode)
 
-        # Buscar no Pinecone pelos embeddings mais próximos
-        matches = self.embedding_store.search(query_embedding, top_k=top_k)
+        if reference_answer and self.inline_evaluation:
+            self._record_evaluation(await loop.run_in_executor(
+                self.executor, self.evaluator.evaluate, answer, reference_answer
+            ))
+
+        return answer, relevant_chunks
+
+    async def aclose(self):
+        """
+        Fecha as conexões assíncronas do embedder, do armazenamento de embeddings e do LLM, e o executor de aquery.
+        """
+        await self.embedder.aclose()
+        await self.embedding_store.aclose()
+        await self.llm.aclose()
+        self.close()
+
+    def close(self):
+        """
+        Devolve os modelos do embedder e do LLM ao registro de modelos (são removidos da memória quando nenhum outro
+        RAGSystem os usa) e encerra o executor de aquery.
+        """
+        self.embedder.close()
+        self.llm.close()
+        self.executor.shutdown(wait=False)
 
+    def _relevant_chunks(self, matches, user_query, top_k):
+        """
+        Recupera os textos dos chunks retornados pela busca, reordena-os com o reranker (se houver), mantendo os
+        top_k, e escolhe, com o ContextAssembler, os que cabem no orçamento de tokens do prompt (sem duplicatas).
+        Retorna None se não houver nenhum.
+        """
+        resolved = self._resolve_chunks(matches)
+        if resolved is None:
+            return None
+        ids, relevant_chunks = resolved
+        if self.reranker is not None:
+            with self.tracer.span('query.rerank', candidates=len(relevant_chunks)):
+                relevant_chunks = self.reranker.rerank(user_query, relevant_chunks, ids=ids, top_k=top_k)
+        return self._assemble_context(user_query, relevant_chunks)
+
+    def _resolve_chunks(self, matches):
+        """
+        Recupera os textos dos chunks retornados pela busca.
+
+        Retorna:
+        - Uma tupla (ids, textos), na ordem da busca, ou None se não houver nenhum chunk.
+        """
         # Verificar se houve matches
         if not matches:
-            print("Nenhum match encontrado para a consulta.")
-            return None, None
+            self.tracer.count('queries_without_matches')
+            return None
 
-        # Recuperar os chunks relevantes com base nos IDs retornados
+        ids = [match['id'] for match in matches if 'id' in match]
         try:
-            relevant_chunks = [self.chunks[int(match['id'])] for match in matches if 'id' in match]
-        except KeyError as e:
-            print(f"Erro ao acessar os IDs dos chunks: {e}")
-            return None, None
+            relevant_chunks = [self.chunk_store.get(chunk_id) for chunk_id in ids]
+        except KeyError:
+            # Um ID retornado pelo índice não está no chunk store (ex: índice e chunk store dessincronizados)
+            self.tracer.count('chunk_lookup_errors')
+            return None
 
         if not relevant_chunks:
-            print("Nenhum chunk relevante encontrado com base nos IDs retornados.")
-            return None, None
+            self.tracer.count('queries_without_matches')
+            return None
+        return ids, relevant_chunks
+
+    def _assemble_context(self, user_query, relevant_chunks):
+        """
+        Escolhe, com o ContextAssembler, os chunks que cabem no orçamento de tokens do prompt (sem duplicatas).
+        Retorna None se nenhum couber.
+        """
+        with self.tracer.span('query.assemble'):
+            # Os tokens do prompt sem contexto (instruções e pergunta) ficam reservados
+            reserved_tokens = self.llm.count_tokens(self._build_prompt(user_query, []))
+            relevant_chunks = self.context_assembler.select(relevant_chunks, reserved_tokens=reserved_tokens)
+        if not relevant_chunks:
+            self.tracer.count('queries_without_context')
+            return None
+        self.tracer.observe('context_chunks', len(relevant_chunks))
+        return relevant_chunks
+
+    def _record_evaluation(self, evaluation_results):
+        """
+        Registra no tracer cada métrica da avaliação inline (ex: 'evaluation_bleu', 'evaluation_rouge1').
+        """
+        for metric, value in evaluation_results.items():
+            self.tracer.observe(f'evaluation_{metric}', value)
 
-        # Concatenar os chunks para formar o contexto
+    @staticmethod
+    def _build_prompt(user_query, relevant_chunks):
+        """
+        Monta o prompt do LLM a partir da consulta e dos chunks relevantes (concatenados para formar o contexto).
+        """
         context = "\n".join(relevant_chunks)
+        return f"{PROMPT_PREFIX}{context}\n\nCom base nessas informações, responda à seguinte pergunta:\n{user_query}"
 
-        # Criar o prompt para o LLM
-        prompt = f"Aqui estão algumas informações relevantes extraídas de documentos:\n{context}\n\nCom base nessas informações, responda à seguinte pergunta:\n{user_query}"
+    def query_batch(self, queries, reference_answers=None, top_k=5, batch_size=8, retrieval_mode=None):
+        """
+        Faz várias consultas de uma vez, com o mesmo resultado de chamar query para cada uma: os embeddings de
+        todas as consultas são gerados em uma única chamada ao Embedder, a busca é feita em lote
+        (embedding_store.search_batch) e os prompts são enviados ao LLM em lotes (llm.generate_responses; com o
+        KV cache do prefixo, cada prompt é gerado como em query).
 
-        # Gerar a resposta com o LLM
-        answer = self.llm.generate_response(prompt)
+        Parâmetros:
+        - queries: Lista de perguntas.
+        - reference_answers: Lista opcional de respostas de referência (uma por pergunta; None para não avaliar).
+        - top_k: Número de chunks mais relevantes a serem retornados por consulta.
+        - batch_size: Número de prompts por lote do LLM local.
+        - retrieval_mode: Modo de recuperação de todas as consultas, como em query.
 
-        # Avaliar a resposta se houver uma resposta de referência
-        if reference_answer:
-            evaluation_results = self.evaluator.evaluate(answer, reference_answer)
-            print(f"Resultados da Avaliação: {evaluation_results}")
+        Retorna:
+        - Uma lista de tuplas (answer, relevant_chunks), na ordem das consultas; (None, None) para consultas sem
+          chunks relevantes. O número de consultas, a duração e a vazão (consultas/s) do lote ficam em
+          last_batch_stats ({'queries', 'seconds', 'qps'}) e também são registrados no tracer (span 'query_batch' e
+          valor 'query_batch_qps').
+        """
+        retrieval_mode = self._resolve_retrieval_mode(retrieval_mode)
+        queries = list(queries)
+        self.tracer.observe('query_batch_size', len(queries))
+        start_time = time.perf_counter()
+        with self.tracer.span('query_batch', size=len(queries)):
+            results = self._query_batch(queries, top_k, batch_size, retrieval_mode)
+        elapsed = time.perf_counter() - start_time
+        qps = len(queries) / elapsed if elapsed > 0 else 0.0
+        self.last_batch_stats = {'queries': len(queries), 'seconds': elapsed, 'qps': qps}
+        self.tracer.observe('query_batch_qps', qps)
 
-        return answer, relevant_chunks
+        # Avaliar as respostas que têm resposta de referência
+        if reference_answers and self.inline_evaluation:
+            for (answer, _), reference_answer in zip(results, reference_answers):
+                if answer is not None and reference_answer:
+                    self._record_evaluation(self.evaluator.evaluate(answer, reference_answer))
+        return results
+
+    def _query_batch(self, queries, top_k, batch_size, retrieval_mode):
+        tracer = self.tracer
+        results = [None] * len(queries)
+
+        # Consultas idênticas a consultas anteriores não precisam de embeddings
+        cache = self.answer_cache
+        pending = []
+        for i, user_query in enumerate(queries):
+            cached = cache.get(user_query, top_k, retrieval_mode) if cache is not None else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+
+        query_embeddings = {}
+        to_search = []
+        if pending:
+            if retrieval_mode != 'sparse':
+                with tracer.span('query_batch.embed'):
+                    embeddings = self.embedder.generate_embeddings([queries[i] for i in pending])
+            else:
+                embeddings = [None] * len(pending)
+            for i, query_embedding in zip(pending, embeddings):
+                query_embeddings[i] = query_embedding
+                cached = cache.get_similar(query_embedding, top_k, retrieval_mode) if cache is not None else None
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    to_search.append(i)
+
+            # Busca em lote e geração das respostas das consultas restantes
+            to_generate = []
+            if to_search:
+                with tracer.span('query_batch.search', mode=retrieval_mode):
+                    candidates = self._candidate_top_k(top_k)
+                    if retrieval_mode != 'sparse':
+                        all_dense_matches = self.embedding_store.search_batch(
+                            [query_embeddings[i] for i in to_search],
+                            top_k=self._dense_top_k(retrieval_mode, candidates)
+                        )
+                    else:
+                        all_dense_matches = [None] * len(to_search)
+                    resolved = {}
+                    for i, dense_matches in zip(to_search, all_dense_matches):
+                        matches = self._combine_matches(retrieval_mode, queries[i], dense_matches, candidates)
+                        resolved[i] = self._resolve_chunks(matches)
+
+                # Re-ranking dos candidatos de todas as consultas em um único lote do cross-encoder
+                found = [i for i in to_search if resolved[i] is not None]
+                if self.reranker is not None and found:
+                    with tracer.span('query_batch.rerank', queries=len(found)):
+                        reranked = self.reranker.rerank_batch([queries[i] for i in found],
+                                                              [resolved[i][1] for i in found],
+                                                              [resolved[i][0] for i in found], top_k=top_k)
+                    for i, chunks in zip(found, reranked):
+                        resolved[i] = (resolved[i][0], chunks)
+
+                for i in to_search:
+                    relevant_chunks = None
+                    if resolved[i] is not None:
+                        relevant_chunks = self._assemble_context(queries[i], resolved[i][1])
+                    if relevant_chunks is None:
+                        results[i] = (None, None)
+                    else:
+                        results[i] = (None, relevant_chunks)
+                        to_generate.append(i)
+
+            with tracer.span('query_batch.generate', prompts=len(to_generate)):
+                answers = self.llm.generate_responses([self._build_prompt(queries[i], results[i][1])
+                                                       for i in to_generate], batch_size=batch_size)
+            for i, answer in zip(to_generate, answers):
+                results[i] = (answer, results[i][1])
+                if cache is not None:
+                    cache.put(queries[i], answer, results[i][1], query_embeddings[i], top_k, retrieval_mode)
+
+        if cache is not None:
+            tracer.count('answer_cache_hits', len(queries) - len(to_search))
+            tracer.count('answer_cache_misses', len(to_search))
+        return results
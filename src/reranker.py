@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from src.model_registry import get_model_registry
+
+
+def _load_cross_encoder(name, max_length=512):
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(name, max_length=max_length)
+
+
+class Reranker:
+    def __init__(self, model_name='cross-encoder/ms-marco-MiniLM-L-6-v2', batch_size=64, cache_size=10000,
+                 latency_budget_ms=None, max_length=512, model=None, model_registry=None):
+        """
+        Inicializa o re-ranking dos chunks recuperados com um cross-encoder local.
+
+        O cross-encoder lê a consulta e o chunk juntos, sendo bem mais preciso que a distância entre embeddings, mas
+        também mais caro; por isso ele só reordena um conjunto pequeno de candidatos já recuperados pela busca.
+        Os pares (consulta, chunk) ainda não pontuados são avaliados em um único lote (um forward pass para até
+        batch_size pares), e os scores ficam em um cache LRU, de modo que consultas repetidas não chamam o modelo.
+
+        Parâmetros:
+        - model_name: Nome do cross-encoder no Hugging Face.
+        - batch_size: Número máximo de pares por forward pass.
+        - cache_size: Número máximo de scores de pares armazenados (os usados há mais tempo são removidos primeiro).
+        - latency_budget_ms: Tempo máximo de espera pelos scores, em milissegundos. Se for excedido, a ordem original
+                             da busca é mantida (os scores calculados depois ainda entram no cache). Se None, sem limite.
+        - max_length: Número máximo de tokens de cada par (consulta + chunk).
+        - model: Modelo com o método predict(pares), opcional (por padrão, um CrossEncoder de model_name, carregado
+                 no primeiro re-ranking ou em warmup()).
+        - model_registry: ModelRegistry de onde o cross-encoder é obtido. Por padrão, o registro do processo.
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.latency_budget_ms = latency_budget_ms
+        self.max_length = max_length
+        self._model = model
+        self.model_registry = model_registry
+        self._model_handle = None
+
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()
+        # Uma única thread chama o modelo: os lotes são pontuados um de cada vez, e a espera na fila conta no orçamento
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timeouts = 0
+
+    @property
+    def model(self):
+        """
+        Cross-encoder, obtido do registro de modelos no primeiro uso (na thread do modelo ou em warmup).
+        """
+        if self._model is not None:
+            return self._model
+        with self._model_lock:
+            if self._model_handle is None:
+                registry = self.model_registry or get_model_registry()
+                self._model_handle = registry.acquire('cross-encoder', self.model_name, _load_cross_encoder,
+                                                      max_length=self.max_length)
+            return self._model_handle.model
+
+    def warmup(self, run_inference=True):
+        """
+        Carrega o cross-encoder e, com run_inference, pontua um par de teste, para que o primeiro re-ranking não
+        exceda o orçamento de latência por causa do carregamento.
+        """
+        model = self.model
+        if run_inference:
+            model.predict([("warmup", "warmup")], show_progress_bar=False)
+
+    def rerank(self, query, chunks, ids=None, top_k=None, with_ids=False):
+        """
+        Reordena os chunks de uma consulta do mais para o menos relevante segundo o cross-encoder.
+
+        Parâmetros:
+        - query: Texto da consulta.
+        - chunks: Textos dos chunks candidatos, na ordem da busca.
+        - ids: IDs dos chunks (chave do cache de scores), opcional; por padrão, o próprio texto.
+        - top_k: Número de chunks a serem retornados (por padrão, todos).
+        - with_ids: Se True, retorna tuplas (id, chunk) em vez dos textos.
+
+        Retorna:
+        - A lista dos top_k chunks reordenados (ou na ordem original, se o orçamento de latência for excedido).
+        """
+        return self.rerank_batch([query], [chunks], [ids] if ids is not None else None, top_k=top_k,
+                                 with_ids=with_ids)[0]
+
+    def rerank_batch(self, queries, chunk_lists, id_lists=None, top_k=None, with_ids=False):
+        """
+        Reordena os chunks de várias consultas, pontuando os pares de todas elas no mesmo lote.
+
+        Parâmetros:
+        - queries: Lista de consultas.
+        - chunk_lists: Lista com os chunks candidatos de cada consulta.
+        - id_lists: Lista com os IDs dos chunks de cada consulta, opcional.
+        - top_k: Número de chunks a serem retornados por consulta (por padrão, todos).
+        - with_ids: Se True, os chunks de cada consulta são retornados como tuplas (id, chunk).
+
+        Retorna:
+        - Uma lista com os chunks reordenados de cada consulta, na ordem das consultas.
+        """
+        start = time.perf_counter()
+        if id_lists is None:
+            id_lists = chunk_lists
+
+        keys = [[(query, chunk_id) for chunk_id in ids] for query, ids in zip(queries, id_lists)]
+        scores = {}
+        missing = {}
+        with self._lock:
+            for query, query_keys, chunks in zip(queries, keys, chunk_lists):
+                for key, chunk in zip(query_keys, chunks):
+                    if key in scores or key in missing:
+                        continue
+                    score = self._cache.get(key)
+                    if score is None:
+                        missing[key] = (query, chunk)
+                        self.cache_misses += 1
+                    else:
+                        self._cache.move_to_end(key)
+                        scores[key] = score
+                        self.cache_hits += 1
+
+        if missing:
+            future = self._executor.submit(self._score, list(missing), list(missing.values()))
+            timeout = None
+            if self.latency_budget_ms is not None:
+                timeout = max(0.0, self.latency_budget_ms / 1000 - (time.perf_counter() - start))
+            try:
+                scores.update(future.result(timeout=timeout))
+            except FutureTimeoutError:
+                # Manter a ordem da busca; o lote continua e seus scores ficam no cache para as próximas consultas
+                with self._lock:
+                    self.timeouts += 1
+                if with_ids:
+                    return [list(zip(ids, chunks))[:top_k] for ids, chunks in zip(id_lists, chunk_lists)]
+                return [list(chunks[:top_k]) for chunks in chunk_lists]
+
+        results = []
+        for query_keys, ids, chunks in zip(keys, id_lists, chunk_lists):
+            # sorted é estável: chunks com o mesmo score mantêm a ordem da busca
+            order = sorted(range(len(chunks)), key=lambda i: scores[query_keys[i]], reverse=True)[:top_k]
+            if with_ids:
+                results.append([(ids[i], chunks[i]) for i in order])
+            else:
+                results.append([chunks[i] for i in order])
+        return results
+
+    def _score(self, keys, pairs):
+        """
+        Pontua os pares com o cross-encoder e armazena os scores no cache.
+        """
+        values = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        scores = {key: float(value) for key, value in zip(keys, values)}
+        with self._lock:
+            for key, score in scores.items():
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scores
+
+    def stats(self):
+        """
+        Retorna as estatísticas do cache de scores e o número de vezes em que o orçamento de latência foi excedido.
+        """
+        with self._lock:
+            return {'cache_entries': len(self._cache), 'cache_hits': self.cache_hits,
+                    'cache_misses': self.cache_misses, 'timeouts': self.timeouts}
+
+    def close(self):
+        """
+        Encerra a thread do modelo (sem esperar os lotes em andamento) e devolve o cross-encoder ao registro.
+        """
+        self._executor.shutdown(wait=False)
+        with self._model_lock:
+            if self._model_handle is not None:
+                self._model_handle.release()
+                self._model_handle = None
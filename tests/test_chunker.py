@@ -0,0 +1,31 @@
+import pytest
+
+from src.chunker import Chunker
+
+LONG_SENTENCE = ("O relevo brasileiro é formado principalmente por planaltos, planícies e depressões, "
+                 "com altitudes modestas em comparação com outras regiões do continente.")
+
+
+def test_paragraph_longer_than_chunk_size_forms_its_own_chunk():
+    chunker = Chunker(method='paragraphs', chunk_size=50)
+    text = f"Curto.\n\n{LONG_SENTENCE}\n\nOutro."
+
+    assert chunker.chunk_text(text) == ["Curto.", LONG_SENTENCE, "Outro."]
+
+
+def test_sentence_longer_than_chunk_size_forms_its_own_chunk():
+    pytest.importorskip('nltk')
+    chunker = Chunker(method='sentences', chunk_size=50)
+
+    assert chunker.chunk_text(LONG_SENTENCE) == [LONG_SENTENCE]
+
+
+def test_block_without_paragraph_breaks_is_cut_at_whitespace():
+    chunker = Chunker(method='paragraphs', chunk_size=50, block_size=40)
+
+    blocks = list(chunker._iter_blocks([LONG_SENTENCE]))
+
+    assert len(blocks) > 1
+    assert all(len(block) <= 40 for block in blocks)
+    assert all(block.startswith(" ") for block in blocks[1:])
+    assert "".join(blocks) == LONG_SENTENCE